@@ -0,0 +1,340 @@
+"""Write-behind activity log.
+
+Write routes call :func:`record`, which only attaches the entry to the
+session. When the business transaction commits, the entries are appended to
+a local spool file (JSON lines, fsynced) *before* the database commit, and a
+background thread inserts them into ``activitylog`` in batches of up to
+``ACTIVITY_BATCH_SIZE`` or every ``ACTIVITY_FLUSH_INTERVAL`` seconds. A
+spool that cannot be written fails the commit: a committed write always has
+its entries on disk.
+
+The entries of a transaction carry a token, inserted into
+``activity_pending`` by the transaction itself. A batch only inserts the
+entries whose token is still there, and deletes it in the same transaction:
+the entries of a transaction rolled back after spooling (or interrupted by a
+crash) are dropped, and committed ones are written once.
+
+Each writer appends to its own stream ``<stream>.active`` under
+``ACTIVITY_SPOOL_DIR`` and holds a lock on it. A flush renames it to
+``<stream>.<seq>.batch`` and writes the batch together with ``seq`` in
+``activity_spool``. On startup the files of streams whose process is gone
+(no lock) are replayed, one process at a time.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, event, insert, update
+from sqlmodel import Session
+
+from . import versions
+from .blobstore import STORAGE_DIR
+from .models import ActivityEntity, ActivityLog, ActivityPending, ActivitySpool
+from .versions import bump_versions
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no advisory locks: a single process per spool directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_SPOOL_DIR = Path(os.getenv("ACTIVITY_SPOOL_DIR", str(STORAGE_DIR / "activity")))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "500"))
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "1"))
+ACTIVITY_SPOOL_FSYNC = os.getenv("ACTIVITY_SPOOL_FSYNC", "1") != "0"
+
+SESSION_KEY = "activity"
+WRITER_THREAD = "activity-writer"
+RECOVERY_LOCK = "recover.lock"
+
+
+def record(
+    session: Session,
+    entity_type: ActivityEntity,
+    entity_id: int,
+    action: str,
+    payload: Optional[str] = None,
+    actor_user_id: int = 0,
+) -> None:
+    """Log ``action`` once the transaction of ``session`` commits (``payload`` is JSON)."""
+    session.info.setdefault(SESSION_KEY, []).append(
+        {
+            "entity_type": entity_type.value,
+            "entity_id": entity_id,
+            "action": action,
+            "actor_user_id": actor_user_id,
+            "at": datetime.utcnow().isoformat(),
+            "payload_json": payload,
+        }
+    )
+
+
+def _lock(handle: IO[Any]) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def _exclusive(path: Path) -> Iterator[None]:
+    """Hold a blocking exclusive lock on ``path`` (created if needed)."""
+    with path.open("ab") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _read_entries(path: Path) -> List[Dict[str, Any]]:
+    entries = []
+    with path.open("rb") as handle:
+        for line in handle:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Torn last line of a crash: its transaction was committed but
+                # the entry never reached the disk in full.
+                logger.warning("Entrée d'activité illisible ignorée dans %s", path)
+    return entries
+
+
+def _row(entry: Dict[str, Any]) -> Dict[str, Any]:
+    row = {key: value for key, value in entry.items() if key != "token"}
+    return {
+        **row,
+        "entity_type": ActivityEntity(entry["entity_type"]),
+        "at": datetime.fromisoformat(entry["at"]),
+    }
+
+
+def write_batch(session: Session, stream: str, seq: int, entries: List[Dict[str, Any]]) -> Optional[int]:
+    """Insert the committed entries of a spooled batch. Commits; returns their number, None if skipped."""
+    tokens = {entry["token"] for entry in entries if "token" in entry}
+    # The delete comes first: it waits for a transaction still committing
+    # the tokens it spooled, then claims those that committed.
+    claimed = set()
+    if tokens:
+        claimed = set(
+            session.execute(
+                delete(ActivityPending).where(ActivityPending.token.in_(tokens)).returning(ActivityPending.token)
+            ).scalars()
+        )
+    done = session.get(ActivitySpool, stream)
+    if done is not None and done.last_batch >= seq:
+        session.rollback()
+        return None
+    # Entries spooled before the tokens existed were only spooled once committed.
+    rows = [_row(entry) for entry in entries if entry.get("token", None) is None or entry["token"] in claimed]
+    if rows:
+        session.execute(insert(ActivityLog), rows)
+        bump_versions(session, versions.ACTIVITY)
+    if done is None:
+        session.execute(insert(ActivitySpool).values(stream=stream, last_batch=seq))
+    else:
+        session.execute(update(ActivitySpool).where(ActivitySpool.stream == stream).values(last_batch=seq))
+    session.commit()
+    return len(rows)
+
+
+class ActivityWriter:
+    def __init__(
+        self,
+        directory: Path = ACTIVITY_SPOOL_DIR,
+        batch_size: int = ACTIVITY_BATCH_SIZE,
+        interval: float = ACTIVITY_FLUSH_INTERVAL,
+        fsync: bool = ACTIVITY_SPOOL_FSYNC,
+    ) -> None:
+        self.directory = directory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stream: Optional[str] = None
+        self._file: Optional[IO[bytes]] = None
+        self._seq = 0
+        self._pending = 0
+        self._unwritten: List[Tuple[int, IO[bytes]]] = []
+
+    def _path(self, stream: str, seq: Optional[int] = None) -> Path:
+        return self.directory / (f"{stream}.active" if seq is None else f"{stream}.{seq}.batch")
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._stream is None:
+            self._stream = uuid.uuid4().hex
+        self._file = self._path(self._stream).open("ab")
+        _lock(self._file)
+
+    def enqueue(self, entries: List[Dict[str, Any]]) -> None:
+        """Append the entries of a committing transaction to the spool."""
+        data = b"".join(json.dumps(entry, ensure_ascii=False).encode() + b"\n" for entry in entries)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending += len(entries)
+            if self._pending >= self.batch_size:
+                self._wake.set()
+
+    def _rotate(self, reopen: bool) -> None:
+        with self._lock:
+            if self._file is None or self._pending == 0:
+                return
+            self._seq += 1
+            # The old handle keeps the lock on the renamed file until it is written.
+            self._path(self._stream).rename(self._path(self._stream, self._seq))
+            self._unwritten.append((self._seq, self._file))
+            self._file, self._pending = None, 0
+            if reopen:
+                self._open()
+
+    def flush(self, reopen: bool = True) -> None:
+        """Write the spooled entries to the database now.
+
+        Batches are written in order: a failed one is retried before the
+        next, since a later batch marks every earlier one as written.
+        """
+        from .database import session_scope
+
+        with self._flush_lock:
+            self._rotate(reopen)
+            while self._unwritten:
+                seq, handle = self._unwritten[0]
+                path = self._path(self._stream, seq)
+                with session_scope() as session:
+                    write_batch(session, self._stream, seq, _read_entries(path))
+                path.unlink()
+                handle.close()
+                self._unwritten.pop(0)
+
+    def recover(self) -> int:
+        """Write the batches left by writers that are no longer running. Returns the number of entries.
+
+        Processes starting together recover one after the other: the second
+        one only sees what the first left.
+        """
+        if not self.directory.is_dir():
+            return 0
+        with _exclusive(self.directory / RECOVERY_LOCK):
+            return self._recover()
+
+    def _recover(self) -> int:
+        streams: Dict[str, List[Path]] = {}
+        for path in self.directory.iterdir():
+            stream = path.name.split(".", 1)[0]
+            if stream != self._stream and path.suffix in {".active", ".batch"}:
+                streams.setdefault(stream, []).append(path)
+        recovered = 0
+        for stream, paths in streams.items():
+            handles = []
+            try:
+                for path in paths:
+                    handle = path.open("rb")
+                    handles.append(handle)
+                    if not _lock(handle):
+                        break
+                else:
+                    recovered += self._recover_stream(stream, paths)
+            except FileNotFoundError:
+                # Renamed or removed meanwhile: the stream is alive or recovered elsewhere.
+                continue
+            finally:
+                for handle in handles:
+                    handle.close()
+        return recovered
+
+    def _recover_stream(self, stream: str, paths: List[Path]) -> int:
+        from .database import session_scope
+
+        batches = sorted((int(path.name.split(".")[1]), path) for path in paths if path.suffix == ".batch")
+        recovered = 0
+        with session_scope() as session:
+            done = session.get(ActivitySpool, stream)
+            last = max([done.last_batch if done else 0] + [seq for seq, _ in batches])
+            active = self._path(stream)
+            if active in paths:
+                batches.append((last + 1, active))
+            for seq, path in batches:
+                recovered += write_batch(session, stream, seq, _read_entries(path)) or 0
+                path.unlink()
+        return recovered
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # The batch stays on disk and is retried by the next flush.
+                logger.exception("Échec de l'écriture du journal d'activité")
+
+    def start(self) -> None:
+        """Replay orphan spool files and start the flush thread."""
+        if self._thread is not None:
+            return
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("Échec de la reprise du journal d'activité")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=WRITER_THREAD, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write what is left."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush(reopen=False)
+        except Exception:
+            # Left in the spool: replayed by the next start of the application.
+            logger.exception("Échec de l'écriture du journal d'activité à l'arrêt")
+        if self._file is not None and self._pending == 0:
+            self._file.close()
+            self._path(self._stream).unlink(missing_ok=True)
+            self._file = None
+
+
+writer = ActivityWriter()
+
+
+@event.listens_for(Session, "before_commit")
+def _spool_committing(session: Session) -> None:
+    entries = session.info.get(SESSION_KEY)
+    if not entries:
+        return
+    token = uuid.uuid4().hex
+    session.execute(insert(ActivityPending).values(token=token))
+    # An error here (disk full, spool unwritable) fails the commit instead of
+    # losing the entries of a committed transaction.
+    writer.enqueue([{**entry, "token": token} for entry in entries])
+    session.info.pop(SESSION_KEY)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session) -> None:
+    session.info.pop(SESSION_KEY, None)
@@ -0,0 +1,219 @@
+"""Persisted alerts.
+
+Low-stock alerts are opened and resolved by :func:`sync_stock_alerts`, which
+the stock counters call whenever the in-stock count of an item moves, in the
+same transaction as the write. Expired warranties are picked up once a day by
+:func:`sweep_warranties` (see :mod:`app.jobs`), which only looks at serials
+whose warranty ended since the previous sweep; a backdated delivery whose
+warranties already ended gets its alerts from
+:func:`open_delivery_warranty_alerts`, in the delivery transaction, since the
+sweep will never look that far back again. Reading alerts therefore costs
+O(open alerts) instead of a scan of every item and serial.
+``python -m app.alerts refresh`` re-evaluates every item and serial.
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import exists, insert, literal, update
+from sqlmodel import Session, func, select
+
+from . import versions
+from .models import Alert, AlertKind, Item, ItemStock, Serial, SerialStatus
+from .versions import bump_versions
+
+
+ALERT_BATCH_SIZE = 1000
+
+
+def _in_stock():
+    return func.coalesce(ItemStock.count, 0)
+
+
+def sync_stock_alerts(session: Session, item_ids: Iterable[int]) -> None:
+    """Open or resolve the low-stock alerts of ``item_ids`` from their counters.
+
+    Stock only moves with the items or serials versions, which the alert
+    readers depend on: the alerts version is left to acknowledgements and
+    sweeps.
+    """
+    ids = sorted(set(item_ids))
+    now = datetime.utcnow()
+    opened: List[Dict[str, Any]] = []
+    resolved: List[int] = []
+    for start in range(0, len(ids), ALERT_BATCH_SIZE):
+        rows = session.exec(
+            select(Item.id, Item.low_stock_threshold, _in_stock(), Alert.id)
+            .outerjoin(ItemStock, (ItemStock.item_id == Item.id) & (ItemStock.status == SerialStatus.IN_STOCK))
+            .outerjoin(
+                Alert, (Alert.item_id == Item.id) & (Alert.kind == AlertKind.LOW_STOCK) & Alert.resolved_at.is_(None)
+            )
+            .where(Item.id.in_(ids[start : start + ALERT_BATCH_SIZE]))
+        ).all()
+        for item_id, threshold, stock, alert_id in rows:
+            low = bool(threshold) and stock <= threshold
+            if low and alert_id is None:
+                opened.append({"kind": AlertKind.LOW_STOCK, "item_id": item_id, "opened_at": now})
+            elif not low and alert_id is not None:
+                resolved.append(alert_id)
+    if opened:
+        session.execute(insert(Alert), opened)
+    if resolved:
+        session.execute(update(Alert).where(Alert.id.in_(resolved)).values(resolved_at=now))
+
+
+def _open_warranty_alerts(session: Session, today: date, *conditions: Any) -> int:
+    now = datetime.utcnow()
+    already_alerted = exists().where(Alert.serial_id == Serial.id, Alert.kind == AlertKind.WARRANTY_EXPIRED)
+    query = select(
+        literal(AlertKind.WARRANTY_EXPIRED, Alert.__table__.c.kind.type), Serial.item_id, Serial.id, literal(now)
+    ).where(Serial.warranty_end < today, Serial.status != SerialStatus.RETIRED, ~already_alerted, *conditions)
+    return session.execute(insert(Alert).from_select(["kind", "item_id", "serial_id", "opened_at"], query)).rowcount
+
+
+def sweep_warranties(session: Session, today: date, since: Optional[date] = None) -> int:
+    """Open an alert for serials whose warranty ended in ``[since, today)``.
+
+    Without ``since`` every past warranty is considered. A serial never gets
+    a second warranty alert; open ones are resolved once the serial is
+    retired. Returns the number of alerts opened.
+    """
+    now = datetime.utcnow()
+    conditions = [Serial.warranty_end >= since] if since is not None else []
+    opened = _open_warranty_alerts(session, today, *conditions)
+    retired = exists().where(Serial.id == Alert.serial_id, Serial.status == SerialStatus.RETIRED)
+    resolved = session.execute(
+        update(Alert)
+        .where(Alert.kind == AlertKind.WARRANTY_EXPIRED, Alert.resolved_at.is_(None), retired)
+        .values(resolved_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if opened or resolved:
+        bump_versions(session, versions.ALERTS)
+    return opened
+
+
+def open_delivery_warranty_alerts(session: Session, delivery_id: int, warranty_end: date, today: date) -> int:
+    """Open the alerts of a delivery whose serials' warranty ended before ``today`` (does not commit).
+
+    The serials of a delivery share ``warranty_end``, which also narrows the
+    lookup to the ``serial.warranty_end`` index. Returns the number of alerts
+    opened.
+    """
+    if warranty_end >= today:
+        return 0
+    session.flush()
+    opened = _open_warranty_alerts(
+        session, today, Serial.warranty_end == warranty_end, Serial.delivery_id == delivery_id
+    )
+    if opened:
+        bump_versions(session, versions.ALERTS)
+    return opened
+
+
+def resolve_serial_alerts(session: Session, serial_id: int) -> bool:
+    """Resolve the open warranty alert of a retired serial (does not commit)."""
+    result = session.execute(
+        update(Alert)
+        .where(Alert.serial_id == serial_id, Alert.kind == AlertKind.WARRANTY_EXPIRED, Alert.resolved_at.is_(None))
+        .values(resolved_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def daily_sweep(session: Session, today: date, previous: Optional[date]) -> None:
+    """Daily job: the first run on a database also evaluates every item."""
+    if previous is None:
+        sync_stock_alerts(session, session.exec(select(Item.id)).all())
+    sweep_warranties(session, today, previous)
+
+
+def refresh_alerts(session: Session, today: date) -> None:
+    """Re-evaluate every item and serial (does not commit)."""
+    daily_sweep(session, today, None)
+
+
+def alert_columns() -> List[Any]:
+    """Columns of :class:`app.schemas.AlertRead`, joined from the item, serial and stock."""
+    return [
+        Alert.id,
+        Alert.kind,
+        Alert.item_id,
+        Item.name.label("item_name"),
+        _in_stock().label("stock"),
+        Alert.serial_id,
+        Serial.serial_number,
+        Serial.warranty_end,
+        Alert.opened_at,
+        Alert.acknowledged_at,
+        Alert.resolved_at,
+    ]
+
+
+def alert_query(*conditions: Any):
+    return (
+        select(*alert_columns())
+        .join(Item, Item.id == Alert.item_id)
+        .outerjoin(Serial, Serial.id == Alert.serial_id)
+        .outerjoin(ItemStock, (ItemStock.item_id == Alert.item_id) & (ItemStock.status == SerialStatus.IN_STOCK))
+        .where(*conditions)
+    )
+
+
+def summary(session: Session, limit: int) -> Dict[str, Any]:
+    """Open alert counts per kind and the ``limit`` newest unacknowledged ones."""
+    counts = dict.fromkeys((kind.value for kind in AlertKind), 0)
+    for kind, count in session.exec(
+        select(Alert.kind, func.count(Alert.id)).where(Alert.resolved_at.is_(None)).group_by(Alert.kind)
+    ).all():
+        counts[kind.value] = count
+    rows = session.exec(
+        alert_query(Alert.resolved_at.is_(None), Alert.acknowledged_at.is_(None))
+        .order_by(Alert.opened_at.desc(), Alert.id.desc())
+        .limit(limit)
+    ).all()
+    alerts = []
+    for row in rows:
+        if row.kind == AlertKind.LOW_STOCK:
+            alerts.append({"id": row.id, "type": "stock", "item": row.item_name, "stock": row.stock})
+        else:
+            ended = row.warranty_end.isoformat() if row.warranty_end else None
+            alerts.append({"id": row.id, "type": "warranty", "serial": row.serial_number, "ended": ended})
+    return {"count": sum(counts.values()), "counts": counts, "alerts": alerts}
+
+
+def acknowledge(session: Session, alert_id: int) -> bool:
+    """Mark an alert as acknowledged (does not commit). False if it does not exist."""
+    result = session.execute(
+        update(Alert)
+        .where(Alert.id == alert_id)
+        .values(acknowledged_at=func.coalesce(Alert.acknowledged_at, datetime.utcnow()))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        return False
+    bump_versions(session, versions.ALERTS)
+    return True
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if argv != ["refresh"]:
+        print("usage: python -m app.alerts refresh", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        refresh_alerts(session, date.today())
+        session.commit()
+        open_alerts = session.exec(select(func.count(Alert.id)).where(Alert.resolved_at.is_(None))).one()
+    print(f"{open_alerts} alerte(s) ouverte(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,116 @@
+"""Content-addressed attachment store on the local disk.
+
+Blobs are stored once per SHA-256 digest under ``STORAGE_DIR`` with two
+levels of fan-out directories (``ab/cd/abcd…``). The ``blobs`` table counts
+the ``files`` rows pointing at each digest; the bytes are removed from disk
+after the last reference goes away.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import delete, insert, update
+from sqlmodel import Session, select
+
+from .models import Blob
+
+
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "./storage"))
+READ_SIZE = 256 * 1024
+
+
+def blob_path(sha256: str) -> Path:
+    return STORAGE_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+class BlobWriter:
+    """Temporary file collecting a blob while computing its digest."""
+
+    def __init__(self) -> None:
+        tmp_dir = STORAGE_DIR / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False)
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._digest.update(data)
+        self.size += len(data)
+
+    def discard(self) -> None:
+        self._file.close()
+        Path(self._file.name).unlink(missing_ok=True)
+
+    def commit(self, session: Session) -> str:
+        """Add a reference to the written blob, moving it into place if it is new."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        sha256 = self.sha256
+        result = session.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount + 1))
+        if result.rowcount and blob_path(sha256).exists():
+            Path(self._file.name).unlink(missing_ok=True)
+            return sha256
+        target = blob_path(sha256)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._file.name, target)
+        if not result.rowcount:
+            session.execute(insert(Blob).values(sha256=sha256, size=self.size, refcount=1))
+        return sha256
+
+
+def release_blob(session: Session, sha256: str) -> bool:
+    """Drop one reference to ``sha256``. Returns ``True`` when it was the last one.
+
+    The row stays with ``refcount = 0`` and the bytes stay on disk: a
+    rollback never loses content, and :func:`collect_blob` removes both once
+    the transaction is committed.
+    """
+    session.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount - 1))
+    refcount = session.exec(select(Blob.refcount).where(Blob.sha256 == sha256)).first()
+    return refcount is not None and refcount <= 0
+
+
+def collect_blob(session: Session, sha256: str) -> None:
+    """Remove ``sha256`` from the store if it is still unreferenced.
+
+    The row is deleted and the file unlinked inside one write transaction: an
+    upload of the same content has to update that row before moving its copy
+    into place, so it either revives the blob first (nothing is deleted) or
+    waits for this commit and writes the file again.
+    """
+    result = session.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.refcount <= 0))
+    if result.rowcount:
+        blob_path(sha256).unlink(missing_ok=True)
+    session.commit()
+
+
+def collect_orphans(session: Session) -> int:
+    """Collect every unreferenced blob (left behind by an interrupted delete)."""
+    digests = session.exec(select(Blob.sha256).where(Blob.refcount <= 0)).all()
+    for sha256 in digests:
+        collect_blob(session, sha256)
+    return len(digests)
+
+
+def iter_blob(sha256: str, start: int, end: int) -> Iterator[bytes]:
+    """Yield bytes ``start`` to ``end`` (inclusive) of a blob."""
+    remaining = end - start + 1
+    with blob_path(sha256).open("rb") as handle:
+        handle.seek(start)
+        while remaining > 0:
+            data = handle.read(min(READ_SIZE, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
@@ -0,0 +1,44 @@
+"""Additive counter tables.
+
+The materialized counters (``item_stock``, ``warranty_bucket``, the report
+rollups) hold one ``count`` per key; the write routes add deltas to them in
+the same transaction as the rows they count.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Sequence
+
+from sqlalchemy import insert, update
+from sqlmodel import Session
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def add_to_counters(session: Session, model: Any, keys: Sequence[str], rows: List[dict]) -> None:
+    """Add each ``row["count"]`` to the ``model`` counter identified by ``keys``, creating missing ones.
+
+    Written with one upsert statement per ``UPSERT_BATCH_SIZE`` rows where the
+    dialect supports it, one update (and insert) per row otherwise.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        for row in rows:
+            result = session.execute(
+                update(model).where(*(getattr(model, key) == row[key] for key in keys)).values(count=model.count + row["count"])
+            )
+            if result.rowcount == 0:
+                session.execute(insert(model).values(**row))
+        return
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        statement = upsert(model).values(rows[start : start + UPSERT_BATCH_SIZE])
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[getattr(model, key) for key in keys],
+                set_={"count": model.count + statement.excluded["count"]},
+            )
+        )
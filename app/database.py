@@ -1,26 +1,146 @@
 from __future__ import annotations
 
 import os
-from contextlib import contextmanager
-from typing import Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Tuple
 
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+
+from .migrations import run_migrations
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./stocky.db")
 
+# Async drivers used for the async engine when ASYNC_DATABASE_URL is not set.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+# "production" enables WAL and the read/write split on SQLite files,
+# "default" keeps a single engine with the driver defaults.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+READ_POOL_SIZE = int(os.getenv("DATABASE_READ_POOL_SIZE", "8"))
+WRITE_POOL_TIMEOUT = float(os.getenv("DATABASE_WRITE_TIMEOUT", "30"))
+
+# Set on every connection of the production profile. The page cache is per
+# connection (negative values are KiB); the memory map is shared.
+SQLITE_PRAGMAS = {
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "synchronous": "NORMAL",
+    "cache_size": -32768,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+SQLITE_READ_PRAGMAS = {**SQLITE_PRAGMAS, "query_only": "ON"}
+SQLITE_WRITE_PRAGMAS = {"journal_mode": "WAL", **SQLITE_PRAGMAS}
 
-def _connect_args() -> dict:
-    if DATABASE_URL.startswith("sqlite"):
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def _connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
         return {"check_same_thread": False}
     return {}
 
 
-engine = create_engine(DATABASE_URL, echo=False, connect_args=_connect_args())
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"Pas de pilote asynchrone connu pour {parsed.get_backend_name()} : définissez ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def _production_sqlite(url: str) -> bool:
+    # In-memory databases are private to a connection: they cannot be split.
+    parsed = make_url(url)
+    return (
+        SQLITE_PROFILE == "production"
+        and parsed.get_backend_name() == "sqlite"
+        and parsed.database not in (None, "", ":memory:")
+        and parsed.query.get("mode") != "memory"
+    )
+
+
+def _apply_pragmas(dbapi_connection, pragmas: dict) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def _sqlite_engine(url: str, *, read_only: bool) -> Engine:
+    if read_only:
+        pool = {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE}
+        pragmas, begin = SQLITE_READ_PRAGMAS, "BEGIN"
+    else:
+        # One connection: writers of this process queue on the pool instead
+        # of failing with "database is locked".
+        pool = {"pool_size": 1, "max_overflow": 0, "pool_timeout": WRITE_POOL_TIMEOUT}
+        pragmas, begin = SQLITE_WRITE_PRAGMAS, "BEGIN IMMEDIATE"
+    sqlite_engine = create_engine(url, echo=False, connect_args=_connect_args(url), **pool)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record) -> None:
+        _apply_pragmas(dbapi_connection, pragmas)
+        # pysqlite would only open the transaction before the first write.
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sqlite_engine, "begin")
+    def _on_begin(connection) -> None:
+        # Readers get one snapshot per session; the writer takes the write
+        # lock up front so it never has to upgrade (and fail) mid-transaction.
+        connection.exec_driver_sql(begin)
+
+    return sqlite_engine
+
+
+def create_engines(url: str) -> Tuple[Engine, Engine]:
+    """Return the ``(write, read)`` engines for ``url``.
+
+    With the production SQLite profile the database runs in WAL mode: reads
+    use a pool of ``query_only`` connections that never wait for the writer,
+    and writes go through a single connection taking the lock at ``BEGIN``.
+    Otherwise both engines are the same object.
+    """
+    if not _production_sqlite(url):
+        shared = create_engine(url, echo=False, connect_args=_connect_args(url))
+        return shared, shared
+    # The journal mode is stored in the file: readers follow once the writer
+    # has switched it to WAL on its first connection.
+    return _sqlite_engine(url, read_only=False), _sqlite_engine(url, read_only=True)
+
+
+def create_async_read_engine(url: str) -> AsyncEngine:
+    """Async engine of the read routes, with the reader pragmas on SQLite."""
+    if not _production_sqlite(url):
+        return create_async_engine(url, echo=False)
+    # aiosqlite defaults to NullPool: one connection and thread per session.
+    read_engine = create_async_engine(
+        url, echo=False, poolclass=AsyncAdaptedQueuePool, pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE
+    )
+
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record) -> None:
+        _apply_pragmas(dbapi_connection, SQLITE_READ_PRAGMAS)
+
+    return read_engine
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+engine, read_engine = create_engines(DATABASE_URL)
+async_engine = create_async_read_engine(ASYNC_DATABASE_URL)
 
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 
 @contextmanager
@@ -29,6 +149,44 @@ def session_scope() -> Iterator[Session]:
         yield session
 
 
-def get_session() -> Iterator[Session]:
-    with Session(engine) as session:
+@contextmanager
+def read_session_scope() -> Iterator[Session]:
+    with Session(read_engine) as session:
+        yield session
+
+
+def get_session(request: Request) -> Iterator[Session]:
+    """Session of the request: read-only for safe methods, the writer otherwise."""
+    with Session(read_engine if request.method in READ_METHODS else engine) as session:
+        yield session
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Session of the async engine, for read routes served on the event loop.
+
+    Query code written for :class:`Session` runs unchanged through
+    ``await session.run_sync(function, *args)``.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
+
+
+async def connect_async_engine() -> None:
+    """Open the first async connection before requests run concurrently.
+
+    SQLAlchemy runs the first-connect hooks of a pool under a thread lock:
+    coroutines racing through them on the event loop thread would deadlock.
+    """
+    async with async_engine.connect():
+        pass
+
+
+async def dispose_async_engine() -> None:
+    # Pooled async connections belong to the event loop that opened them.
+    await async_engine.dispose()
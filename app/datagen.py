@@ -0,0 +1,363 @@
+"""Synthetic dataset generator.
+
+Fills an empty database with a realistic, reproducible inventory of any
+size using batched bulk inserts, then builds the derived tables (stock
+counters, search index). Example::
+
+    python -m app.datagen --database-url sqlite:///./large.db --preset large
+    python -m app.datagen --items 50000 --serials 5000000 --assignments 1000000 \\
+        --activity 10000000 --attachments 1000 --attachment-size 200000 --seed 7
+
+The same seed and reference date always produce the same rows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, SQLModel, create_engine
+
+from . import versions
+from .blobstore import BlobWriter
+from .files import CHUNK_SIZE, STORAGE_DISK
+from .migrations import run_migrations
+from .models import (
+    ActivityEntity,
+    ActivityLog,
+    Assignment,
+    Delivery,
+    Item,
+    Order,
+    OrderLine,
+    OrderStatus,
+    Role,
+    Serial,
+    SerialStatus,
+    StoredFile,
+    Supplier,
+    User,
+)
+from .rollups import rebuild_rollups
+from .search import rebuild_search_index
+from .stock import rebuild_stock_counters
+from .warranties import rebuild_warranty_calendar
+from .versions import bump_versions
+
+CATEGORIES = ["PC Portable", "Écran", "Dock", "Smartphone", "Tablette", "Casque", "Clavier", "Souris", "Imprimante", "Serveur"]
+SITES = ["Paris", "Lyon", "Marseille", "Lille", "Nantes", "Bordeaux", "Toulouse"]
+DEPARTMENTS = ["Finance", "RH", "IT", "Ventes", "Marketing", "Juridique", "Achats", "Support", "R&D", "Direction"]
+BRANDS = ["Dell", "HP", "Lenovo", "Apple", "Samsung", "Logitech", "Jabra", "Brother", "Asus", "Acer"]
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    users: int
+    suppliers: int
+    items: int
+    orders: int
+    serials: int
+    assignments: int
+    activity: int
+    attachments: int = 0
+    attachment_size: int = 64 * 1024
+
+
+PRESETS: Dict[str, DatasetSize] = {
+    "small": DatasetSize(users=50, suppliers=10, items=200, orders=500, serials=5_000, assignments=2_000, activity=10_000),
+    "medium": DatasetSize(users=500, suppliers=50, items=5_000, orders=20_000, serials=200_000, assignments=80_000, activity=400_000),
+    "large": DatasetSize(users=5_000, suppliers=200, items=50_000, orders=200_000, serials=5_000_000, assignments=1_000_000, activity=10_000_000),
+}
+
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch: List[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Generator:
+    def __init__(self, engine: Engine, size: DatasetSize, *, seed: int, today: date, batch_size: int, log: Callable[[str], None]) -> None:
+        self.engine = engine
+        self.size = size
+        self.rng = random.Random(seed)
+        self.today = today
+        self.batch_size = batch_size
+        self.log = log
+
+    def _load(self, connection: Connection, model: type[SQLModel], rows: Iterator[dict]) -> None:
+        started = time.monotonic()
+        statement = insert(model.__table__)
+        total = 0
+        for batch in _batches(rows, self.batch_size):
+            connection.execute(statement, batch)
+            total += len(batch)
+        self.log(f"{model.__tablename__}: {total} lignes en {time.monotonic() - started:.1f}s")
+
+    def _users(self) -> Iterator[dict]:
+        roles = [Role.VIEWER] * 8 + [Role.BUYER, Role.STOREKEEPER]
+        for user_id in range(1, self.size.users + 1):
+            yield {
+                "id": user_id,
+                "display_name": f"Utilisateur {user_id}",
+                "email": f"user{user_id}@example.com",
+                "department": self.rng.choice(DEPARTMENTS),
+                "site": self.rng.choice(SITES),
+                "role": Role.ADMIN if user_id == 1 else self.rng.choice(roles),
+            }
+
+    def _suppliers(self) -> Iterator[dict]:
+        for supplier_id in range(1, self.size.suppliers + 1):
+            yield {"id": supplier_id, "name": f"{self.rng.choice(BRANDS)} Distribution {supplier_id}", "contact": f"Contact {supplier_id}"}
+
+    def _items(self) -> Iterator[dict]:
+        self.item_prices: List[float] = []
+        for item_id in range(1, self.size.items + 1):
+            price = round(self.rng.uniform(15, 3000), 2)
+            self.item_prices.append(price)
+            yield {
+                "id": item_id,
+                "name": f"{self.rng.choice(BRANDS)} {self.rng.choice(CATEGORIES)} {item_id}",
+                "category": self.rng.choice(CATEGORIES),
+                "internal_ref": f"ITM-{item_id:06d}",
+                "default_supplier_id": self.rng.randint(1, self.size.suppliers),
+                "default_unit_price": price,
+                "site": self.rng.choice(SITES),
+                "low_stock_threshold": self.rng.choice([None, None, 1, 2, 5, 10]),
+            }
+
+    def _orders(self) -> Iterator[dict]:
+        statuses = [OrderStatus.DELIVERED] * 7 + [OrderStatus.SENT_TO_SUPPLIER, OrderStatus.INTERNAL_APPROVAL, OrderStatus.REQUESTED]
+        for order_id in range(1, self.size.orders + 1):
+            ordered_at = datetime.combine(self.today, datetime.min.time()) - timedelta(minutes=self.rng.randint(0, 3 * 365 * 24 * 60))
+            yield {
+                "id": order_id,
+                "supplier_id": self.rng.randint(1, self.size.suppliers),
+                "internal_ref": f"CMD-{order_id:07d}",
+                "status": self.rng.choice(statuses),
+                "ordered_at": ordered_at,
+                "expected_delivery_at": (ordered_at + timedelta(days=self.rng.randint(3, 30))).date(),
+            }
+
+    def _order_lines(self) -> Iterator[dict]:
+        for order_id in range(1, self.size.orders + 1):
+            for _ in range(self.rng.randint(1, 4)):
+                item_id = self.rng.randint(1, self.size.items)
+                yield {
+                    "order_id": order_id,
+                    "item_id": item_id,
+                    "qty": self.rng.randint(1, 20),
+                    "unit_price": self.item_prices[item_id - 1],
+                }
+
+    def _deliveries(self) -> Iterator[dict]:
+        # One delivery per order; serials are spread over them.
+        for order_id in range(1, self.size.orders + 1):
+            yield {
+                "id": order_id,
+                "order_id": order_id,
+                "delivery_note_ref": f"BL-{order_id:07d}",
+                "delivered_at": self.today - timedelta(days=self.rng.randint(0, 3 * 365)),
+            }
+
+    def _serials(self) -> Iterator[dict]:
+        active = self._active_assignments()
+        self.active_assignees: Dict[int, int] = {}
+        for serial_id in range(1, self.size.serials + 1):
+            item_id = self.rng.randint(1, self.size.items)
+            delivered = self.today - timedelta(days=self.rng.randint(0, 5 * 365))
+            status = SerialStatus.IN_STOCK
+            assignee: Optional[int] = None
+            if serial_id <= active:
+                status = SerialStatus.ASSIGNED
+                assignee = self.rng.randint(1, self.size.users)
+                self.active_assignees[serial_id] = assignee
+            elif self.rng.random() < 0.05:
+                status = self.rng.choice([SerialStatus.IN_REPAIR, SerialStatus.RETIRED])
+            yield {
+                "id": serial_id,
+                "item_id": item_id,
+                "serial_number": f"SN{serial_id:09d}",
+                "delivery_id": self.rng.randint(1, self.size.orders) if self.size.orders else None,
+                "delivery_date": delivered,
+                "warranty_start": delivered,
+                "warranty_end": delivered + timedelta(days=self.rng.choice([365, 730, 1095])),
+                "supplier_id": self.rng.randint(1, self.size.suppliers),
+                "purchase_price": self.item_prices[item_id - 1],
+                "status": status,
+                "current_assignee_user_id": assignee,
+            }
+
+    def _active_assignments(self) -> int:
+        return min(self.size.serials, self.size.assignments // 3)
+
+    def _assignments(self) -> Iterator[dict]:
+        active = self._active_assignments()
+        for assignment_id in range(1, self.size.assignments + 1):
+            start = self.today - timedelta(days=self.rng.randint(0, 3 * 365))
+            if assignment_id <= active:
+                serial_id = assignment_id
+                user_id = self.active_assignees[serial_id]
+                end = None
+            else:
+                serial_id = self.rng.randint(1, self.size.serials)
+                user_id = self.rng.randint(1, self.size.users)
+                end = min(start + timedelta(days=self.rng.randint(1, 400)), self.today)
+            yield {
+                "id": assignment_id,
+                "serial_id": serial_id,
+                "assignee_user_id": user_id,
+                "start_date": start,
+                "expected_return_date": start + timedelta(days=365),
+                "end_date": end,
+            }
+
+    def _activity(self) -> Iterator[dict]:
+        kinds = [
+            (ActivityEntity.ORDER, "create", self.size.orders),
+            (ActivityEntity.ORDER, "status", self.size.orders),
+            (ActivityEntity.ORDER, "delivery", self.size.orders),
+            (ActivityEntity.ASSIGNMENT, "assign", self.size.serials),
+            (ActivityEntity.ASSIGNMENT, "return", self.size.serials),
+        ]
+        kinds = [kind for kind in kinds if kind[2]]
+        start = datetime.combine(self.today, datetime.min.time()) - timedelta(days=3 * 365)
+        step = (3 * 365 * 24 * 3600) / max(self.size.activity, 1)
+        for index in range(self.size.activity):
+            entity_type, action, upper = self.rng.choice(kinds)
+            yield {
+                "entity_type": entity_type,
+                "entity_id": self.rng.randint(1, upper),
+                "action": action,
+                "actor_user_id": self.rng.randint(1, self.size.users),
+                "at": start + timedelta(seconds=index * step),
+                "payload_json": "{}",
+            }
+
+    def _attachments(self, session: Session) -> None:
+        if not self.size.attachments or not self.size.orders:
+            return
+        started = time.monotonic()
+        for index in range(self.size.attachments):
+            writer = BlobWriter()
+            remaining = self.size.attachment_size
+            while remaining > 0:
+                chunk = self.rng.randbytes(min(remaining, CHUNK_SIZE))
+                writer.write(chunk)
+                remaining -= len(chunk)
+            sha256 = writer.commit(session)
+            session.add(
+                StoredFile(
+                    entity_type="order",
+                    entity_id=self.rng.randint(1, self.size.orders),
+                    filename=f"document-{index + 1}.pdf",
+                    mime="application/pdf",
+                    size=writer.size,
+                    sha256=sha256,
+                    storage=STORAGE_DISK,
+                )
+            )
+        session.commit()
+        self.log(f"files: {self.size.attachments} pièces jointes en {time.monotonic() - started:.1f}s")
+
+    def run(self) -> None:
+        # Secondary indexes are built once after the load (by the
+        # ``_create_missing_indexes`` migration) instead of row by row.
+        bulk_tables = [model.__table__ for model in (Order, OrderLine, Serial, Assignment, ActivityLog)]
+        with self.engine.begin() as connection:
+            for bulk_table in bulk_tables:
+                for index in bulk_table.indexes:
+                    index.drop(connection, checkfirst=True)
+            if connection.dialect.name == "sqlite":
+                connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+                connection.exec_driver_sql("PRAGMA cache_size = -262144")
+            self._load(connection, User, self._users())
+            self._load(connection, Supplier, self._suppliers())
+            self._load(connection, Item, self._items())
+            self._load(connection, Order, self._orders())
+            self._load(connection, OrderLine, self._order_lines())
+            self._load(connection, Delivery, self._deliveries())
+            self._load(connection, Serial, self._serials())
+            self._load(connection, Assignment, self._assignments())
+            self._load(connection, ActivityLog, self._activity())
+        started = time.monotonic()
+        run_migrations(self.engine)
+        self.log(f"index créés en {time.monotonic() - started:.1f}s")
+        with Session(self.engine) as session:
+            self._attachments(session)
+            started = time.monotonic()
+            rebuild_stock_counters(session)
+            rebuild_rollups(session)
+            rebuild_search_index(session)
+            rebuild_warranty_calendar(session)
+            bump_versions(session, *versions.ALL_SCOPES)
+            session.commit()
+            self.log(f"tables dérivées reconstruites en {time.monotonic() - started:.1f}s")
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.connect() as connection:
+                connection.execute(text("ANALYZE"))
+
+
+def generate(
+    engine: Engine,
+    size: DatasetSize,
+    *,
+    seed: int = 1,
+    today: Optional[date] = None,
+    batch_size: int = 10_000,
+    log: Callable[[str], None] = lambda message: None,
+) -> None:
+    """Create the schema on ``engine`` and fill it with a synthetic dataset.
+
+    The database must not contain users yet.
+    """
+    SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
+    with engine.connect() as connection:
+        if connection.execute(text('SELECT 1 FROM "user" LIMIT 1')).first() is not None:
+            raise ValueError("La base contient déjà des données")
+    Generator(engine, size, seed=seed, today=today or date.today(), batch_size=batch_size, log=log).run()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.datagen", description="Génère un jeu de données synthétique")
+    parser.add_argument("--database-url", default=None, help="Base cible (DATABASE_URL par défaut)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    for field in asdict(PRESETS["small"]):
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--today", type=date.fromisoformat, default=None, help="Date de référence (AAAA-MM-JJ)")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    overrides = {field: getattr(args, field) for field in asdict(PRESETS[args.preset]) if getattr(args, field) is not None}
+    size = replace(PRESETS[args.preset], **overrides)
+    if args.database_url:
+        connect_args = {"check_same_thread": False} if args.database_url.startswith("sqlite") else {}
+        engine = create_engine(args.database_url, connect_args=connect_args)
+    else:
+        from .database import engine
+    started = time.monotonic()
+    try:
+        generate(engine, size, seed=args.seed, today=args.today, batch_size=args.batch_size, log=print)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    print(f"Jeu de données généré en {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,8 +1,15 @@
 from __future__ import annotations
 
-from fastapi import Depends, Header, HTTPException, status
+import hashlib
+from datetime import date
+from typing import Dict
 
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+
+from .database import async_session_scope
+from .files import etag_matches
 from .models import Role
+from .versions import current_versions
 
 
 def get_current_role(x_user_role: str | None = Header(default=None)) -> Role:
@@ -21,3 +28,34 @@ def require_roles(*allowed: Role):
         return role
 
     return dependency
+
+
+def conditional_get(*scopes: str, daily: bool = False):
+    """Answer ``If-None-Match`` from the data versions of ``scopes``.
+
+    The strong ETag hashes the versions (and the current day when ``daily``)
+    with the path and query string, so the 304 is decided by a single read of
+    ``change_version`` before the route runs its own queries. The dependency
+    returns the versions it read for routes that key a cache on them.
+    """
+
+    async def dependency(
+        request: Request,
+        response: Response,
+        if_none_match: str | None = Header(default=None),
+        role: Role = Depends(get_current_role),
+    ) -> Dict[str, int]:
+        async with async_session_scope() as session:
+            versions = await session.run_sync(current_versions, scopes)
+        parts = [request.url.path, str(sorted(request.query_params.multi_items())), str(sorted(versions.items()))]
+        if daily:
+            parts.append(date.today().isoformat())
+        etag = f'"{hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]}"'
+        # Clients must revalidate, which costs one small query once cached.
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+        return versions
+
+    return dependency
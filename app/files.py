@@ -0,0 +1,215 @@
+"""Storage of attachment bytes.
+
+File metadata lives in ``files`` (:class:`StoredFile`); listing attachments
+never loads their content. The bytes live in one of two places, recorded in
+``StoredFile.storage``:
+
+- ``disk``: the content-addressed store of :mod:`app.blobstore`, used for
+  every new upload;
+- ``database``: ``CHUNK_SIZE`` rows of ``file_chunks``, where files uploaded
+  by older versions remain until ``python -m app.files migrate`` moves them
+  to the disk store. Every chunk but the last one is exactly ``CHUNK_SIZE``
+  bytes long, which lets byte ranges be mapped to chunk rows.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from fastapi import Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import FormData
+from starlette.formparsers import MultiPartException, MultiPartParser
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from . import blobstore
+from .models import FileChunk, StoredFile
+
+
+CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+# Room for the form fields, part headers and boundaries around the file.
+MULTIPART_OVERHEAD = 64 * 1024
+
+STORAGE_DATABASE = "database"
+STORAGE_DISK = "disk"
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class _BodyTooLarge(MultiPartException):
+    # A MultiPartException makes the parser close the parts it spooled so far.
+    pass
+
+
+async def read_upload_form(request: Request, max_size: Optional[int] = None) -> FormData:
+    """Parse the multipart body of an upload, counting its bytes as they arrive.
+
+    Raises :class:`FileTooLarge` before reading anything when ``Content-Length``
+    announces more than ``max_size`` (``MAX_UPLOAD_SIZE`` by default) plus
+    ``MULTIPART_OVERHEAD``, and stops reading the body as soon as it crosses
+    that limit otherwise: an oversized upload is never received, nor spooled,
+    in full. The exact size of the file is checked by :func:`write_upload`.
+    """
+    limit = (MAX_UPLOAD_SIZE if max_size is None else max_size) + MULTIPART_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise FileTooLarge()
+
+    async def stream() -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise _BodyTooLarge("Corps de la requête trop volumineux")
+            yield chunk
+
+    try:
+        return await MultiPartParser(request.headers, stream(), max_files=1, max_fields=10).parse()
+    except _BodyTooLarge as exc:
+        raise FileTooLarge() from exc
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+async def write_upload(session: Session, stored: StoredFile, upload: UploadFile, max_size: Optional[int] = None) -> None:
+    """Copy ``upload`` into the disk store one chunk at a time.
+
+    Fills ``stored.size``, ``stored.sha256`` and ``stored.storage``. Raises
+    :class:`FileTooLarge` as soon as more than ``max_size`` bytes
+    (``MAX_UPLOAD_SIZE`` by default) were read. Disk and database work runs
+    in the threadpool so the event loop is never blocked.
+    """
+    if max_size is None:
+        max_size = MAX_UPLOAD_SIZE
+    writer = blobstore.BlobWriter()
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if writer.size + len(chunk) > max_size:
+                raise FileTooLarge()
+            await run_in_threadpool(writer.write, chunk)
+        stored.sha256 = await run_in_threadpool(writer.commit, session)
+    except BaseException:
+        writer.discard()
+        raise
+    stored.size = writer.size
+    stored.storage = STORAGE_DISK
+
+
+def read_content(session: Session, stored: StoredFile) -> bytes:
+    if stored.size == 0:
+        return b""
+    return b"".join(iter_content(session, stored, 0, stored.size - 1))
+
+
+def iter_content(session: Session, stored: StoredFile, start: int, end: int) -> Iterator[bytes]:
+    """Yield bytes ``start`` to ``end`` (inclusive), loading one chunk at a time."""
+    if stored.storage == STORAGE_DISK:
+        yield from blobstore.iter_blob(stored.sha256, start, end)
+        return
+    for seq in range(start // CHUNK_SIZE, end // CHUNK_SIZE + 1):
+        data = session.exec(select(FileChunk.data).where(FileChunk.file_id == stored.id, FileChunk.seq == seq)).one()
+        offset = seq * CHUNK_SIZE
+        yield data[max(start - offset, 0) : end - offset + 1]
+
+
+def delete_content(session: Session, stored: StoredFile) -> Optional[str]:
+    """Drop the content of ``stored``.
+
+    Returns the digest of a disk blob that lost its last reference; pass it to
+    :func:`app.blobstore.collect_blob` once the transaction is committed.
+    """
+    if stored.storage == STORAGE_DISK:
+        return stored.sha256 if blobstore.release_blob(session, stored.sha256) else None
+    session.execute(delete(FileChunk).where(FileChunk.file_id == stored.id))
+    return None
+
+
+def migrate_to_disk(session: Session) -> int:
+    """Move every file still stored in ``file_chunks`` to the disk store.
+
+    Files are migrated and committed one at a time so the job can be
+    interrupted and resumed. Returns the number of migrated files.
+    """
+    file_ids = session.exec(select(StoredFile.id).where(StoredFile.storage == STORAGE_DATABASE)).all()
+    for file_id in file_ids:
+        stored = session.get(StoredFile, file_id)
+        writer = blobstore.BlobWriter()
+        try:
+            for data in iter_content(session, stored, 0, stored.size - 1) if stored.size else ():
+                writer.write(data)
+            stored.sha256 = writer.commit(session)
+        except BaseException:
+            writer.discard()
+            raise
+        stored.storage = STORAGE_DISK
+        session.add(stored)
+        session.execute(delete(FileChunk).where(FileChunk.file_id == file_id))
+        session.commit()
+    return len(file_ids)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``Range: bytes=`` header into inclusive offsets.
+
+    Returns ``None`` when the whole content should be served (no header, other
+    units or several ranges) and raises :class:`RangeNotSatisfiable` when the
+    range lies outside the content.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    if size == 0:
+        # No byte of an empty file can be addressed.
+        raise RangeNotSatisfiable()
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if argv not in (["migrate"], ["gc"]):
+        print("usage: python -m app.files migrate|gc", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        if argv == ["gc"]:
+            count = blobstore.collect_orphans(session)
+            print(f"{count} contenu(s) non référencé(s) supprimé(s)")
+            return 0
+        count = migrate_to_disk(session)
+    print(f"{count} fichier(s) déplacé(s) vers {blobstore.STORAGE_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,171 @@
+"""Bulk serial ingestion for deliveries.
+
+Serial numbers are read from a CSV or NDJSON stream and handled in batches
+of ``IMPORT_BATCH_SIZE`` rows: each batch is validated with one query per
+check (unknown items, serial numbers already in the database) and inserted
+with a single executemany, so a pallet of thousands of serials costs a few
+dozen statements and never holds more than one batch in memory.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import timedelta
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from .models import Delivery, Item, Order, Serial, SerialStatus
+
+
+IMPORT_BATCH_SIZE = 1000
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+
+
+ImportRow = Tuple[int, dict]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    if (content_type or "").split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    if (filename or "").lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream: IO[bytes], fmt: str) -> Iterator[ImportRow]:
+    """Yield ``(line_number, row)`` pairs from a CSV (with header) or NDJSON byte stream."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    line_number = 1
+    try:
+        if fmt == "ndjson":
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    raise _invalid(line_number, "JSON invalide") from exc
+                if not isinstance(row, dict):
+                    raise _invalid(line_number, "objet JSON attendu")
+                yield line_number, row
+            return
+        reader = csv.DictReader(text)
+        if reader.fieldnames is None or "serial_number" not in reader.fieldnames:
+            raise HTTPException(status_code=400, detail="Colonne serial_number manquante")
+        for row in reader:
+            line_number = reader.line_num
+            yield line_number, row
+    except UnicodeDecodeError as exc:
+        # Decoding is done by blocks: the line is the last one read before the error.
+        raise _invalid(line_number, "encodage invalide (UTF-8 attendu)") from exc
+
+
+def _invalid(line_number: int, detail: str) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"Ligne {line_number} : {detail}")
+
+
+def _optional(row: dict, key: str, cast, line_number: int):
+    value = row.get(key)
+    if value is None or value == "":
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError) as exc:
+        raise _invalid(line_number, f"{key} invalide") from exc
+
+
+class DeliveryImporter:
+    """Validate and insert the serials of one delivery, batch by batch."""
+
+    def __init__(
+        self,
+        session: Session,
+        order: Order,
+        delivery: Delivery,
+        *,
+        default_item_id: Optional[int],
+        default_purchase_price: Optional[float],
+        warranty_duration_days: Optional[int],
+    ) -> None:
+        self.session = session
+        self.order = order
+        self.delivery = delivery
+        self.default_item_id = default_item_id
+        self.default_purchase_price = default_purchase_price
+        self.warranty_start = delivery.delivered_at
+        self.warranty_end = delivery.delivered_at + timedelta(days=warranty_duration_days or 365)
+        self.counts: Dict[int, int] = {}
+        self._known_items: Set[int] = set()
+
+    def run(self, rows: Iterator[ImportRow]) -> Dict[int, int]:
+        batch: List[ImportRow] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self._insert_batch(batch)
+                batch = []
+        if batch:
+            self._insert_batch(batch)
+        return self.counts
+
+    def _insert_batch(self, batch: List[ImportRow]) -> None:
+        values = []
+        lines: Dict[str, int] = {}
+        for line_number, row in batch:
+            serial_number = str(row.get("serial_number") or "").strip()
+            if not serial_number:
+                raise _invalid(line_number, "serial_number manquant")
+            if serial_number in lines:
+                raise _invalid(line_number, f"numéro de série {serial_number} en double")
+            lines[serial_number] = line_number
+            item_id = _optional(row, "item_id", int, line_number) or self.default_item_id
+            if item_id is None:
+                raise _invalid(line_number, "item_id requis")
+            price = _optional(row, "purchase_price", float, line_number)
+            values.append(
+                {
+                    "item_id": item_id,
+                    "serial_number": serial_number,
+                    "delivery_id": self.delivery.id,
+                    "delivery_date": self.delivery.delivered_at,
+                    "warranty_start": self.warranty_start,
+                    "warranty_end": self.warranty_end,
+                    "supplier_id": self.order.supplier_id,
+                    "purchase_price": price if price is not None else self.default_purchase_price,
+                    "status": SerialStatus.IN_STOCK,
+                }
+            )
+
+        item_ids = {value["item_id"] for value in values} - self._known_items
+        if item_ids:
+            found = set(self.session.exec(select(Item.id).where(Item.id.in_(item_ids))).all())
+            missing = item_ids - found
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Matériel(s) inconnu(s) : {sorted(missing)}")
+            self._known_items |= found
+
+        # Earlier batches of the file are already inserted in this transaction:
+        # the lookup also finds the duplicates across batches, without keeping
+        # every serial number of the file in memory.
+        existing = self.session.exec(
+            select(Serial.serial_number, Serial.delivery_id).where(Serial.serial_number.in_(list(lines)))
+        ).all()
+        repeated = min(
+            ((lines[number], number) for number, delivery_id in existing if delivery_id == self.delivery.id), default=None
+        )
+        if repeated is not None:
+            raise _invalid(repeated[0], f"numéro de série {repeated[1]} en double")
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Numéro(s) de série déjà enregistré(s) : {sorted(number for number, _ in existing)[:20]}",
+            )
+
+        self.session.execute(insert(Serial), values)
+        for value in values:
+            self.counts[value["item_id"]] = self.counts.get(value["item_id"], 0) + 1
@@ -0,0 +1,91 @@
+"""Daily maintenance jobs.
+
+Each job runs at most once per day over every worker: it is claimed by
+moving ``job_run.last_run_on`` to today in the same transaction as its work,
+which the single SQLite writer (or the conditional update elsewhere)
+serializes. A job receives the day of its previous run, so it only has to
+look at what changed since then. The application runs the due jobs on
+startup and then every ``JOBS_INTERVAL`` seconds; ``python -m app.jobs``
+runs them once.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlmodel import Session, select
+
+from . import alerts, rollups, snapshots
+from .models import JobRun
+
+logger = logging.getLogger(__name__)
+
+JOBS_INTERVAL_SECONDS = float(os.getenv("JOBS_INTERVAL", "3600"))
+
+# name -> job(session, today, previous run day or None); the job must not commit.
+DAILY_JOBS: Dict[str, Callable[[Session, date, Optional[date]], None]] = {
+    "alerts": alerts.daily_sweep,
+    "snapshots": snapshots.daily_snapshot,
+    "rollups": rollups.reconcile,
+}
+
+
+def _claim(session: Session, name: str, today: date) -> Tuple[bool, Optional[date]]:
+    previous = session.exec(select(JobRun.last_run_on).where(JobRun.name == name)).first()
+    if previous is None:
+        session.execute(insert(JobRun).values(name=name, last_run_on=today))
+        return True, None
+    if previous >= today:
+        return False, previous
+    result = session.execute(
+        update(JobRun).where(JobRun.name == name, JobRun.last_run_on < today).values(last_run_on=today)
+    )
+    return result.rowcount == 1, previous
+
+
+def run_due_jobs(session: Session, today: Optional[date] = None) -> List[str]:
+    """Run the jobs not yet run ``today``, one transaction each. Returns their names."""
+    today = today or date.today()
+    ran = []
+    for name, job in DAILY_JOBS.items():
+        claimed, previous = _claim(session, name, today)
+        if not claimed:
+            session.rollback()
+            continue
+        job(session, today, previous)
+        session.execute(update(JobRun).where(JobRun.name == name).values(finished_at=datetime.utcnow()))
+        session.commit()
+        ran.append(name)
+    return ran
+
+
+def run_due_jobs_safely(session: Session) -> None:
+    # Called at startup and from the background loop: a failing job must not
+    # stop the server, it is retried at the next tick.
+    try:
+        run_due_jobs(session)
+    except Exception:
+        session.rollback()
+        logger.exception("Échec des tâches quotidiennes")
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if argv:
+        print("usage: python -m app.jobs", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        ran = run_due_jobs(session)
+    print(f"Tâches exécutées : {', '.join(ran) or 'aucune'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,22 +1,58 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+from collections import Counter, defaultdict
 from datetime import date, datetime, timedelta
-from typing import Dict, Iterable, List
+from typing import Callable, Dict, Iterable, Iterator, List
 
-from fastapi import Depends, FastAPI, File, Form, HTTPException, Query, UploadFile, status
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Path, Query, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.formparsers import MultiPartException
+from sqlalchemy import case, insert, update
 from sqlmodel import Session, func, select
-
-from .database import get_session, init_db, session_scope
-from .dependencies import get_current_role, require_roles
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import activity, alerts, jobs, rollups, search, snapshots, versions, warranties
+from .alerts import open_delivery_warranty_alerts, sync_stock_alerts
+from .blobstore import collect_blob
+from .cache import VersionedCache
+from .database import (
+    async_session_scope,
+    connect_async_engine,
+    dispose_async_engine,
+    get_async_session,
+    get_session,
+    init_db,
+    read_session_scope,
+    session_scope,
+)
+from .dependencies import conditional_get, get_current_role, require_roles
+from .exports import ExportFormat, export_response, query_rows
+from .imports import DeliveryImporter, detect_format, read_rows
+from .files import (
+    FileTooLarge,
+    RangeNotSatisfiable,
+    delete_content,
+    etag_matches,
+    iter_content,
+    parse_range,
+    read_upload_form,
+    write_upload,
+)
 from .models import (
     ActivityEntity,
     ActivityLog,
+    Alert,
+    AlertKind,
     Assignment,
     Delivery,
     Item,
+    ItemStock,
     Order,
     OrderLine,
     OrderStatus,
@@ -27,26 +63,48 @@ from .models import (
     StoredFile,
     Supplier,
     User,
+    WarrantyGranularity,
 )
 from .schemas import (
+    ActivityRead,
+    AlertRead,
+    AssignmentBatchCreate,
+    AssignmentBatchResponse,
+    AssignmentBatchResult,
+    AssignmentBatchReturn,
     AssignmentCreate,
     AssignmentRead,
     DashboardResponse,
     DashboardWidget,
     DeliveryCreate,
+    DeliveryImportLine,
+    DeliveryImportResult,
     ItemCreate,
     FileRead,
     ItemRead,
     OrderCreate,
     OrderRead,
+    OrderReadLine,
     OrderStatusUpdate,
+    Page,
     ReportResponse,
     ReportRow,
+    SearchHit,
+    SearchResponse,
     SerialRead,
+    StockHistory,
+    StockHistoryPoint,
     SupplierRead,
     UserRead,
+    WarrantyBucketRead,
+    WarrantyCalendar,
+    WarrantySample,
 )
+from .pagination import PageParams, paginate
+from .responses import page_response, schema_columns
 from .seed import create_demo_data
+from .stock import ensure_stock_counters, move_stock, move_stock_batch, stock_counts
+from .versions import bump_versions
 
 app = FastAPI(title="Stocky", description="Gestion des stocks, commandes et attributions")
 app.add_middleware(
@@ -63,11 +121,46 @@ def on_startup() -> None:
     init_db()
     with session_scope() as session:
         create_demo_data(session)
+        ensure_stock_counters(session)
+        search.ensure_search_index(session)
+        warranties.ensure_warranty_calendar(session)
+        rollups.ensure_rollups(session)
+        jobs.run_due_jobs_safely(session)
+    activity.writer.start()
+
+
+async def _run_jobs_periodically() -> None:
+    while True:
+        await asyncio.sleep(jobs.JOBS_INTERVAL_SECONDS)
+        await run_in_threadpool(_run_due_jobs)
+
+
+def _run_due_jobs() -> None:
+    with session_scope() as session:
+        jobs.run_due_jobs_safely(session)
 
 
-@app.get("/users", response_model=List[UserRead])
-def list_users(session: Session = Depends(get_session), role: Role = Depends(require_roles(Role.ADMIN, Role.BUYER, Role.STOREKEEPER))):
-    return session.exec(select(User)).all()
+@app.on_event("startup")
+async def on_async_startup() -> None:
+    await connect_async_engine()
+    app.state.jobs_task = asyncio.create_task(_run_jobs_periodically())
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    app.state.jobs_task.cancel()
+    await run_in_threadpool(activity.writer.stop)
+    await dispose_async_engine()
+
+
+@app.get("/users", response_model=Page[UserRead])
+def list_users(
+    page: PageParams = Depends(),
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.BUYER, Role.STOREKEEPER)),
+) -> Page[UserRead]:
+    users, next_cursor = paginate(session, select(User), page, id_column=User.id)
+    return Page[UserRead](items=[UserRead.from_orm(user) for user in users], next_cursor=next_cursor)
 
 
 @app.get("/suppliers", response_model=List[SupplierRead])
@@ -75,58 +168,148 @@ def list_suppliers(session: Session = Depends(get_session), role: Role = Depends
     return session.exec(select(Supplier)).all()
 
 
-@app.post("/files", response_model=FileRead, status_code=status.HTTP_201_CREATED)
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["entity_type", "entity_id", "attachment"],
+                    "properties": {
+                        "entity_type": {"type": "string"},
+                        "entity_id": {"type": "integer"},
+                        "attachment": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@app.post("/files", response_model=FileRead, status_code=status.HTTP_201_CREATED, openapi_extra=UPLOAD_FORM_SCHEMA)
 async def upload_file(
-    entity_type: str = Form(...),
-    entity_id: int = Form(...),
-    attachment: UploadFile = File(...),
+    request: Request,
     session: Session = Depends(get_session),
     role: Role = Depends(require_roles(Role.ADMIN, Role.BUYER, Role.STOREKEEPER)),
 ) -> FileRead:
-    _require_entity(session, entity_type, entity_id)
-    content = await attachment.read()
-    await attachment.close()
-    stored = StoredFile(
-        entity_type=entity_type,
-        entity_id=entity_id,
-        filename=attachment.filename or "fichier",
-        mime=attachment.content_type or "application/octet-stream",
-        size=len(content),
-        content=content,
-    )
+    # The form is parsed here rather than by FastAPI, which would receive and
+    # spool the whole body before the size limit could be checked.
+    try:
+        form = await read_upload_form(request)
+    except FileTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Fichier trop volumineux") from exc
+    except MultiPartException as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=exc.message) from exc
+    attachment = form.get("attachment")
+    try:
+        entity_type = form.get("entity_type")
+        entity_id = int(form.get("entity_id"))
+        if not isinstance(entity_type, str) or not isinstance(attachment, StarletteUploadFile):
+            raise ValueError
+    except (TypeError, ValueError) as exc:
+        await form.close()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="entity_type, entity_id et attachment sont requis"
+        ) from exc
+
+    # The session is synchronous: every database call goes through the threadpool.
+    try:
+        await run_in_threadpool(_check_upload_target, entity_type, entity_id)
+        stored = StoredFile(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            filename=attachment.filename or "fichier",
+            mime=attachment.content_type or "application/octet-stream",
+            size=0,
+        )
+        await write_upload(session, stored, attachment)
+    except FileTooLarge as exc:
+        await run_in_threadpool(session.rollback)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Fichier trop volumineux") from exc
+    finally:
+        await form.close()
+    return await run_in_threadpool(_save_upload, session, stored)
+
+
+def _check_upload_target(entity_type: str, entity_id: int) -> None:
+    # Checked on a reader: the writer is only taken once the content is on disk.
+    with read_session_scope() as session:
+        _require_entity(session, entity_type, entity_id)
+
+
+def _save_upload(session: Session, stored: StoredFile) -> FileRead:
     session.add(stored)
+    bump_versions(session, versions.FILES)
+    session.flush()
+    result = _file_to_schema(stored)
     session.commit()
-    session.refresh(stored)
-    return _file_to_schema(stored)
+    return result
 
 
-@app.get("/files", response_model=List[FileRead])
+@app.get("/files", response_model=Page[FileRead])
 def list_files(
     entity_type: str | None = Query(default=None),
     entity_id: int | None = Query(default=None),
+    page: PageParams = Depends(),
     session: Session = Depends(get_session),
     role: Role = Depends(get_current_role),
-) -> List[FileRead]:
+) -> Page[FileRead]:
     query = select(StoredFile)
     if entity_type:
         query = query.where(StoredFile.entity_type == entity_type)
     if entity_id:
         query = query.where(StoredFile.entity_id == entity_id)
-    rows = session.exec(query.order_by(StoredFile.created_at.desc())).all()
-    return [_file_to_schema(row) for row in rows]
+    rows, next_cursor = paginate(
+        session, query, page, sort_column=StoredFile.created_at, id_column=StoredFile.id, descending=True
+    )
+    return Page[FileRead](items=[_file_to_schema(row) for row in rows], next_cursor=next_cursor)
 
 
 @app.get("/files/{file_id}/download")
 def download_file(
     file_id: int,
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_none_match: str | None = Header(default=None),
     session: Session = Depends(get_session),
     role: Role = Depends(get_current_role),
 ) -> Response:
     stored = session.get(StoredFile, file_id)
     if stored is None:
         raise HTTPException(status_code=404, detail="Fichier introuvable")
-    headers = {"Content-Disposition": f"attachment; filename=\"{stored.filename}\""}
-    return Response(content=stored.content, media_type=stored.mime, headers=headers)
+    etag = f'"{stored.sha256}"'
+    headers = {
+        "Content-Disposition": f"attachment; filename=\"{stored.filename}\"",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        byte_range = parse_range(range_header, stored.size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{stored.size}"},
+        )
+    status_code = status.HTTP_200_OK
+    start, end = 0, stored.size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_stream_file(file_id, start, end), status_code=status_code, media_type=stored.mime, headers=headers)
+
+
+def _stream_file(file_id: int, start: int, end: int) -> Iterator[bytes]:
+    # The request session may be closed before the body is sent: use a dedicated one.
+    if end < start:
+        return
+    with read_session_scope() as session:
+        stored = session.get(StoredFile, file_id)
+        yield from iter_content(session, stored, start, end)
 
 
 @app.delete(
@@ -142,8 +325,12 @@ def delete_file(
     stored = session.get(StoredFile, file_id)
     if stored is None:
         raise HTTPException(status_code=404, detail="Fichier introuvable")
+    orphan = delete_content(session, stored)
     session.delete(stored)
+    bump_versions(session, versions.FILES)
     session.commit()
+    if orphan:
+        collect_blob(session, orphan)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -178,13 +365,23 @@ def _file_to_schema(stored_file: StoredFile) -> FileRead:
 
 
 def _files_for_entity(session: Session, entity_type: str, entity_id: int) -> List[FileRead]:
+    return _files_for_entities(session, entity_type, [entity_id]).get(entity_id, [])
+
+
+def _files_for_entities(session: Session, entity_type: str, entity_ids: Iterable[int]) -> Dict[int, List[FileRead]]:
+    ids = list(entity_ids)
+    if not ids:
+        return {}
     rows = session.exec(
         select(StoredFile)
         .where(StoredFile.entity_type == entity_type)
-        .where(StoredFile.entity_id == entity_id)
+        .where(StoredFile.entity_id.in_(ids))
         .order_by(StoredFile.created_at.desc())
     ).all()
-    return [_file_to_schema(row) for row in rows]
+    files: Dict[int, List[FileRead]] = defaultdict(list)
+    for row in rows:
+        files[row.entity_id].append(_file_to_schema(row))
+    return files
 
 
 def _item_to_schema(item: Item, stock: int) -> ItemRead:
@@ -203,16 +400,7 @@ def _item_to_schema(item: Item, stock: int) -> ItemRead:
 
 
 def _calculate_stock(session: Session, items: Iterable[Item]) -> Dict[int, int]:
-    item_ids = [item.id for item in items if item.id is not None]
-    if not item_ids:
-        return {}
-    rows = session.exec(
-        select(Serial.item_id, func.count(Serial.id))
-        .where(Serial.item_id.in_(item_ids))
-        .where(Serial.status == SerialStatus.IN_STOCK)
-        .group_by(Serial.item_id)
-    ).all()
-    return {item_id: count for item_id, count in rows}
+    return stock_counts(session, [item.id for item in items if item.id is not None])
 
 
 @app.post("/items", response_model=ItemRead, status_code=status.HTTP_201_CREATED)
@@ -223,21 +411,21 @@ def create_item(
 ) -> ItemRead:
     item = Item(**payload.dict())
     session.add(item)
+    session.flush()
+    search.index_entities(session, search.ITEM, [item.id])
+    sync_stock_alerts(session, [item.id])
+    activity.record(session, ActivityEntity.ITEM, item.id, "create", payload.json())
+    bump_versions(session, versions.ITEMS)
+    # Responses of write routes are built before the commit: reading after it
+    # would open a second write transaction, held until the session closes.
+    result = _item_to_schema(item, _calculate_stock(session, [item]).get(item.id, 0))
     session.commit()
-    session.refresh(item)
-    stock = _calculate_stock(session, [item]).get(item.id, 0)
-    return _item_to_schema(item, stock)
+    return result
 
 
-@app.get("/items", response_model=List[ItemRead])
-def list_items(
-    category: str | None = Query(default=None),
-    supplier_id: int | None = Query(default=None),
-    site: str | None = Query(default=None),
-    search: str | None = Query(default=None),
-    session: Session = Depends(get_session),
-    role: Role = Depends(get_current_role),
-) -> List[ItemRead]:
+def _list_items(
+    session: Session, category: str | None, supplier_id: int | None, site: str | None, search_term: str | None, page: PageParams
+) -> Page[ItemRead]:
     query = select(Item)
     if category:
         query = query.where(Item.category == category)
@@ -245,26 +433,30 @@ def list_items(
         query = query.where(Item.default_supplier_id == supplier_id)
     if site:
         query = query.where(Item.site == site)
-    if search:
-        like = f"%{search.lower()}%"
-        query = query.where(func.lower(Item.name).like(like) | func.lower(Item.internal_ref).like(like))
-    items = session.exec(query.order_by(Item.name)).all()
+    if search_term:
+        query = query.where(Item.id.in_(search.matching_ids(session, search.ITEM, search_term)))
+    items, next_cursor = paginate(session, query, page, sort_column=Item.name, id_column=Item.id)
     stock_map = _calculate_stock(session, items)
-    return [
-        _item_to_schema(item, stock_map.get(item.id, 0))
-        for item in items
-    ]
+    return Page[ItemRead](
+        items=[_item_to_schema(item, stock_map.get(item.id, 0)) for item in items],
+        next_cursor=next_cursor,
+    )
 
 
-@app.get("/serials", response_model=List[SerialRead])
-def list_serials(
-    status_filter: SerialStatus | None = Query(default=None, alias="status"),
-    item_id: int | None = Query(default=None),
-    assigned: bool | None = Query(default=None),
-    session: Session = Depends(get_session),
+@app.get("/items", response_model=Page[ItemRead], dependencies=[Depends(conditional_get(versions.ITEMS, versions.SERIALS))])
+async def list_items(
+    category: str | None = Query(default=None),
+    supplier_id: int | None = Query(default=None),
+    site: str | None = Query(default=None),
+    search_term: str | None = Query(default=None, alias="search"),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
     role: Role = Depends(get_current_role),
-) -> List[SerialRead]:
-    query = select(Serial)
+) -> Page[ItemRead]:
+    return await session.run_sync(_list_items, category, supplier_id, site, search_term, page)
+
+
+def _filter_serials(query, status_filter: SerialStatus | None, item_id: int | None, assigned: bool | None):
     if status_filter:
         query = query.where(Serial.status == status_filter)
     if item_id:
@@ -273,8 +465,110 @@ def list_serials(
         query = query.where(Serial.current_assignee_user_id.is_not(None))
     if assigned is False:
         query = query.where(Serial.current_assignee_user_id.is_(None))
-    serials = session.exec(query.order_by(Serial.delivery_date.desc().nullslast())).all()
-    return [SerialRead.from_orm(serial) for serial in serials]
+    return query
+
+
+def _list_serials(
+    session: Session, status_filter: SerialStatus | None, item_id: int | None, assigned: bool | None, page: PageParams
+) -> Response:
+    query = _filter_serials(select(*schema_columns(SerialRead, Serial)), status_filter, item_id, assigned)
+    serials, next_cursor = paginate(
+        session, query, page, sort_column=Serial.delivery_date, id_column=Serial.id, descending=True
+    )
+    return page_response(serials, next_cursor)
+
+
+@app.get("/serials", response_model=Page[SerialRead])
+async def list_serials(
+    status_filter: SerialStatus | None = Query(default=None, alias="status"),
+    item_id: int | None = Query(default=None),
+    assigned: bool | None = Query(default=None),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Response:
+    return await session.run_sync(_list_serials, status_filter, item_id, assigned, page)
+
+
+SERIAL_EXPORT_HEADER = [
+    "id",
+    "numero_serie",
+    "article_id",
+    "article",
+    "categorie",
+    "site",
+    "etat",
+    "date_livraison",
+    "debut_garantie",
+    "fin_garantie",
+    "prix_achat",
+    "attributaire_id",
+    "attributaire",
+]
+
+
+@app.get("/serials/export", dependencies=[Depends(conditional_get(versions.SERIALS, versions.ITEMS, versions.USERS))])
+def export_serials(
+    response: Response,
+    fmt: ExportFormat = Query(default=ExportFormat.CSV, alias="format"),
+    status_filter: SerialStatus | None = Query(default=None, alias="status"),
+    item_id: int | None = Query(default=None),
+    assigned: bool | None = Query(default=None),
+    role: Role = Depends(get_current_role),
+) -> StreamingResponse:
+    """Every serial matching the filters of ``GET /serials``, streamed in id order."""
+    query = (
+        select(
+            Serial.id,
+            Serial.serial_number,
+            Serial.item_id,
+            Item.name,
+            Item.category,
+            Item.site,
+            Serial.status,
+            Serial.delivery_date,
+            Serial.warranty_start,
+            Serial.warranty_end,
+            Serial.purchase_price,
+            Serial.current_assignee_user_id,
+            User.display_name,
+        )
+        .join(Item, Item.id == Serial.item_id)
+        .outerjoin(User, User.id == Serial.current_assignee_user_id)
+        .order_by(Serial.id)
+    )
+    query = _filter_serials(query, status_filter, item_id, assigned)
+    return export_response(fmt, "serials", SERIAL_EXPORT_HEADER, query_rows(query), dict(response.headers))
+
+
+@app.post("/serials/{serial_id}/retire", response_model=SerialRead)
+def retire_serial(
+    serial_id: int,
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.STOREKEEPER)),
+) -> SerialRead:
+    serial = session.get(Serial, serial_id)
+    if serial is None:
+        raise HTTPException(status_code=404, detail="Serial not found")
+    if serial.status == SerialStatus.RETIRED:
+        raise HTTPException(status_code=409, detail="Le numéro de série est déjà réformé")
+    if serial.status == SerialStatus.ASSIGNED:
+        raise HTTPException(status_code=409, detail="Le numéro de série est attribué, il doit d'abord être restitué")
+
+    move_stock(session, serial.item_id, serial.status, SerialStatus.RETIRED)
+    if serial.warranty_end is not None:
+        warranties.record_warranties(session, {(serial.item_id, serial.warranty_end): -1})
+    serial.status = SerialStatus.RETIRED
+    session.add(serial)
+    activity.record(session, ActivityEntity.SERIAL, serial.id, "retire", json.dumps({"item_id": serial.item_id}))
+    scopes = [versions.SERIALS]
+    if alerts.resolve_serial_alerts(session, serial.id):
+        scopes.append(versions.ALERTS)
+    bump_versions(session, *scopes)
+    session.flush()
+    result = SerialRead.from_orm(serial)
+    session.commit()
+    return result
 
 
 @app.post("/orders", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
@@ -293,55 +587,188 @@ def create_order(
 
     for line in payload.lines:
         session.add(OrderLine(order_id=order.id, item_id=line.item_id, qty=line.qty, unit_price=line.unit_price, tax_rate=line.tax_rate))
+    search.index_entities(session, search.ORDER, [order.id])
+    rollups.record_orders(session, {(order.status, order.supplier_id): 1})
 
-    session.add(
-        ActivityLog(
-            entity_type=ActivityEntity.ORDER,
-            entity_id=order.id,
-            action="create",
-            actor_user_id=0,
-            payload_json=json.dumps({"status": order.status.value}),
-        )
-    )
+    activity.record(session, ActivityEntity.ORDER, order.id, "create", json.dumps({"status": order.status.value}))
+    bump_versions(session, versions.ORDERS)
+    result = _serialize_order(session, order)
     session.commit()
-    session.refresh(order)
-    return _serialize_order(session, order)
+    return result
 
 
 def _serialize_order(session: Session, order: Order) -> OrderRead:
-    session.refresh(order, attribute_names=["supplier", "lines"])
-    files = _files_for_entity(session, "order", order.id)
-    return OrderRead.from_orm(order).copy(update={"files": files})
+    return _serialize_orders(session, [order])[0]
+
+
+def _serialize_orders(session: Session, orders: List[Order]) -> List[OrderRead]:
+    """Build ``OrderRead`` payloads for a whole result set in a fixed number of queries."""
+    if not orders:
+        return []
+    order_ids = [order.id for order in orders]
+    supplier_ids = {order.supplier_id for order in orders}
+    suppliers = {
+        supplier.id: SupplierRead.from_orm(supplier)
+        for supplier in session.exec(select(Supplier).where(Supplier.id.in_(supplier_ids))).all()
+    }
+    lines: Dict[int, List[OrderReadLine]] = defaultdict(list)
+    for line in session.exec(select(OrderLine).where(OrderLine.order_id.in_(order_ids)).order_by(OrderLine.id)).all():
+        lines[line.order_id].append(OrderReadLine.from_orm(line))
+    files = _files_for_entities(session, "order", order_ids)
+    return [
+        OrderRead(
+            id=order.id,
+            supplier=suppliers[order.supplier_id],
+            internal_ref=order.internal_ref,
+            status=order.status,
+            ordered_at=order.ordered_at,
+            expected_delivery_at=order.expected_delivery_at,
+            lines=lines.get(order.id, []),
+            files=files.get(order.id, []),
+        )
+        for order in orders
+    ]
 
 
-@app.get("/orders", response_model=List[OrderRead])
-def list_orders(
-    status_filter: OrderStatus | None = Query(default=None, alias="status"),
-    supplier_id: int | None = Query(default=None),
-    search: str | None = Query(default=None),
-    session: Session = Depends(get_session),
-    role: Role = Depends(get_current_role),
-) -> List[OrderRead]:
-    query = select(Order)
+def _filter_orders(session: Session, query, status_filter: OrderStatus | None, supplier_id: int | None, search_term: str | None):
     if status_filter:
         query = query.where(Order.status == status_filter)
     if supplier_id:
         query = query.where(Order.supplier_id == supplier_id)
-    if search:
-        like = f"%{search.lower()}%"
-        query = query.where(func.lower(Order.internal_ref).like(like))
-    orders = session.exec(query.order_by(Order.ordered_at.desc().nullslast())).all()
-    return [_serialize_order(session, order) for order in orders]
+    if search_term:
+        query = query.where(Order.id.in_(search.matching_ids(session, search.ORDER, search_term)))
+    return query
 
 
-@app.get("/orders/{order_id}", response_model=OrderRead)
-def get_order(order_id: int, session: Session = Depends(get_session), role: Role = Depends(get_current_role)) -> OrderRead:
+def _list_orders(
+    session: Session, status_filter: OrderStatus | None, supplier_id: int | None, search_term: str | None, page: PageParams
+) -> Page[OrderRead]:
+    query = _filter_orders(session, select(Order), status_filter, supplier_id, search_term)
+    orders, next_cursor = paginate(
+        session, query, page, sort_column=Order.ordered_at, id_column=Order.id, descending=True
+    )
+    return Page[OrderRead](items=_serialize_orders(session, orders), next_cursor=next_cursor)
+
+
+@app.get(
+    "/orders",
+    response_model=Page[OrderRead],
+    dependencies=[Depends(conditional_get(versions.ORDERS, versions.FILES, versions.SUPPLIERS))],
+)
+async def list_orders(
+    status_filter: OrderStatus | None = Query(default=None, alias="status"),
+    supplier_id: int | None = Query(default=None),
+    search_term: str | None = Query(default=None, alias="search"),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Page[OrderRead]:
+    return await session.run_sync(_list_orders, status_filter, supplier_id, search_term, page)
+
+
+ORDER_EXPORT_HEADER = [
+    "commande_id",
+    "reference_interne",
+    "etat",
+    "fournisseur_id",
+    "fournisseur",
+    "date_commande",
+    "livraison_prevue",
+    "ligne_id",
+    "article_id",
+    "article",
+    "quantite",
+    "prix_unitaire",
+    "taux_tva",
+]
+
+
+@app.get(
+    "/orders/export",
+    dependencies=[Depends(conditional_get(versions.ORDERS, versions.SUPPLIERS, versions.ITEMS))],
+)
+def export_orders(
+    response: Response,
+    fmt: ExportFormat = Query(default=ExportFormat.CSV, alias="format"),
+    status_filter: OrderStatus | None = Query(default=None, alias="status"),
+    supplier_id: int | None = Query(default=None),
+    search_term: str | None = Query(default=None, alias="search"),
+    session: Session = Depends(get_session),
+    role: Role = Depends(get_current_role),
+) -> StreamingResponse:
+    """One row per order line of the orders matching the filters of ``GET /orders``, in order id order."""
+    query = (
+        select(
+            Order.id,
+            Order.internal_ref,
+            Order.status,
+            Order.supplier_id,
+            Supplier.name,
+            Order.ordered_at,
+            Order.expected_delivery_at,
+            OrderLine.id,
+            OrderLine.item_id,
+            Item.name,
+            OrderLine.qty,
+            OrderLine.unit_price,
+            OrderLine.tax_rate,
+        )
+        .join(Supplier, Supplier.id == Order.supplier_id)
+        .join(OrderLine, OrderLine.order_id == Order.id)
+        .join(Item, Item.id == OrderLine.item_id)
+        .order_by(Order.id, OrderLine.id)
+    )
+    # The request session only picks the search backend (FTS5 or trigrams): the
+    # matching ids stay a subquery, run by the export's own session as it streams.
+    query = _filter_orders(session, query, status_filter, supplier_id, search_term)
+    return export_response(fmt, "orders", ORDER_EXPORT_HEADER, query_rows(query), dict(response.headers))
+
+
+def _search_entities(session: Session, q: str, entity_type: str | None, limit: int) -> SearchResponse:
+    hits: List[SearchHit] = []
+    for kind in [entity_type] if entity_type else [search.ITEM, search.ORDER]:
+        rows = session.execute(search.search_query(session, kind, q).limit(limit)).all()
+        if kind == search.ITEM:
+            labels = dict(session.exec(select(Item.id, Item.name).where(Item.id.in_([row.entity_id for row in rows]))).all())
+        else:
+            labels = dict(
+                session.exec(select(Order.id, Order.internal_ref).where(Order.id.in_([row.entity_id for row in rows]))).all()
+            )
+        hits.extend(
+            SearchHit(entity_type=kind, entity_id=row.entity_id, label=labels.get(row.entity_id) or "", score=row.score)
+            for row in rows
+            if row.entity_id in labels
+        )
+    hits.sort(key=lambda hit: hit.score)
+    return SearchResponse(hits=hits[:limit])
+
+
+@app.get("/search", response_model=SearchResponse)
+async def search_entities(
+    q: str = Query(..., min_length=1),
+    entity_type: str | None = Query(default=None, alias="type", pattern="^(item|order)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> SearchResponse:
+    """Ranked prefix search over item names/references and order references/suppliers."""
+    return await session.run_sync(_search_entities, q, entity_type, limit)
+
+
+def _get_order(session: Session, order_id: int) -> OrderRead:
     order = session.get(Order, order_id)
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     return _serialize_order(session, order)
 
 
+@app.get("/orders/{order_id}", response_model=OrderRead)
+async def get_order(
+    order_id: int, session: AsyncSession = Depends(get_async_session), role: Role = Depends(get_current_role)
+) -> OrderRead:
+    return await session.run_sync(_get_order, order_id)
+
+
 def _assert_transition_allowed(current: OrderStatus, new_status: OrderStatus) -> None:
     transitions = {
         OrderStatus.REQUESTED: {OrderStatus.INTERNAL_APPROVAL},
@@ -365,24 +792,19 @@ def update_order_status(
         raise HTTPException(status_code=404, detail="Order not found")
 
     _assert_transition_allowed(order.status, payload.status)
+    rollups.record_orders(session, {(order.status, order.supplier_id): -1, (payload.status, order.supplier_id): 1})
     order.status = payload.status
     if payload.status == OrderStatus.SENT_TO_SUPPLIER and order.ordered_at is None:
         order.ordered_at = datetime.utcnow()
     if payload.status == OrderStatus.DELIVERED:
         order.expected_delivery_at = date.today()
 
-    session.add(
-        ActivityLog(
-            entity_type=ActivityEntity.ORDER,
-            entity_id=order.id,
-            action="status",
-            actor_user_id=0,
-            payload_json=json.dumps(payload.dict()),
-        )
-    )
+    activity.record(session, ActivityEntity.ORDER, order.id, "status", payload.json())
+    bump_versions(session, versions.ORDERS)
+    session.flush()
+    result = _serialize_order(session, order)
     session.commit()
-    session.refresh(order)
-    return _serialize_order(session, order)
+    return result
 
 
 @app.post("/orders/{order_id}/deliveries", response_model=OrderRead)
@@ -395,6 +817,10 @@ def register_delivery(
     order = session.get(Order, order_id)
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    if payload.serial_numbers and payload.item_id is None:
+        raise HTTPException(status_code=400, detail="item_id requis pour créer des numéros de série")
+    if payload.item_id is not None and session.get(Item, payload.item_id) is None:
+        raise HTTPException(status_code=404, detail="Item not found")
 
     delivery = Delivery(order_id=order_id, delivery_note_ref=payload.delivery_note_ref, delivered_at=payload.delivered_at or date.today())
     session.add(delivery)
@@ -403,9 +829,6 @@ def register_delivery(
     warranty_start = payload.delivered_at or date.today()
     warranty_end = warranty_start + timedelta(days=payload.warranty_duration_days or 365)
 
-    if payload.serial_numbers and payload.item_id is None:
-        raise HTTPException(status_code=400, detail="item_id requis pour créer des numéros de série")
-
     for serial_number in payload.serial_numbers:
         serial = Serial(
             item_id=payload.item_id,
@@ -419,19 +842,75 @@ def register_delivery(
             status=SerialStatus.IN_STOCK,
         )
         session.add(serial)
+    if payload.serial_numbers:
+        move_stock(session, payload.item_id, None, SerialStatus.IN_STOCK, len(payload.serial_numbers))
+        warranties.record_warranties(session, {(payload.item_id, warranty_end): len(payload.serial_numbers)})
+        open_delivery_warranty_alerts(session, delivery.id, warranty_end, date.today())
+
+    activity.record(session, ActivityEntity.ORDER, order_id, "delivery", payload.json())
+    bump_versions(session, versions.ORDERS, versions.SERIALS)
+    result = _serialize_order(session, order)
+    session.commit()
+    return result
 
-    session.add(
-        ActivityLog(
-            entity_type=ActivityEntity.ORDER,
-            entity_id=order_id,
-            action="delivery",
-            actor_user_id=0,
-            payload_json=json.dumps(payload.dict()),
-        )
+
+@app.post("/orders/{order_id}/deliveries/import", response_model=DeliveryImportResult, status_code=status.HTTP_201_CREATED)
+def import_delivery(
+    order_id: int,
+    serials: UploadFile = File(..., description="CSV (avec en-tête) ou NDJSON : serial_number, item_id, purchase_price"),
+    item_id: int | None = Form(default=None),
+    delivery_note_ref: str | None = Form(default=None),
+    delivered_at: date | None = Form(default=None),
+    purchase_price: float | None = Form(default=None),
+    warranty_duration_days: int | None = Form(default=None),
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.STOREKEEPER)),
+) -> DeliveryImportResult:
+    order = session.get(Order, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    delivery = Delivery(order_id=order_id, delivery_note_ref=delivery_note_ref, delivered_at=delivered_at or date.today())
+    session.add(delivery)
+    session.flush()
+
+    importer = DeliveryImporter(
+        session,
+        order,
+        delivery,
+        default_item_id=item_id,
+        default_purchase_price=purchase_price,
+        warranty_duration_days=warranty_duration_days,
+    )
+    counts = importer.run(read_rows(serials.file, detect_format(serials.filename, serials.content_type)))
+    for counted_item_id, count in counts.items():
+        move_stock(session, counted_item_id, None, SerialStatus.IN_STOCK, count)
+    warranties.record_warranties(
+        session, {(counted_item_id, importer.warranty_end): count for counted_item_id, count in counts.items()}
+    )
+    open_delivery_warranty_alerts(session, delivery.id, importer.warranty_end, date.today())
+
+    activity.record(
+        session,
+        ActivityEntity.ORDER,
+        order_id,
+        "delivery",
+        json.dumps(
+            {
+                "delivery_id": delivery.id,
+                "delivery_note_ref": delivery_note_ref,
+                "items": {str(key): value for key, value in counts.items()},
+            }
+        ),
+    )
+    bump_versions(session, versions.ORDERS, versions.SERIALS)
+    result = DeliveryImportResult(
+        delivery_id=delivery.id,
+        created=sum(counts.values()),
+        items=[DeliveryImportLine(item_id=key, count=value) for key, value in counts.items()],
     )
     session.commit()
-    session.refresh(order)
-    return _serialize_order(session, order)
+    return result
 
 
 @app.post("/assignments", response_model=AssignmentRead, status_code=status.HTTP_201_CREATED)
@@ -459,21 +938,158 @@ def assign_serial(
     )
     serial.status = SerialStatus.ASSIGNED
     serial.current_assignee_user_id = user.id
+    move_stock(session, serial.item_id, SerialStatus.IN_STOCK, SerialStatus.ASSIGNED)
+    rollups.record_assignments(session, {user.department: 1})
 
     session.add(assignment)
     session.add(serial)
-    session.add(
-        ActivityLog(
-            entity_type=ActivityEntity.ASSIGNMENT,
-            entity_id=serial.id,
-            action="assign",
-            actor_user_id=0,
-            payload_json=json.dumps(payload.dict()),
-        )
-    )
+    activity.record(session, ActivityEntity.ASSIGNMENT, serial.id, "assign", payload.json())
+    bump_versions(session, versions.ASSIGNMENTS, versions.SERIALS)
+    session.flush()
+    result = AssignmentRead.from_orm(assignment)
     session.commit()
-    session.refresh(assignment)
-    return AssignmentRead.from_orm(assignment)
+    return result
+
+
+def _batch_response(results: List[AssignmentBatchResult]) -> AssignmentBatchResponse:
+    succeeded = sum(1 for result in results if result.ok)
+    return AssignmentBatchResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+
+@app.post("/assignments/batch", response_model=AssignmentBatchResponse)
+def assign_serials_batch(
+    payload: AssignmentBatchCreate,
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.STOREKEEPER)),
+) -> AssignmentBatchResponse:
+    """Assign many serials in one transaction.
+
+    Rows that fail validation are reported in ``results`` and skipped; the
+    valid ones are applied with set-based updates.
+    """
+    rows = payload.assignments
+    serials = {
+        serial_id: (item_id, serial_status)
+        for serial_id, item_id, serial_status in session.exec(
+            select(Serial.id, Serial.item_id, Serial.status).where(Serial.id.in_({row.serial_id for row in rows}))
+        ).all()
+    }
+    departments = dict(
+        session.exec(select(User.id, User.department).where(User.id.in_({row.assignee_user_id for row in rows}))).all()
+    )
+
+    results: List[AssignmentBatchResult] = []
+    accepted: List[tuple[int, AssignmentCreate, dict]] = []
+    claimed: set[int] = set()
+    for row in rows:
+        detail = None
+        if row.serial_id not in serials:
+            detail = "Serial not found"
+        elif serials[row.serial_id][1] != SerialStatus.IN_STOCK or row.serial_id in claimed:
+            detail = "Le numéro de série n'est pas disponible"
+        elif row.assignee_user_id not in departments:
+            detail = "Utilisateur introuvable"
+        if detail:
+            results.append(AssignmentBatchResult(ok=False, serial_id=row.serial_id, detail=detail))
+            continue
+        claimed.add(row.serial_id)
+        values = {
+            "serial_id": row.serial_id,
+            "assignee_user_id": row.assignee_user_id,
+            "start_date": row.start_date or date.today(),
+            "expected_return_date": row.expected_return_date,
+            "end_date": None,
+            "document_file_id": None,
+            "notes": row.notes,
+        }
+        accepted.append((len(results), row, values))
+        results.append(AssignmentBatchResult(ok=True, serial_id=row.serial_id))
+
+    if accepted:
+        # One multi-row INSERT; ids are matched back through the (unique) serial ids.
+        assignment_ids = dict(
+            session.execute(
+                insert(Assignment).returning(Assignment.serial_id, Assignment.id),
+                [values for _, _, values in accepted],
+            ).all()
+        )
+        assignees = {row.serial_id: row.assignee_user_id for _, row, _ in accepted}
+        updated = session.execute(
+            update(Serial)
+            .where(Serial.id.in_(list(assignees)), Serial.status == SerialStatus.IN_STOCK)
+            .values(status=SerialStatus.ASSIGNED, current_assignee_user_id=case(assignees, value=Serial.id))
+        )
+        if updated.rowcount != len(assignees):
+            raise HTTPException(status_code=409, detail="Numéros de série modifiés pendant l'attribution")
+        moves: Dict[tuple, int] = defaultdict(int)
+        for serial_id in assignees:
+            moves[(serials[serial_id][0], SerialStatus.IN_STOCK, SerialStatus.ASSIGNED)] += 1
+        move_stock_batch(session, moves)
+        rollups.record_assignments(session, Counter(departments[user_id] for user_id in assignees.values()))
+        for _, row, _ in accepted:
+            activity.record(session, ActivityEntity.ASSIGNMENT, row.serial_id, "assign", row.json())
+        for index, row, values in accepted:
+            results[index].assignment_id = assignment_ids[row.serial_id]
+            results[index].assignment = AssignmentRead(id=assignment_ids[row.serial_id], **values)
+        bump_versions(session, versions.ASSIGNMENTS, versions.SERIALS)
+        session.commit()
+    return _batch_response(results)
+
+
+@app.post("/assignments/batch/return", response_model=AssignmentBatchResponse)
+def close_assignments_batch(
+    payload: AssignmentBatchReturn,
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.STOREKEEPER)),
+) -> AssignmentBatchResponse:
+    assignments: Dict[int, Assignment] = {}
+    departments: Dict[int, str | None] = {}
+    for assignment, department in session.exec(
+        select(Assignment, User.department)
+        .join(User, User.id == Assignment.assignee_user_id)
+        .where(Assignment.id.in_(set(payload.assignment_ids)))
+    ).all():
+        assignments[assignment.id] = assignment
+        departments[assignment.id] = department
+    today = date.today()
+    results: List[AssignmentBatchResult] = []
+    closing: Dict[int, Assignment] = {}
+    for assignment_id in payload.assignment_ids:
+        assignment = assignments.get(assignment_id)
+        if assignment is None:
+            results.append(AssignmentBatchResult(ok=False, assignment_id=assignment_id, detail="Assignment not found"))
+            continue
+        read = AssignmentRead.from_orm(assignment)
+        if assignment.end_date is None:
+            closing[assignment_id] = assignment
+            read = read.copy(update={"end_date": today})
+        results.append(AssignmentBatchResult(ok=True, serial_id=assignment.serial_id, assignment_id=assignment_id, assignment=read))
+
+    if closing:
+        serial_ids = {assignment.serial_id for assignment in closing.values()}
+        moves: Dict[tuple[int, SerialStatus], int] = defaultdict(int)
+        for item_id, serial_status in session.exec(
+            select(Serial.item_id, Serial.status).where(Serial.id.in_(serial_ids))
+        ).all():
+            moves[(item_id, serial_status)] += 1
+        session.execute(
+            update(Assignment)
+            .where(Assignment.id.in_(list(closing)), Assignment.end_date.is_(None))
+            .values(end_date=today)
+        )
+        session.execute(
+            update(Serial).where(Serial.id.in_(serial_ids)).values(status=SerialStatus.IN_STOCK, current_assignee_user_id=None)
+        )
+        move_stock_batch(session, {(item_id, serial_status, SerialStatus.IN_STOCK): count for (item_id, serial_status), count in moves.items()})
+        returned = Counter(departments[assignment_id] for assignment_id in closing)
+        rollups.record_assignments(session, {department: -count for department, count in returned.items()})
+        for assignment_id, assignment in closing.items():
+            activity.record(
+                session, ActivityEntity.ASSIGNMENT, assignment.serial_id, "return", json.dumps({"assignment_id": assignment_id})
+            )
+        bump_versions(session, versions.ASSIGNMENTS, versions.SERIALS)
+        session.commit()
+    return _batch_response(results)
 
 
 @app.post("/assignments/{assignment_id}/return", response_model=AssignmentRead)
@@ -489,47 +1105,104 @@ def close_assignment(
         return AssignmentRead.from_orm(assignment)
 
     assignment.end_date = date.today()
+    rollups.record_assignments(session, {assignment.assignee.department: -1})
     serial = session.get(Serial, assignment.serial_id)
     if serial:
+        move_stock(session, serial.item_id, serial.status, SerialStatus.IN_STOCK)
         serial.status = SerialStatus.IN_STOCK
         serial.current_assignee_user_id = None
         session.add(serial)
 
-    session.add(
-        ActivityLog(
-            entity_type=ActivityEntity.ASSIGNMENT,
-            entity_id=assignment.serial_id,
-            action="return",
-            actor_user_id=0,
-            payload_json=json.dumps({"assignment_id": assignment_id}),
-        )
-    )
+    activity.record(session, ActivityEntity.ASSIGNMENT, assignment.serial_id, "return", json.dumps({"assignment_id": assignment_id}))
+    bump_versions(session, versions.ASSIGNMENTS, versions.SERIALS)
+    session.flush()
+    result = AssignmentRead.from_orm(assignment)
     session.commit()
-    session.refresh(assignment)
-    return AssignmentRead.from_orm(assignment)
+    return result
 
 
-@app.get("/assignments", response_model=List[AssignmentRead])
-def list_assignments(
-    user_id: int | None = Query(default=None),
-    active_only: bool = Query(default=False),
-    session: Session = Depends(get_session),
-    role: Role = Depends(get_current_role),
-) -> List[AssignmentRead]:
-    query = select(Assignment)
+def _filter_assignments(query, user_id: int | None, active_only: bool):
     if user_id:
         query = query.where(Assignment.assignee_user_id == user_id)
     if active_only:
         query = query.where(Assignment.end_date.is_(None))
-    assignments = session.exec(query.order_by(Assignment.start_date.desc())).all()
-    return [AssignmentRead.from_orm(assignment) for assignment in assignments]
+    return query
+
+
+def _list_assignments(session: Session, user_id: int | None, active_only: bool, page: PageParams) -> Response:
+    query = _filter_assignments(select(*schema_columns(AssignmentRead, Assignment)), user_id, active_only)
+    assignments, next_cursor = paginate(
+        session, query, page, sort_column=Assignment.start_date, id_column=Assignment.id, descending=True
+    )
+    return page_response(assignments, next_cursor)
+
+
+@app.get("/assignments", response_model=Page[AssignmentRead])
+async def list_assignments(
+    user_id: int | None = Query(default=None),
+    active_only: bool = Query(default=False),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Response:
+    return await session.run_sync(_list_assignments, user_id, active_only, page)
+
+
+ASSIGNMENT_EXPORT_HEADER = [
+    "id",
+    "serie_id",
+    "numero_serie",
+    "article",
+    "attributaire_id",
+    "attributaire",
+    "service",
+    "debut",
+    "retour_prevu",
+    "fin",
+    "notes",
+]
+
+
+@app.get(
+    "/assignments/export",
+    dependencies=[Depends(conditional_get(versions.ASSIGNMENTS, versions.SERIALS, versions.USERS))],
+)
+def export_assignments(
+    response: Response,
+    fmt: ExportFormat = Query(default=ExportFormat.CSV, alias="format"),
+    user_id: int | None = Query(default=None),
+    active_only: bool = Query(default=False),
+    role: Role = Depends(get_current_role),
+) -> StreamingResponse:
+    """Every assignment matching the filters of ``GET /assignments``, streamed in id order."""
+    query = (
+        select(
+            Assignment.id,
+            Assignment.serial_id,
+            Serial.serial_number,
+            Item.name,
+            Assignment.assignee_user_id,
+            User.display_name,
+            User.department,
+            Assignment.start_date,
+            Assignment.expected_return_date,
+            Assignment.end_date,
+            Assignment.notes,
+        )
+        .join(Serial, Serial.id == Assignment.serial_id)
+        .join(Item, Item.id == Serial.item_id)
+        .join(User, User.id == Assignment.assignee_user_id)
+        .order_by(Assignment.id)
+    )
+    query = _filter_assignments(query, user_id, active_only)
+    return export_response(fmt, "assignments", ASSIGNMENT_EXPORT_HEADER, query_rows(query), dict(response.headers))
 
 
 def _widget_stock_by_category(session: Session) -> DashboardWidget:
     rows = session.exec(
-        select(Item.category, func.count(Serial.id))
-        .join(Serial, Serial.item_id == Item.id)
-        .where(Serial.status == SerialStatus.IN_STOCK)
+        select(Item.category, func.sum(ItemStock.count))
+        .join(ItemStock, ItemStock.item_id == Item.id)
+        .where(ItemStock.status == SerialStatus.IN_STOCK, ItemStock.count > 0)
         .group_by(Item.category)
     ).all()
     data = {category or "Non défini": count for category, count in rows}
@@ -548,17 +1221,26 @@ def _widget_pending_deliveries(session: Session) -> DashboardWidget:
     )
 
 
+WARRANTY_WIDGET_DAYS = 90
+WARRANTY_WIDGET_SAMPLES = 10
+
+
 def _widget_warranty(session: Session) -> DashboardWidget:
-    upcoming = date.today() + timedelta(days=90)
-    rows = session.exec(
-        select(Serial.serial_number, Serial.warranty_end)
-        .where(Serial.warranty_end.is_not(None), Serial.warranty_end <= upcoming)
-        .order_by(Serial.warranty_end)
-    ).all()
+    today = date.today()
+    end = today + timedelta(days=WARRANTY_WIDGET_DAYS)
+    buckets = warranties.bucket_counts(session, today, end, WarrantyGranularity.WEEK)
+    samples = warranties.samples(session, today, end, WARRANTY_WIDGET_SAMPLES)
     return DashboardWidget(
         key="warranties",
         title="Garanties à échéance",
-        data={"count": len(rows), "serials": rows},
+        data={
+            "count": sum(count for _, _, _, count in buckets),
+            "weeks": [{"week": start.isoformat(), "count": count} for start, _, _, count in buckets],
+            "serials": [
+                {"serial": sample.serial_number, "warranty_end": sample.warranty_end.isoformat()}
+                for sample in samples
+            ],
+        },
     )
 
 
@@ -589,56 +1271,355 @@ def _widget_stock_value(session: Session) -> DashboardWidget:
     return DashboardWidget(key="stock_value", title="Valeur de stock", data={"amount": float(total or 0)})
 
 
+ALERT_WIDGET_LIMIT = 10
+
+
 def _widget_alerts(session: Session) -> DashboardWidget:
-    items = session.exec(select(Item)).all()
-    stock_map = _calculate_stock(session, items)
-    alerts = []
-    for item in items:
-        threshold = item.low_stock_threshold or 0
-        if threshold and stock_map.get(item.id, 0) <= threshold:
-            alerts.append({"type": "stock", "item": item.name, "stock": stock_map.get(item.id, 0)})
-    expired = session.exec(
-        select(Serial.serial_number, Serial.warranty_end)
-        .where(Serial.warranty_end.is_not(None), Serial.warranty_end < date.today())
-    ).all()
-    for serial_number, warranty_end in expired:
-        alerts.append({"type": "warranty", "serial": serial_number, "ended": warranty_end.isoformat()})
-    return DashboardWidget(key="alerts", title="Alertes", data={"alerts": alerts})
+    return DashboardWidget(key="alerts", title="Alertes", data=alerts.summary(session, ALERT_WIDGET_LIMIT))
+
+
+DASHBOARD_WIDGETS: Dict[str, Callable[[Session], DashboardWidget]] = {
+    "stock_by_category": _widget_stock_by_category,
+    "pending_deliveries": _widget_pending_deliveries,
+    "warranties": _widget_warranty,
+    "assignments": _widget_recent_assignments,
+    "stock_value": _widget_stock_value,
+    "alerts": _widget_alerts,
+}
+DASHBOARD_SCOPES = (versions.ITEMS, versions.SERIALS, versions.ORDERS, versions.ASSIGNMENTS, versions.ALERTS)
+WIDGET_TIMEOUT_SECONDS = float(os.getenv("DASHBOARD_WIDGET_TIMEOUT", "10"))
+
+dashboard_cache = VersionedCache()
+
+
+async def _compute_widget(key: str) -> DashboardWidget | None:
+    async with async_session_scope() as session:
+        try:
+            return await asyncio.wait_for(session.run_sync(DASHBOARD_WIDGETS[key]), WIDGET_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+
+
+async def _load_widgets(keys: List[str], data_versions: Dict[str, int]) -> List[DashboardWidget]:
+    """Serve widgets from the cache and compute the missing ones concurrently.
+
+    ``data_versions`` are the ``DASHBOARD_SCOPES`` versions read by the
+    conditional GET dependency. Each widget runs on its own async session. A
+    widget that does not finish within ``WIDGET_TIMEOUT_SECONDS`` is returned
+    as an error tile (and not cached) instead of holding up the other ones.
+    """
+    # Warranty widgets depend on the current day as well as on the data.
+    generation = (date.today(), tuple(data_versions.items()))
+    widgets: Dict[str, DashboardWidget] = {}
+    for key in keys:
+        cached = dashboard_cache.get((key, generation))
+        if cached is not None:
+            widgets[key] = cached
+    missing = [key for key in keys if key not in widgets]
+    for key, widget in zip(missing, await asyncio.gather(*(_compute_widget(key) for key in missing))):
+        if widget is None:
+            widgets[key] = DashboardWidget(key=key, title=key, data={"error": "timeout"})
+            continue
+        dashboard_cache.set((key, generation), widget)
+        widgets[key] = widget
+    return [widgets[key] for key in keys]
 
 
 @app.get("/dashboard/widgets", response_model=DashboardResponse)
-def get_dashboard(session: Session = Depends(get_session), role: Role = Depends(get_current_role)) -> DashboardResponse:
-    widgets = [
-        _widget_stock_by_category(session),
-        _widget_pending_deliveries(session),
-        _widget_warranty(session),
-        _widget_recent_assignments(session),
-        _widget_stock_value(session),
-        _widget_alerts(session),
-    ]
-    return DashboardResponse(widgets=widgets)
+async def get_dashboard(
+    keys: str | None = Query(default=None, description="Clés de widgets séparées par des virgules"),
+    data_versions: Dict[str, int] = Depends(conditional_get(*DASHBOARD_SCOPES, daily=True)),
+) -> DashboardResponse:
+    selected = list(DASHBOARD_WIDGETS)
+    if keys:
+        selected = [key.strip() for key in keys.split(",") if key.strip()]
+        unknown = [key for key in selected if key not in DASHBOARD_WIDGETS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Widget inconnu : {', '.join(unknown)}")
+    return DashboardResponse(widgets=await _load_widgets(selected, data_versions))
+
+
+@app.get("/dashboard/widgets/{key}", response_model=DashboardWidget)
+async def get_dashboard_widget(
+    key: str, data_versions: Dict[str, int] = Depends(conditional_get(*DASHBOARD_SCOPES, daily=True))
+) -> DashboardWidget:
+    if key not in DASHBOARD_WIDGETS:
+        raise HTTPException(status_code=404, detail="Widget introuvable")
+    return (await _load_widgets([key], data_versions))[0]
+
+
+def _list_alerts(
+    session: Session, kind: AlertKind | None, acknowledged: bool | None, include_resolved: bool, page: PageParams
+) -> Page[AlertRead]:
+    query = alerts.alert_query()
+    if not include_resolved:
+        query = query.where(Alert.resolved_at.is_(None))
+    if kind:
+        query = query.where(Alert.kind == kind)
+    if acknowledged is True:
+        query = query.where(Alert.acknowledged_at.is_not(None))
+    if acknowledged is False:
+        query = query.where(Alert.acknowledged_at.is_(None))
+    rows, next_cursor = paginate(session, query, page, sort_column=Alert.opened_at, id_column=Alert.id, descending=True)
+    return Page[AlertRead](items=[AlertRead(**row._asdict()) for row in rows], next_cursor=next_cursor)
+
+
+@app.get(
+    "/alerts",
+    response_model=Page[AlertRead],
+    dependencies=[Depends(conditional_get(versions.ALERTS, versions.ITEMS, versions.SERIALS))],
+)
+async def list_alerts(
+    kind: AlertKind | None = Query(default=None),
+    acknowledged: bool | None = Query(default=None),
+    include_resolved: bool = Query(default=False),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Page[AlertRead]:
+    return await session.run_sync(_list_alerts, kind, acknowledged, include_resolved, page)
 
 
-@app.get("/reports/stock-by-site", response_model=ReportResponse)
-def report_stock_by_site(session: Session = Depends(get_session), role: Role = Depends(get_current_role)) -> ReportResponse:
-    rows = session.exec(
-        select(Item.site, func.count(Serial.id)).join(Serial, Serial.item_id == Item.id).where(Serial.status == SerialStatus.IN_STOCK).group_by(Item.site)
-    ).all()
-    return ReportResponse(title="Stock par site", rows=[ReportRow(key=site or "Non défini", value=count) for site, count in rows])
+@app.post("/alerts/{alert_id}/ack", response_model=AlertRead)
+def acknowledge_alert(
+    alert_id: int,
+    session: Session = Depends(get_session),
+    role: Role = Depends(require_roles(Role.ADMIN, Role.STOREKEEPER, Role.BUYER)),
+) -> AlertRead:
+    if not alerts.acknowledge(session, alert_id):
+        raise HTTPException(status_code=404, detail="Alerte introuvable")
+    result = AlertRead(**session.exec(alerts.alert_query(Alert.id == alert_id)).one()._asdict())
+    session.commit()
+    return result
+
+
+WARRANTY_CALENDAR_MAX_SAMPLES = 100
+
+
+def _warranty_calendar(
+    session: Session,
+    start: date,
+    end: date,
+    granularity: WarrantyGranularity,
+    group_by: str | None,
+    item_id: int | None,
+    site: str | None,
+    sample_count: int,
+) -> WarrantyCalendar:
+    buckets = warranties.bucket_counts(session, start, end, granularity, group_by, item_id, site)
+    samples = warranties.samples(session, start, end, sample_count, item_id, site)
+    return WarrantyCalendar(
+        start=start,
+        end=end,
+        granularity=granularity,
+        total=sum(count for _, _, _, count in buckets),
+        buckets=[
+            WarrantyBucketRead(period_start=period_start, key=key, label=label, count=count)
+            for period_start, key, label, count in buckets
+        ],
+        samples=[
+            WarrantySample(
+                serial_id=serial_id,
+                serial_number=serial_number,
+                item_id=sample_item_id,
+                item_name=item_name,
+                site=sample_site,
+                warranty_end=warranty_end,
+            )
+            for serial_id, serial_number, sample_item_id, item_name, sample_site, warranty_end in samples
+        ],
+    )
 
 
-@app.get("/reports/orders-by-status", response_model=ReportResponse)
-def report_orders_by_status(session: Session = Depends(get_session), role: Role = Depends(get_current_role)) -> ReportResponse:
-    rows = session.exec(select(Order.status, func.count(Order.id)).group_by(Order.status)).all()
-    return ReportResponse(title="Commandes par état", rows=[ReportRow(key=status.value, value=count) for status, count in rows])
+@app.get(
+    "/warranties/calendar",
+    response_model=WarrantyCalendar,
+    dependencies=[Depends(conditional_get(versions.SERIALS, versions.ITEMS))],
+)
+async def warranty_calendar(
+    start: date = Query(alias="from"),
+    end: date = Query(alias="to"),
+    granularity: WarrantyGranularity = Query(default=WarrantyGranularity.WEEK),
+    group_by: str | None = Query(default=None, pattern="^(item|site)$"),
+    item_id: int | None = Query(default=None),
+    site: str | None = Query(default=None),
+    samples: int = Query(default=10, ge=0, le=WARRANTY_CALENDAR_MAX_SAMPLES),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> WarrantyCalendar:
+    """Serials whose warranty ends in ``[from, to)``, counted per week or month.
+
+    Periods cut by ``from`` or ``to`` only count their part inside the window.
+    ``samples`` are the serials that expire first in the window.
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="« to » doit être postérieur à « from »")
+    return await session.run_sync(_warranty_calendar, start, end, granularity, group_by, item_id, site, samples)
+
+
+def _list_activity(
+    session: Session,
+    conditions: List,
+    start: datetime | None,
+    end: datetime | None,
+    page: PageParams,
+    headers: Dict[str, str],
+) -> Response:
+    query = select(*schema_columns(ActivityRead, ActivityLog)).where(*conditions)
+    if start:
+        query = query.where(ActivityLog.at >= start)
+    if end:
+        query = query.where(ActivityLog.at < end)
+    rows, next_cursor = paginate(session, query, page, sort_column=ActivityLog.at, id_column=ActivityLog.id, descending=True)
+    return page_response(rows, next_cursor, headers)
+
+
+@app.get("/activity", response_model=Page[ActivityRead], dependencies=[Depends(conditional_get(versions.ACTIVITY))])
+async def list_activity(
+    response: Response,
+    entity_type: ActivityEntity | None = Query(default=None),
+    action: str | None = Query(default=None),
+    start: datetime | None = Query(default=None, alias="from"),
+    end: datetime | None = Query(default=None, alias="to"),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Response:
+    """Activity log, newest first, within ``[from, to)``.
 
+    Entries are written in batches shortly after their transaction: a page
+    may miss entries of the last second.
+    """
+    conditions = []
+    if entity_type:
+        conditions.append(ActivityLog.entity_type == entity_type)
+    if action:
+        conditions.append(ActivityLog.action == action)
+    return await session.run_sync(_list_activity, conditions, start, end, page, dict(response.headers))
 
-@app.get("/reports/assignments-by-department", response_model=ReportResponse)
-def report_assignments_by_department(session: Session = Depends(get_session), role: Role = Depends(get_current_role)) -> ReportResponse:
-    rows = session.exec(
-        select(User.department, func.count(Assignment.id))
-        .join(Assignment, Assignment.assignee_user_id == User.id)
-        .where(Assignment.end_date.is_(None))
-        .group_by(User.department)
-    ).all()
-    return ReportResponse(title="Attributions actives par service", rows=[ReportRow(key=dept or "Non défini", value=count) for dept, count in rows])
+
+HISTORY_ENTITIES: Dict[str, tuple] = {
+    "items": (ActivityEntity.ITEM,),
+    "orders": (ActivityEntity.ORDER,),
+    # Assignments and returns are logged under the id of their serial.
+    "serials": (ActivityEntity.SERIAL, ActivityEntity.ASSIGNMENT),
+}
+
+
+@app.get(
+    "/{entity}/{entity_id}/history",
+    response_model=Page[ActivityRead],
+    dependencies=[Depends(conditional_get(versions.ACTIVITY))],
+)
+async def entity_history(
+    entity_id: int,
+    response: Response,
+    entity: str = Path(pattern=f"^({'|'.join(HISTORY_ENTITIES)})$"),
+    action: str | None = Query(default=None),
+    start: datetime | None = Query(default=None, alias="from"),
+    end: datetime | None = Query(default=None, alias="to"),
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+    role: Role = Depends(get_current_role),
+) -> Response:
+    """Activity of one item, order or serial, newest first."""
+    conditions = [ActivityLog.entity_type.in_(HISTORY_ENTITIES[entity]), ActivityLog.entity_id == entity_id]
+    if action:
+        conditions.append(ActivityLog.action == action)
+    return await session.run_sync(_list_activity, conditions, start, end, page, dict(response.headers))
+
+
+def _report(
+    report: ReportResponse, fmt: ExportFormat | None, filename: str, response: Response
+) -> ReportResponse | StreamingResponse:
+    if fmt is None:
+        return report
+    rows = ((row.key, row.value) for row in report.rows)
+    return export_response(fmt, filename, ["cle", "valeur"], rows, dict(response.headers))
+
+
+@app.get(
+    "/reports/stock-by-site",
+    response_model=ReportResponse,
+    dependencies=[Depends(conditional_get(versions.ITEMS, versions.SERIALS, versions.SNAPSHOTS))],
+)
+def report_stock_by_site(
+    response: Response,
+    as_of: date | None = Query(default=None, description="Stock à la fin de ce jour, lu dans les instantanés quotidiens"),
+    fmt: ExportFormat | None = Query(default=None, alias="format", description="Télécharger le rapport en CSV ou XLSX"),
+    session: Session = Depends(get_session),
+    role: Role = Depends(get_current_role),
+) -> ReportResponse | StreamingResponse:
+    if as_of is not None:
+        day = snapshots.snapshot_day(session, as_of)
+        if day is None:
+            raise HTTPException(status_code=404, detail="Aucun instantané de stock à cette date")
+        rows = snapshots.stock_by_site(session, day)
+        report = ReportResponse(
+            title="Stock par site", rows=[ReportRow(key=site or "Non défini", value=count) for site, count in rows], as_of=day
+        )
+        return _report(report, fmt, f"stock-by-site-{day.isoformat()}", response)
+    rows = rollups.stock_by_site(session)
+    report = ReportResponse(title="Stock par site", rows=[ReportRow(key=site or "Non défini", value=count) for site, count in rows])
+    return _report(report, fmt, "stock-by-site", response)
+
+
+STOCK_HISTORY_MAX_DAYS = 366
+
+
+@app.get("/reports/stock-history", response_model=StockHistory, dependencies=[Depends(conditional_get(versions.SNAPSHOTS))])
+def report_stock_history(
+    response: Response,
+    start: date = Query(alias="from"),
+    end: date = Query(alias="to"),
+    status_filter: SerialStatus = Query(default=SerialStatus.IN_STOCK, alias="status"),
+    group_by: str | None = Query(default=None, pattern="^site$"),
+    site: str | None = Query(default=None),
+    item_id: int | None = Query(default=None),
+    fmt: ExportFormat | None = Query(default=None, alias="format", description="Télécharger le rapport en CSV ou XLSX"),
+    session: Session = Depends(get_session),
+    role: Role = Depends(get_current_role),
+) -> StockHistory | StreamingResponse:
+    """Daily counts and purchase value from the stock snapshots of ``[from, to]``."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="« to » doit être postérieur à « from »")
+    if (end - start).days >= STOCK_HISTORY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Période limitée à {STOCK_HISTORY_MAX_DAYS} jours")
+    rows = snapshots.history(session, start, end, status_filter, group_by == "site", site, item_id)
+    if fmt is not None:
+        header = ["jour", "site", "nombre", "valeur"]
+        return export_response(fmt, f"stock-history-{start.isoformat()}-{end.isoformat()}", header, rows, dict(response.headers))
+    return StockHistory(
+        status=status_filter,
+        points=[StockHistoryPoint(day=day, site=row_site, count=count, value=value) for day, row_site, count, value in rows],
+    )
+
+
+@app.get("/reports/orders-by-status", response_model=ReportResponse, dependencies=[Depends(conditional_get(versions.ORDERS))])
+def report_orders_by_status(
+    response: Response,
+    fmt: ExportFormat | None = Query(default=None, alias="format", description="Télécharger le rapport en CSV ou XLSX"),
+    session: Session = Depends(get_session),
+    role: Role = Depends(get_current_role),
+) -> ReportResponse | StreamingResponse:
+    rows = rollups.orders_by_status(session)
+    report = ReportResponse(title="Commandes par état", rows=[ReportRow(key=status.value, value=count) for status, count in rows])
+    return _report(report, fmt, "orders-by-status", response)
+
+
+@app.get(
+    "/reports/assignments-by-department",
+    response_model=ReportResponse,
+    dependencies=[Depends(conditional_get(versions.ASSIGNMENTS, versions.USERS))],
+)
+def report_assignments_by_department(
+    response: Response,
+    fmt: ExportFormat | None = Query(default=None, alias="format", description="Télécharger le rapport en CSV ou XLSX"),
+    session: Session = Depends(get_session),
+    role: Role = Depends(get_current_role),
+) -> ReportResponse | StreamingResponse:
+    rows = rollups.assignments_by_department(session)
+    report = ReportResponse(
+        title="Attributions actives par service", rows=[ReportRow(key=dept or "Non défini", value=count) for dept, count in rows]
+    )
+    return _report(report, fmt, "assignments-by-department", response)
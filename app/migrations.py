@@ -0,0 +1,83 @@
+"""Idempotent schema upgrades for databases created by older versions.
+
+``SQLModel.metadata.create_all`` only creates missing tables; the steps
+below bring existing tables in line with the models. Each step checks the
+current schema first, so running them on every startup is safe.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+from .files import CHUNK_SIZE
+from .search import create_fts_table
+
+
+def _columns(connection: Connection, table: str) -> set[str]:
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+
+def _move_file_content_to_chunks(connection: Connection) -> None:
+    """Move bytes stored in the legacy ``files.content`` column to ``file_chunks``."""
+    if "content" not in _columns(connection, "files"):
+        return
+    file_ids = connection.execute(text("SELECT id FROM files WHERE content IS NOT NULL")).scalars().all()
+    for file_id in file_ids:
+        content = connection.execute(text("SELECT content FROM files WHERE id = :id"), {"id": file_id}).scalar_one()
+        connection.execute(text("DELETE FROM file_chunks WHERE file_id = :id"), {"id": file_id})
+        for seq, offset in enumerate(range(0, len(content), CHUNK_SIZE)):
+            connection.execute(
+                text("INSERT INTO file_chunks (file_id, seq, data) VALUES (:file_id, :seq, :data)"),
+                {"file_id": file_id, "seq": seq, "data": content[offset : offset + CHUNK_SIZE]},
+            )
+        connection.execute(text("UPDATE files SET content = NULL WHERE id = :id"), {"id": file_id})
+
+
+def _add_file_checksums(connection: Connection) -> None:
+    """Add ``files.sha256`` and compute it for files stored before it existed."""
+    if "sha256" not in _columns(connection, "files"):
+        connection.execute(text("ALTER TABLE files ADD COLUMN sha256 VARCHAR"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_files_sha256 ON files (sha256)"))
+    file_ids = connection.execute(text("SELECT id FROM files WHERE sha256 IS NULL")).scalars().all()
+    for file_id in file_ids:
+        digest = hashlib.sha256()
+        chunks = connection.execute(
+            text("SELECT data FROM file_chunks WHERE file_id = :id ORDER BY seq"), {"id": file_id}
+        )
+        for (data,) in chunks:
+            digest.update(data)
+        connection.execute(
+            text("UPDATE files SET sha256 = :sha256 WHERE id = :id"), {"sha256": digest.hexdigest(), "id": file_id}
+        )
+
+
+def _add_file_storage(connection: Connection) -> None:
+    """Add ``files.storage``: files stored before the disk store keep their bytes in ``file_chunks``."""
+    if "storage" not in _columns(connection, "files"):
+        connection.execute(text("ALTER TABLE files ADD COLUMN storage VARCHAR NOT NULL DEFAULT 'database'"))
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    """Create indexes declared on the models but missing from existing tables."""
+    for model_table in SQLModel.metadata.sorted_tables:
+        for index in model_table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    _move_file_content_to_chunks,
+    _add_file_checksums,
+    _add_file_storage,
+    create_fts_table,
+    _create_missing_indexes,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    with engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
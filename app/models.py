@@ -2,7 +2,7 @@ from datetime import date, datetime
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import Column, LargeBinary
+from sqlalchemy import Column, Index, LargeBinary
 from sqlalchemy.orm import Mapped
 from sqlmodel import Field, Relationship, SQLModel
 
@@ -36,6 +36,16 @@ class ActivityEntity(str, Enum):
     ASSIGNMENT = "assignment"
 
 
+class AlertKind(str, Enum):
+    LOW_STOCK = "low_stock"
+    WARRANTY_EXPIRED = "warranty_expired"
+
+
+class WarrantyGranularity(str, Enum):
+    WEEK = "week"
+    MONTH = "month"
+
+
 class TimestampMixin(SQLModel):
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
@@ -66,6 +76,7 @@ class Supplier(SQLModel, table=True):
 
 class StoredFile(SQLModel, table=True):
     __tablename__ = "files"
+    __table_args__ = (Index("ix_files_entity_created", "entity_type", "entity_id", "created_at"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     entity_type: str = Field(index=True)
@@ -73,8 +84,29 @@ class StoredFile(SQLModel, table=True):
     filename: str
     mime: str
     size: int
+    sha256: Optional[str] = Field(default=None, index=True)
+    storage: str = Field(default="database", nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    content: bytes = Field(sa_column=Column(LargeBinary))
+
+
+class Blob(SQLModel, table=True):
+    """Content-addressed attachment bytes on disk, shared by identical files."""
+
+    __tablename__ = "blobs"
+
+    sha256: str = Field(primary_key=True)
+    size: int
+    refcount: int = Field(default=0, nullable=False)
+
+
+class FileChunk(SQLModel, table=True):
+    """Bytes of files stored in the database, kept out of ``files`` so metadata queries never read them."""
+
+    __tablename__ = "file_chunks"
+
+    file_id: int = Field(foreign_key="files.id", primary_key=True)
+    seq: int = Field(primary_key=True)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
 
 
 class Quote(SQLModel, table=True):
@@ -91,6 +123,11 @@ class Quote(SQLModel, table=True):
 
 
 class Order(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_order_ordered_at_id", "ordered_at", "id"),
+        Index("ix_order_supplier_ordered_at", "supplier_id", "ordered_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     quote_id: Optional[int] = Field(default=None, foreign_key="quote.id")
     supplier_id: int = Field(foreign_key="supplier.id")
@@ -107,7 +144,7 @@ class Order(SQLModel, table=True):
 
 class OrderLine(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    order_id: int = Field(foreign_key="order.id")
+    order_id: int = Field(foreign_key="order.id", index=True)
     item_id: int = Field(foreign_key="item.id")
     qty: int
     unit_price: float
@@ -128,6 +165,8 @@ class Delivery(SQLModel, table=True):
 
 
 class Item(SQLModel, table=True):
+    __table_args__ = (Index("ix_item_name_id", "name", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     category: str
@@ -135,7 +174,7 @@ class Item(SQLModel, table=True):
     default_supplier_id: Optional[int] = Field(default=None, foreign_key="supplier.id")
     default_unit_price: Optional[float] = None
     site: Optional[str] = None
-    low_stock_threshold: Optional[int] = Field(default=None)
+    low_stock_threshold: Optional[int] = Field(default=None, index=True)
     notes: Optional[str] = None
 
     order_lines: Mapped[list[OrderLine]] = Relationship(back_populates="item")
@@ -143,17 +182,23 @@ class Item(SQLModel, table=True):
 
 
 class Serial(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_serial_item_status", "item_id", "status"),
+        Index("ix_serial_delivery_date_id", "delivery_date", "id"),
+        Index("ix_serial_status_delivery_date", "status", "delivery_date", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     item_id: int = Field(foreign_key="item.id")
     serial_number: str = Field(index=True)
     delivery_id: Optional[int] = Field(default=None, foreign_key="delivery.id")
     delivery_date: Optional[date] = None
     warranty_start: Optional[date] = None
-    warranty_end: Optional[date] = None
+    warranty_end: Optional[date] = Field(default=None, index=True)
     supplier_id: Optional[int] = Field(default=None, foreign_key="supplier.id")
     purchase_price: Optional[float] = None
     status: SerialStatus = Field(default=SerialStatus.IN_STOCK)
-    current_assignee_user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    current_assignee_user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
 
     item: Mapped[Item] = Relationship(back_populates="serials")
     supplier: Mapped[Optional[Supplier]] = Relationship()
@@ -161,9 +206,25 @@ class Serial(SQLModel, table=True):
     assignments: Mapped[list["Assignment"]] = Relationship(back_populates="serial")
 
 
+class ItemStock(SQLModel, table=True):
+    """Number of serials per item and status, maintained by the write routes."""
+
+    __tablename__ = "item_stock"
+
+    item_id: int = Field(foreign_key="item.id", primary_key=True)
+    status: SerialStatus = Field(primary_key=True)
+    count: int = Field(default=0, nullable=False)
+
+
 class Assignment(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_assignment_end_date_assignee", "end_date", "assignee_user_id"),
+        Index("ix_assignment_start_date_id", "start_date", "id"),
+        Index("ix_assignment_assignee_start_date", "assignee_user_id", "start_date", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    serial_id: int = Field(foreign_key="serial.id")
+    serial_id: int = Field(foreign_key="serial.id", index=True)
     assignee_user_id: int = Field(foreign_key="user.id")
     start_date: date = Field(default_factory=date.today)
     expected_return_date: Optional[date] = None
@@ -175,7 +236,35 @@ class Assignment(SQLModel, table=True):
     assignee: Mapped[User] = Relationship(back_populates="assignments")
 
 
+class SearchTrigram(SQLModel, table=True):
+    """Trigram search index used when the database has no FTS5 support."""
+
+    __tablename__ = "search_trigram"
+
+    entity_type: str = Field(primary_key=True)
+    trigram: str = Field(primary_key=True)
+    entity_id: int = Field(primary_key=True)
+
+
+class ChangeVersion(SQLModel, table=True):
+    """Monotonic per-table write counter shared by every worker through the database."""
+
+    __tablename__ = "change_version"
+
+    scope: str = Field(primary_key=True)
+    version: int = Field(default=0, nullable=False)
+
+
 class ActivityLog(SQLModel, table=True):
+    # Each index ends with ``at`` (and the implicit rowid ``id``): the keyset
+    # order of the activity feeds.
+    __table_args__ = (
+        Index("ix_activitylog_entity_at", "entity_type", "entity_id", "at"),
+        Index("ix_activitylog_at", "at"),
+        Index("ix_activitylog_entity_type_at", "entity_type", "at"),
+        Index("ix_activitylog_action_at", "action", "at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     entity_type: ActivityEntity
     entity_id: int
@@ -184,3 +273,127 @@ class ActivityLog(SQLModel, table=True):
     at: datetime = Field(default_factory=datetime.utcnow)
     payload_json: Optional[str] = None
 
+
+class ActivitySpool(SQLModel, table=True):
+    """Last spool batch of each activity writer stream written to ``activitylog``.
+
+    Recorded in the same transaction as the batch, so a batch replayed after a
+    crash between that commit and the removal of its file is skipped.
+    """
+
+    __tablename__ = "activity_spool"
+
+    stream: str = Field(primary_key=True)
+    last_batch: int = Field(default=0, nullable=False)
+
+
+class ActivityPending(SQLModel, table=True):
+    """Transactions whose activity entries are spooled but not yet in ``activitylog``.
+
+    The token is inserted by the business transaction itself and deleted with
+    the insertion of its entries: a spooled entry whose token is missing
+    belongs to a transaction that never committed, or was already written.
+    """
+
+    __tablename__ = "activity_pending"
+
+    token: str = Field(primary_key=True)
+
+
+class Alert(SQLModel, table=True):
+    """Alert kept up to date by the stock writes and the daily warranty sweep.
+
+    An alert stays open until ``resolved_at`` is set (stock back above the
+    threshold, serial retired); acknowledging it only hides it from the
+    dashboard.
+    """
+
+    __table_args__ = (
+        Index("ix_alert_open", "resolved_at", "opened_at", "id"),
+        Index("ix_alert_opened_at_id", "opened_at", "id"),
+        Index("ix_alert_item_kind", "item_id", "kind", "resolved_at"),
+        Index("ix_alert_serial_kind", "serial_id", "kind"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: AlertKind
+    item_id: int = Field(foreign_key="item.id")
+    serial_id: Optional[int] = Field(default=None, foreign_key="serial.id")
+    opened_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    acknowledged_at: Optional[datetime] = None
+    resolved_at: Optional[datetime] = None
+
+
+class JobRun(SQLModel, table=True):
+    """Last day each daily job ran, shared by every worker through the database."""
+
+    __tablename__ = "job_run"
+
+    name: str = Field(primary_key=True)
+    last_run_on: date
+    finished_at: Optional[datetime] = None
+
+
+class WarrantyBucket(SQLModel, table=True):
+    """Non-retired serials of an item whose warranty ends in a given week or month.
+
+    ``period_start`` is the Monday of the week or the first day of the month.
+    """
+
+    __tablename__ = "warranty_bucket"
+
+    granularity: WarrantyGranularity = Field(primary_key=True)
+    period_start: date = Field(primary_key=True)
+    item_id: int = Field(foreign_key="item.id", primary_key=True)
+    count: int = Field(default=0, nullable=False)
+
+
+class StockSnapshot(SQLModel, table=True):
+    """Serials of an item per status at the end of ``day``, written by the daily snapshot job.
+
+    ``site`` is the item's site when the snapshot was taken, so history keeps
+    counting a moved item where it was.
+    """
+
+    __tablename__ = "stock_snapshot"
+    __table_args__ = (Index("ix_stock_snapshot_status_day", "status", "day", "site"),)
+
+    day: date = Field(primary_key=True)
+    item_id: int = Field(foreign_key="item.id", primary_key=True)
+    status: SerialStatus = Field(primary_key=True)
+    site: Optional[str] = None
+    count: int = Field(default=0, nullable=False)
+    value: float = Field(default=0, nullable=False)
+
+
+class StockRollup(SQLModel, table=True):
+    """Serials per status, site and category, maintained with ``item_stock``.
+
+    An item without site is counted under ``site = ""``.
+    """
+
+    __tablename__ = "stock_rollup"
+
+    status: SerialStatus = Field(primary_key=True)
+    site: str = Field(default="", primary_key=True)
+    category: str = Field(primary_key=True)
+    count: int = Field(default=0, nullable=False)
+
+
+class OrderRollup(SQLModel, table=True):
+    """Orders per status and supplier, maintained by the order write routes."""
+
+    __tablename__ = "order_rollup"
+
+    status: OrderStatus = Field(primary_key=True)
+    supplier_id: int = Field(foreign_key="supplier.id", primary_key=True)
+    count: int = Field(default=0, nullable=False)
+
+
+class DepartmentRollup(SQLModel, table=True):
+    """Active assignments per department of the assignee (``""`` without department)."""
+
+    __tablename__ = "department_rollup"
+
+    department: str = Field(primary_key=True)
+    count: int = Field(default=0, nullable=False)
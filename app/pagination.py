@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_
+from sqlmodel import Session
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PageParams:
+    """Query parameters shared by every paginated list endpoint."""
+
+    def __init__(
+        self,
+        limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str | None = Query(default=None),
+    ) -> None:
+        self.limit = limit
+        self.cursor = cursor
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column: Any, value: Any) -> Any:
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:  # custom types such as AutoString
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor shape")
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Curseur invalide") from exc
+
+
+def _nullable(column: Any) -> bool:
+    return getattr(getattr(column, "expression", column), "nullable", True)
+
+
+def keyset_order(sort_column: Any, id_column: Any, descending: bool) -> Tuple[Any, ...]:
+    """ORDER BY clause matching :func:`keyset_filter` (NULL sort keys always come last)."""
+    if sort_column is None:
+        return (id_column.desc() if descending else id_column.asc(),)
+    if descending:
+        return (sort_column.desc().nullslast(), id_column.desc())
+    return (sort_column.asc().nullslast(), id_column.asc())
+
+
+def keyset_filter(sort_column: Any, id_column: Any, descending: bool, values: Sequence[Any]) -> Any:
+    """WHERE clause selecting the rows strictly after ``values`` in keyset order."""
+    if sort_column is None:
+        (last_id,) = values
+        return id_column < last_id if descending else id_column > last_id
+    last_value, last_id = values
+    after_id = id_column < last_id if descending else id_column > last_id
+    if last_value is None:
+        return and_(sort_column.is_(None), after_id)
+    after_value = sort_column < last_value if descending else sort_column > last_value
+    if not _nullable(sort_column):
+        # Without the IS NULL branch SQLite turns the filter into an index range.
+        return or_(after_value, and_(sort_column == last_value, after_id))
+    return or_(after_value, and_(sort_column == last_value, after_id), sort_column.is_(None))
+
+
+def paginate(
+    session: Session,
+    query: Any,
+    page: PageParams,
+    *,
+    id_column: Any,
+    sort_column: Any = None,
+    descending: bool = False,
+) -> Tuple[List[Any], Optional[str]]:
+    """Run ``query`` one keyset page at a time.
+
+    Rows are ordered by ``sort_column`` then ``id_column`` as a tiebreaker, so
+    fetching a deep page costs the same as the first one. Returns the rows and
+    the opaque cursor of the next page (``None`` on the last page).
+    """
+    columns = [id_column] if sort_column is None else [sort_column, id_column]
+    if page.cursor:
+        query = query.where(keyset_filter(sort_column, id_column, descending, decode_cursor(page.cursor, columns)))
+    query = query.order_by(*keyset_order(sort_column, id_column, descending)).limit(page.limit + 1)
+    rows = list(session.exec(query).all())
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[: page.limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in columns])
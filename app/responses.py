@@ -0,0 +1,58 @@
+"""Fast JSON path for the large list endpoints.
+
+A route opting in selects only the columns of its read schema and returns
+a :class:`FastJSONResponse` built from the result rows: no model instance is
+created per row and FastAPI does not validate the payload against the
+``response_model`` again (the route keeps it for the OpenAPI schema).
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, List, Mapping, Optional, Sequence, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"{type(value).__name__} n'est pas sérialisable en JSON")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` like FastAPI would (ISO dates, enum values)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(schema: Type[BaseModel], model: Any) -> List[Any]:
+    """Columns of ``model`` named like the fields of ``schema``, in field order."""
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def page_response(
+    rows: Sequence[Any], next_cursor: Optional[str], headers: Optional[Mapping[str, str]] = None
+) -> FastJSONResponse:
+    """``Page`` payload of rows selected with :func:`schema_columns`.
+
+    A returned response bypasses the headers that dependencies set on the
+    injected ``Response`` (ETag): routes pass them as ``headers``.
+    """
+    return FastJSONResponse({"items": [row._asdict() for row in rows], "next_cursor": next_cursor}, headers=headers)
@@ -0,0 +1,245 @@
+"""Report rollups.
+
+Three counter tables back the aggregate reports:
+
+- ``stock_rollup``: serials per (status, site, category), moved along with
+  ``item_stock`` by :mod:`app.stock`;
+- ``order_rollup``: orders per (status, supplier);
+- ``department_rollup``: active assignments per assignee department.
+
+The write routes add their deltas in the same transaction as the rows they
+count, so a report reads a few rows of one primary key instead of grouping
+the base tables. The daily ``rollups`` job checks every rollup against the
+base tables and rebuilds the ones that drifted (a department changed in the
+database, a manual fix); ``python -m app.rollups rebuild|verify`` does the
+same on demand.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, func, select
+
+from . import versions
+from .counters import add_to_counters
+from .models import (
+    Assignment,
+    DepartmentRollup,
+    Item,
+    Order,
+    OrderRollup,
+    OrderStatus,
+    Serial,
+    SerialStatus,
+    StockRollup,
+    User,
+)
+from .versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RollupDrift:
+    table: str
+    key: Tuple[Any, ...]
+    expected: int
+    actual: int
+
+
+def record_stock(session: Session, deltas: Dict[Tuple[int, SerialStatus], int]) -> None:
+    """Add per-item ``(item_id, status)`` serial deltas to the site rollup."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    items = {
+        item_id: (site or "", category)
+        for item_id, site, category in session.exec(
+            select(Item.id, Item.site, Item.category).where(Item.id.in_({item_id for item_id, _ in deltas}))
+        ).all()
+    }
+    counts: Dict[Tuple[SerialStatus, str, str], int] = defaultdict(int)
+    for (item_id, status), delta in deltas.items():
+        if item_id not in items:
+            # Counted nowhere, like in the reconciliation that joins the items.
+            logger.warning("Matériel %s introuvable : mouvement de stock absent de stock_rollup", item_id)
+            continue
+        counts[(status, *items[item_id])] += delta
+    rows = [
+        {"status": status, "site": site, "category": category, "count": count}
+        for (status, site, category), count in counts.items()
+        if count
+    ]
+    add_to_counters(session, StockRollup, ("status", "site", "category"), rows)
+
+
+def record_orders(session: Session, deltas: Dict[Tuple[OrderStatus, int], int]) -> None:
+    """Add ``(status, supplier_id)`` order deltas to the order rollup."""
+    rows = [
+        {"status": status, "supplier_id": supplier_id, "count": count}
+        for (status, supplier_id), count in deltas.items()
+        if count
+    ]
+    if rows:
+        add_to_counters(session, OrderRollup, ("status", "supplier_id"), rows)
+
+
+def record_assignments(session: Session, deltas: Dict[Optional[str], int]) -> None:
+    """Add active assignment deltas, keyed by the assignee's department, to the department rollup."""
+    counts: Dict[str, int] = defaultdict(int)
+    for department, delta in deltas.items():
+        counts[department or ""] += delta
+    rows = [{"department": department, "count": count} for department, count in counts.items() if count]
+    if rows:
+        add_to_counters(session, DepartmentRollup, ("department",), rows)
+
+
+def stock_by_site(session: Session, status: SerialStatus = SerialStatus.IN_STOCK) -> List[Tuple[str, int]]:
+    return session.exec(
+        select(StockRollup.site, func.sum(StockRollup.count))
+        .where(StockRollup.status == status, StockRollup.count > 0)
+        .group_by(StockRollup.site)
+    ).all()
+
+
+def orders_by_status(session: Session) -> List[Tuple[OrderStatus, int]]:
+    return session.exec(
+        select(OrderRollup.status, func.sum(OrderRollup.count))
+        .where(OrderRollup.count > 0)
+        .group_by(OrderRollup.status)
+    ).all()
+
+
+def assignments_by_department(session: Session) -> List[Tuple[str, int]]:
+    return session.exec(
+        select(DepartmentRollup.department, DepartmentRollup.count).where(DepartmentRollup.count > 0)
+    ).all()
+
+
+def _actual_stock(session: Session) -> Dict[Tuple[Any, ...], int]:
+    site = func.coalesce(Item.site, "")
+    rows = session.exec(
+        select(Serial.status, site, Item.category, func.count(Serial.id))
+        .join(Item, Item.id == Serial.item_id)
+        .group_by(Serial.status, site, Item.category)
+    ).all()
+    return {(status, row_site, category): count for status, row_site, category, count in rows}
+
+
+def _actual_orders(session: Session) -> Dict[Tuple[Any, ...], int]:
+    rows = session.exec(
+        select(Order.status, Order.supplier_id, func.count(Order.id)).group_by(Order.status, Order.supplier_id)
+    ).all()
+    return {(status, supplier_id): count for status, supplier_id, count in rows}
+
+
+def _actual_departments(session: Session) -> Dict[Tuple[Any, ...], int]:
+    department = func.coalesce(User.department, "")
+    rows = session.exec(
+        select(department, func.count(Assignment.id))
+        .join(Assignment, Assignment.assignee_user_id == User.id)
+        .where(Assignment.end_date.is_(None))
+        .group_by(department)
+    ).all()
+    return {(row_department,): count for row_department, count in rows}
+
+
+@dataclass(frozen=True)
+class _Rollup:
+    model: Any
+    keys: Tuple[str, ...]
+    scope: str
+    actual: Callable[[Session], Dict[Tuple[Any, ...], int]]
+
+    @property
+    def table(self) -> str:
+        return self.model.__tablename__
+
+
+ROLLUPS = (
+    _Rollup(StockRollup, ("status", "site", "category"), versions.SERIALS, _actual_stock),
+    _Rollup(OrderRollup, ("status", "supplier_id"), versions.ORDERS, _actual_orders),
+    _Rollup(DepartmentRollup, ("department",), versions.ASSIGNMENTS, _actual_departments),
+)
+
+
+def _rebuild(session: Session, rollup: _Rollup) -> None:
+    session.execute(delete(rollup.model))
+    rows = [{**dict(zip(rollup.keys, key)), "count": count} for key, count in rollup.actual(session).items()]
+    if rows:
+        session.execute(insert(rollup.model), rows)
+
+
+def _verify(session: Session, rollup: _Rollup) -> List[RollupDrift]:
+    expected = rollup.actual(session)
+    columns = [getattr(rollup.model, key) for key in rollup.keys]
+    stored = {tuple(row[:-1]): row[-1] for row in session.exec(select(*columns, rollup.model.count)).all()}
+    return [
+        RollupDrift(table=rollup.table, key=key, expected=expected.get(key, 0), actual=stored.get(key, 0))
+        for key in sorted(set(expected) | set(stored), key=str)
+        if expected.get(key, 0) != stored.get(key, 0)
+    ]
+
+
+def rebuild_rollups(session: Session) -> None:
+    """Recompute every rollup from the base tables (does not commit)."""
+    for rollup in ROLLUPS:
+        _rebuild(session, rollup)
+
+
+def verify_rollups(session: Session) -> List[RollupDrift]:
+    return [drift for rollup in ROLLUPS for drift in _verify(session, rollup)]
+
+
+def reconcile(session: Session, today: date, previous: Optional[date]) -> None:
+    """Daily job: rebuild the rollups that no longer match the base tables."""
+    for rollup in ROLLUPS:
+        drifts = _verify(session, rollup)
+        if not drifts:
+            continue
+        logger.warning("%s : %d écart(s) avec les tables de base, reconstruction", rollup.table, len(drifts))
+        _rebuild(session, rollup)
+        bump_versions(session, rollup.scope)
+
+
+def ensure_rollups(session: Session) -> None:
+    """Build the rollups of a database created before they existed."""
+    built = False
+    for rollup in ROLLUPS:
+        if session.exec(select(rollup.model.count).limit(1)).first() is None and rollup.actual(session):
+            _rebuild(session, rollup)
+            built = True
+    if built:
+        session.commit()
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if len(argv) != 1 or argv[0] not in {"rebuild", "verify"}:
+        print("usage: python -m app.rollups rebuild|verify", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        if argv[0] == "rebuild":
+            rebuild_rollups(session)
+            bump_versions(session, *(rollup.scope for rollup in ROLLUPS))
+            session.commit()
+            print("Agrégats des rapports reconstruits")
+            return 0
+        drifts = verify_rollups(session)
+        for drift in drifts:
+            key = " ".join(str(getattr(part, "value", part)) for part in drift.key)
+            print(f"{drift.table} {key}: attendu {drift.expected}, stocké {drift.actual}")
+        return 1 if drifts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,20 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Generic, List, Optional, TypeVar
 
 from pydantic import BaseModel, Field
+from pydantic.generics import GenericModel
 
-from .models import OrderStatus, Role, SerialStatus
+from .models import ActivityEntity, AlertKind, OrderStatus, Role, SerialStatus, WarrantyGranularity
+
+
+T = TypeVar("T")
+
+
+class Page(GenericModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = Field(default=None, description="Cursor of the next page, null on the last page")
 
 
 class FileRead(BaseModel):
@@ -110,6 +119,27 @@ class DeliveryCreate(BaseModel):
     warranty_duration_days: Optional[int] = None
 
 
+class DeliveryImportLine(BaseModel):
+    item_id: int
+    count: int
+
+
+class DeliveryImportResult(BaseModel):
+    delivery_id: int
+    created: int
+    items: List[DeliveryImportLine]
+
+
+class ActivityRead(BaseModel):
+    id: int
+    entity_type: ActivityEntity
+    entity_id: int
+    action: str
+    actor_user_id: int
+    at: datetime
+    payload_json: Optional[str]
+
+
 class SerialRead(BaseModel):
     id: int
     item_id: int
@@ -146,6 +176,67 @@ class AssignmentRead(BaseModel):
         orm_mode = True
 
 
+class AssignmentBatchCreate(BaseModel):
+    assignments: List[AssignmentCreate] = Field(..., min_items=1, max_items=5000)
+
+
+class AssignmentBatchReturn(BaseModel):
+    assignment_ids: List[int] = Field(..., min_items=1, max_items=5000)
+
+
+class AssignmentBatchResult(BaseModel):
+    ok: bool
+    serial_id: Optional[int] = None
+    assignment_id: Optional[int] = None
+    detail: Optional[str] = None
+    assignment: Optional[AssignmentRead] = None
+
+
+class AssignmentBatchResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[AssignmentBatchResult]
+
+
+class AlertRead(BaseModel):
+    id: int
+    kind: AlertKind
+    item_id: int
+    item_name: str
+    stock: int = Field(description="Current in-stock count of the item")
+    serial_id: Optional[int]
+    serial_number: Optional[str]
+    warranty_end: Optional[date]
+    opened_at: datetime
+    acknowledged_at: Optional[datetime]
+    resolved_at: Optional[datetime]
+
+
+class WarrantyBucketRead(BaseModel):
+    period_start: date
+    key: Optional[str] = Field(description="item_id or site when grouped")
+    label: Optional[str]
+    count: int
+
+
+class WarrantySample(BaseModel):
+    serial_id: int
+    serial_number: str
+    item_id: int
+    item_name: str
+    site: Optional[str]
+    warranty_end: date
+
+
+class WarrantyCalendar(BaseModel):
+    start: date
+    end: date
+    granularity: WarrantyGranularity
+    total: int
+    buckets: List[WarrantyBucketRead]
+    samples: List[WarrantySample]
+
+
 class DashboardWidget(BaseModel):
     key: str
     title: str
@@ -164,6 +255,30 @@ class ReportRow(BaseModel):
 class ReportResponse(BaseModel):
     title: str
     rows: List[ReportRow]
+    as_of: Optional[date] = Field(default=None, description="Day of the snapshot read for an as_of report")
+
+
+class StockHistoryPoint(BaseModel):
+    day: date
+    site: Optional[str]
+    count: int
+    value: float
+
+
+class StockHistory(BaseModel):
+    status: SerialStatus
+    points: List[StockHistoryPoint]
+
+
+class SearchHit(BaseModel):
+    entity_type: str
+    entity_id: int
+    label: str
+    score: float = Field(..., description="Relevance, lower is better")
+
+
+class SearchResponse(BaseModel):
+    hits: List[SearchHit]
 
 
 class UserRead(BaseModel):
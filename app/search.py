@@ -0,0 +1,194 @@
+"""Search index over items and orders.
+
+Each item (name, internal reference) and order (internal reference,
+supplier name) is indexed as one document, kept in sync by the write
+routes. SQLite databases use one FTS5 table per entity type
+(``search_item_fts``, ``search_order_fts``, keyed by the entity id as
+rowid) with bm25 ranking; other backends, or SQLite builds without FTS5, use the
+``search_trigram`` table. Both match every word of the query as a prefix
+(``itm-00`` finds ``ITM-001``) and are answered from an index instead of
+scanning the entity tables.
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+import unicodedata
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import column, delete, insert, literal, table, text
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, func, select
+
+from .models import Item, Order, SearchTrigram, Supplier
+
+
+ITEM = "item"
+ORDER = "order"
+REBUILD_BATCH_SIZE = 1000
+
+FTS_TABLES = {
+    entity_type: table(f"search_{entity_type}_fts", column("rowid"), column("content"), column("rank"))
+    for entity_type in (ITEM, ORDER)
+}
+
+_fts_enabled: Dict[str, bool] = {}
+
+
+def create_fts_table(connection: Connection) -> None:
+    """Create the FTS5 table on SQLite builds that support it (migration step)."""
+    if connection.dialect.name != "sqlite":
+        return
+    options = connection.exec_driver_sql("PRAGMA compile_options").scalars().all()
+    if "ENABLE_FTS5" not in options:  # pragma: no cover - depends on the SQLite build
+        return
+    for fts in FTS_TABLES.values():
+        connection.execute(
+            text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts.name} USING fts5("
+                "content, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        )
+
+
+def _uses_fts(session: Session) -> bool:
+    bind = session.get_bind()
+    key = str(bind.url)
+    if key not in _fts_enabled:
+        enabled = False
+        if bind.dialect.name == "sqlite":
+            found = session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLES[ITEM].name},
+            ).first()
+            enabled = found is not None
+        _fts_enabled[key] = enabled
+    return _fts_enabled[key]
+
+
+def _words(value: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", value.lower())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return re.findall(r"\w+", folded)
+
+
+def _document_trigrams(content: str) -> Set[str]:
+    trigrams: Set[str] = set()
+    for word in _words(content):
+        padded = f"  {word} "
+        trigrams.update(padded[index : index + 3] for index in range(len(padded) - 2))
+    return trigrams
+
+
+def _query_trigrams(word: str) -> Set[str]:
+    # No trailing padding: the word only has to be a prefix of an indexed word.
+    padded = f"  {word}"
+    return {padded[index : index + 3] for index in range(len(padded) - 2)}
+
+
+def _documents(session: Session, entity_type: str, entity_ids: Iterable[int]) -> List[Tuple[int, str]]:
+    ids = list(entity_ids)
+    if entity_type == ITEM:
+        rows = session.exec(select(Item.id, Item.name, Item.internal_ref).where(Item.id.in_(ids))).all()
+        return [(item_id, " ".join(part for part in (name, ref) if part)) for item_id, name, ref in rows]
+    rows = session.exec(
+        select(Order.id, Order.internal_ref, Supplier.name)
+        .join(Supplier, Supplier.id == Order.supplier_id)
+        .where(Order.id.in_(ids))
+    ).all()
+    return [(order_id, " ".join(part for part in (ref, name) if part)) for order_id, ref, name in rows]
+
+
+def index_entities(session: Session, entity_type: str, entity_ids: Iterable[int]) -> None:
+    """(Re)index the given items or orders from their current database rows."""
+    documents = _documents(session, entity_type, entity_ids)
+    if not documents:
+        return
+    ids = [entity_id for entity_id, _ in documents]
+    if _uses_fts(session):
+        fts = FTS_TABLES[entity_type]
+        session.execute(delete(fts).where(fts.c.rowid.in_(ids)))
+        session.execute(insert(fts), [{"rowid": entity_id, "content": content} for entity_id, content in documents])
+        return
+    session.execute(delete(SearchTrigram).where(SearchTrigram.entity_type == entity_type, SearchTrigram.entity_id.in_(ids)))
+    rows = [
+        {"entity_type": entity_type, "entity_id": entity_id, "trigram": trigram}
+        for entity_id, content in documents
+        for trigram in _document_trigrams(content)
+    ]
+    if rows:
+        session.execute(insert(SearchTrigram), rows)
+
+
+def search_query(session: Session, entity_type: str, term: str):
+    """Select ``(entity_id, score)`` of the matching documents, best first (lower score is better)."""
+    words = _words(term)
+    if not words:
+        return select(literal(0).label("entity_id"), literal(0.0).label("score")).where(literal(False))
+    if _uses_fts(session):
+        fts = FTS_TABLES[entity_type]
+        match = " AND ".join(f'"{word}"*' for word in words)
+        return (
+            select(fts.c.rowid.label("entity_id"), fts.c.rank.label("score"))
+            .where(fts.c.content.match(match))
+            .order_by(fts.c.rank)
+        )
+    # Documents holding every trigram of the query words; the fallback has no relevance score.
+    wanted = set().union(*(_query_trigrams(word) for word in words))
+    return (
+        select(SearchTrigram.entity_id.label("entity_id"), literal(0.0).label("score"))
+        .where(SearchTrigram.entity_type == entity_type, SearchTrigram.trigram.in_(wanted))
+        .group_by(SearchTrigram.entity_id)
+        .having(func.count(SearchTrigram.trigram) == len(wanted))
+        .order_by(SearchTrigram.entity_id)
+    )
+
+
+def matching_ids(session: Session, entity_type: str, term: str):
+    """Subquery of matching entity ids, for ``Model.id.in_(...)`` filters."""
+    matches = search_query(session, entity_type, term).order_by(None).subquery()
+    return select(matches.c.entity_id)
+
+
+def rebuild_search_index(session: Session) -> None:
+    """Reindex every item and order (does not commit)."""
+    if _uses_fts(session):
+        for fts in FTS_TABLES.values():
+            session.execute(delete(fts))
+    else:
+        session.execute(delete(SearchTrigram))
+    for entity_type, model in ((ITEM, Item), (ORDER, Order)):
+        ids = session.exec(select(model.id).order_by(model.id)).all()
+        for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+            index_entities(session, entity_type, ids[start : start + REBUILD_BATCH_SIZE])
+
+
+def ensure_search_index(session: Session) -> None:
+    """Build the index of a database created before it existed."""
+    if _uses_fts(session):
+        indexed = session.execute(select(FTS_TABLES[ITEM].c.rowid).limit(1)).first()
+    else:
+        indexed = session.exec(select(SearchTrigram.entity_id).limit(1)).first()
+    if indexed is not None or session.exec(select(Item.id).limit(1)).first() is None:
+        return
+    rebuild_search_index(session)
+    session.commit()
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if argv != ["rebuild"]:
+        print("usage: python -m app.search rebuild", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        rebuild_search_index(session)
+        session.commit()
+    print("Index de recherche reconstruit")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -21,6 +21,11 @@ from .models import (
     Supplier,
     User,
 )
+from .rollups import rebuild_rollups
+from .search import rebuild_search_index
+from .stock import rebuild_stock_counters
+from .warranties import rebuild_warranty_calendar
+from .versions import ALL_SCOPES, bump_versions
 
 CATEGORIES = ["PC Portable", "Écran", "Dock", "Smartphone"]
 SITES = ["Paris", "Lyon", "Marseille"]
@@ -132,6 +137,11 @@ def create_demo_data(session: Session) -> None:
         for order in orders
     )
 
+    rebuild_stock_counters(session)
+    rebuild_rollups(session)
+    rebuild_search_index(session)
+    rebuild_warranty_calendar(session)
+    bump_versions(session, *ALL_SCOPES)
     session.commit()
 
 
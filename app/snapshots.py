@@ -0,0 +1,85 @@
+"""Daily stock snapshots.
+
+The daily job writes, for the previous day, one ``stock_snapshot`` row per
+item and status with the number of serials and their purchase value. It is
+taken by the first job run of the day, so it describes the stock at the end
+of the previous day; a day the application did not run has no snapshot and
+``as_of`` readers fall back on the latest earlier one. Historical reports
+read these rows instead of replaying the activity log or scanning serials.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, insert, literal
+from sqlmodel import Session, func, select
+
+from . import versions
+from .models import Item, Serial, SerialStatus, StockSnapshot
+from .versions import bump_versions
+
+
+def take_snapshot(session: Session, day: date) -> int:
+    """Replace the snapshot of ``day`` by the current counts (does not commit). Returns its row count."""
+    session.execute(delete(StockSnapshot).where(StockSnapshot.day == day))
+    query = (
+        select(
+            literal(day, StockSnapshot.__table__.c.day.type),
+            Serial.item_id,
+            Serial.status,
+            Item.site,
+            func.count(Serial.id),
+            func.coalesce(func.sum(Serial.purchase_price), 0),
+        )
+        .join(Item, Item.id == Serial.item_id)
+        .group_by(Serial.item_id, Serial.status, Item.site)
+    )
+    rows = session.execute(
+        insert(StockSnapshot).from_select(["day", "item_id", "status", "site", "count", "value"], query)
+    ).rowcount
+    bump_versions(session, versions.SNAPSHOTS)
+    return rows
+
+
+def daily_snapshot(session: Session, today: date, previous: Optional[date]) -> None:
+    """Daily job: snapshot the stock at the end of yesterday."""
+    take_snapshot(session, today - timedelta(days=1))
+
+
+def snapshot_day(session: Session, as_of: date) -> Optional[date]:
+    """The latest snapshot day on or before ``as_of``."""
+    return session.exec(select(func.max(StockSnapshot.day)).where(StockSnapshot.day <= as_of)).one()
+
+
+def stock_by_site(session: Session, day: date, status: SerialStatus = SerialStatus.IN_STOCK) -> List[Tuple[Optional[str], int]]:
+    return session.exec(
+        select(StockSnapshot.site, func.sum(StockSnapshot.count))
+        .where(StockSnapshot.status == status, StockSnapshot.day == day, StockSnapshot.count > 0)
+        .group_by(StockSnapshot.site)
+    ).all()
+
+
+def history(
+    session: Session,
+    start: date,
+    end: date,
+    status: SerialStatus,
+    group_by_site: bool = False,
+    site: Optional[str] = None,
+    item_id: Optional[int] = None,
+) -> List[Tuple[date, Optional[str], int, float]]:
+    """``(day, site, count, value)`` per snapshot day in ``[start, end]``, per site if ``group_by_site``."""
+    group = [StockSnapshot.day, StockSnapshot.site] if group_by_site else [StockSnapshot.day]
+    query = select(*group, func.sum(StockSnapshot.count), func.sum(StockSnapshot.value)).where(
+        StockSnapshot.status == status, StockSnapshot.day >= start, StockSnapshot.day <= end
+    )
+    if site:
+        query = query.where(StockSnapshot.site == site)
+    if item_id:
+        query = query.where(StockSnapshot.item_id == item_id)
+    rows = session.exec(query.group_by(*group).order_by(*group)).all()
+    if group_by_site:
+        return [(day, row_site, count, value) for day, row_site, count, value in rows]
+    return [(day, None, count, value) for day, count, value in rows]
@@ -0,0 +1,166 @@
+"""Materialized per-item stock counters.
+
+``item_stock`` holds one row per (item, serial status) with the number of
+serials in that state. The write routes keep it up to date in the same
+transaction as the serial changes, so stock reads are primary-key lookups
+instead of aggregations over the serial table. Every move also updates the
+per-site rollup of :mod:`app.rollups`. ``python -m app.stock
+rebuild|verify`` recomputes or checks the counters against the serials.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, update
+from sqlmodel import Session, func, select
+
+from . import rollups
+from .alerts import sync_stock_alerts
+from .counters import add_to_counters
+from .models import Item, ItemStock, Serial, SerialStatus
+
+
+@dataclass(frozen=True)
+class StockDrift:
+    item_id: int
+    status: SerialStatus
+    expected: int
+    actual: int
+
+
+def adjust_stock(session: Session, item_id: int, status: SerialStatus, delta: int) -> None:
+    if not delta:
+        return
+    result = session.execute(
+        update(ItemStock)
+        .where(ItemStock.item_id == item_id, ItemStock.status == status)
+        .values(count=ItemStock.count + delta)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(ItemStock).values(item_id=item_id, status=status, count=delta))
+
+
+def move_stock(
+    session: Session,
+    item_id: int,
+    from_status: Optional[SerialStatus],
+    to_status: Optional[SerialStatus],
+    count: int = 1,
+) -> None:
+    """Record ``count`` serials of ``item_id`` leaving ``from_status`` for ``to_status``.
+
+    ``None`` stands for "outside the inventory": a delivery moves serials from
+    ``None`` to ``IN_STOCK``. Low-stock alerts follow the in-stock counter.
+    """
+    if from_status == to_status:
+        return
+    deltas = {}
+    if from_status is not None:
+        adjust_stock(session, item_id, from_status, -count)
+        deltas[(item_id, from_status)] = -count
+    if to_status is not None:
+        adjust_stock(session, item_id, to_status, count)
+        deltas[(item_id, to_status)] = count
+    rollups.record_stock(session, deltas)
+    if SerialStatus.IN_STOCK in (from_status, to_status):
+        sync_stock_alerts(session, [item_id])
+
+
+def move_stock_batch(session: Session, moves: Dict[Tuple[int, Optional[SerialStatus], Optional[SerialStatus]], int]) -> None:
+    """Apply many :func:`move_stock` calls, keyed ``(item_id, from_status, to_status)``.
+
+    The moves are netted per counter and written with one upsert statement
+    per ``UPSERT_BATCH_SIZE`` counters, whatever the number of items; the
+    low-stock alerts of the items are synced in one pass as well.
+    """
+    deltas: Dict[Tuple[int, SerialStatus], int] = defaultdict(int)
+    for (item_id, from_status, to_status), count in moves.items():
+        if from_status == to_status:
+            continue
+        if from_status is not None:
+            deltas[(item_id, from_status)] -= count
+        if to_status is not None:
+            deltas[(item_id, to_status)] += count
+    rows = [{"item_id": item_id, "status": status, "count": delta} for (item_id, status), delta in deltas.items() if delta]
+    add_to_counters(session, ItemStock, ("item_id", "status"), rows)
+    rollups.record_stock(session, deltas)
+    sync_stock_alerts(session, [row["item_id"] for row in rows if row["status"] == SerialStatus.IN_STOCK])
+
+
+def stock_counts(
+    session: Session, item_ids: Iterable[int], status: SerialStatus = SerialStatus.IN_STOCK
+) -> Dict[int, int]:
+    ids = list(item_ids)
+    if not ids:
+        return {}
+    rows = session.exec(
+        select(ItemStock.item_id, ItemStock.count).where(ItemStock.item_id.in_(ids), ItemStock.status == status)
+    ).all()
+    return {item_id: count for item_id, count in rows}
+
+
+def _actual_counts(session: Session) -> Dict[Tuple[int, SerialStatus], int]:
+    rows = session.exec(select(Serial.item_id, Serial.status, func.count(Serial.id)).group_by(Serial.item_id, Serial.status)).all()
+    return {(item_id, status): count for item_id, status, count in rows}
+
+
+def rebuild_stock_counters(session: Session) -> None:
+    """Recompute every counter, and the low-stock alerts, from the serial table (does not commit)."""
+    session.execute(delete(ItemStock))
+    rows = [
+        {"item_id": item_id, "status": status, "count": count}
+        for (item_id, status), count in _actual_counts(session).items()
+    ]
+    if rows:
+        session.execute(insert(ItemStock), rows)
+    sync_stock_alerts(session, session.exec(select(Item.id)).all())
+
+
+def verify_stock_counters(session: Session) -> List[StockDrift]:
+    expected = _actual_counts(session)
+    stored = {
+        (row.item_id, row.status): row.count
+        for row in session.exec(select(ItemStock)).all()
+    }
+    drifts = []
+    for key in sorted(set(expected) | set(stored), key=lambda key: (key[0], key[1].value)):
+        if expected.get(key, 0) != stored.get(key, 0):
+            drifts.append(StockDrift(item_id=key[0], status=key[1], expected=expected.get(key, 0), actual=stored.get(key, 0)))
+    return drifts
+
+
+def ensure_stock_counters(session: Session) -> None:
+    """Build the counters of a database created before they existed."""
+    if session.exec(select(ItemStock.item_id).limit(1)).first() is not None:
+        return
+    if session.exec(select(Serial.id).limit(1)).first() is None:
+        return
+    rebuild_stock_counters(session)
+    session.commit()
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if len(argv) != 1 or argv[0] not in {"rebuild", "verify"}:
+        print("usage: python -m app.stock rebuild|verify", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        if argv[0] == "rebuild":
+            rebuild_stock_counters(session)
+            session.commit()
+            print("Compteurs de stock reconstruits")
+            return 0
+        drifts = verify_stock_counters(session)
+        for drift in drifts:
+            print(f"item {drift.item_id} {drift.status.value}: attendu {drift.expected}, stocké {drift.actual}")
+        return 1 if drifts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""Per-table data versions bumped by the write routes.
+
+Each write route bumps the version of the tables it touches in the same
+transaction as the write. Readers derive cache keys from these versions,
+so every worker sees a new generation as soon as the write is committed.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable
+
+from sqlalchemy import insert, update
+from sqlmodel import Session, select
+
+from .models import ChangeVersion
+
+
+ITEMS = "items"
+SERIALS = "serials"
+ORDERS = "orders"
+ASSIGNMENTS = "assignments"
+FILES = "files"
+USERS = "users"
+SUPPLIERS = "suppliers"
+ALERTS = "alerts"
+SNAPSHOTS = "snapshots"
+ACTIVITY = "activity"
+
+ALL_SCOPES = (ITEMS, SERIALS, ORDERS, ASSIGNMENTS, FILES, USERS, SUPPLIERS, ALERTS, SNAPSHOTS, ACTIVITY)
+
+
+def bump_versions(session: Session, *scopes: str) -> None:
+    wanted = sorted(set(scopes))
+    if not wanted:
+        return
+    result = session.execute(
+        update(ChangeVersion).where(ChangeVersion.scope.in_(wanted)).values(version=ChangeVersion.version + 1)
+    )
+    if result.rowcount == len(wanted):
+        return
+    existing = set(session.exec(select(ChangeVersion.scope).where(ChangeVersion.scope.in_(wanted))).all())
+    session.execute(insert(ChangeVersion), [{"scope": scope, "version": 1} for scope in wanted if scope not in existing])
+
+
+def current_versions(session: Session, scopes: Iterable[str]) -> Dict[str, int]:
+    wanted = list(scopes)
+    rows = session.exec(select(ChangeVersion.scope, ChangeVersion.version).where(ChangeVersion.scope.in_(wanted))).all()
+    versions = dict.fromkeys(wanted, 0)
+    versions.update({scope: version for scope, version in rows})
+    return versions
@@ -0,0 +1,254 @@
+"""Warranty expiry calendar.
+
+``warranty_bucket`` counts, per item, the non-retired serials whose warranty
+ends in each week and each month. Deliveries add to the buckets and
+retirements remove from them in the same transaction, so the whole periods
+of a window are read from a few bucket rows whatever the number of serials.
+The partial periods at the edges of the window and the sample serials come
+from bounded range scans of ``serial.warranty_end``.
+``python -m app.warranties rebuild|verify`` recomputes or checks the buckets.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, literal
+from sqlmodel import Session, func, select
+
+from .counters import add_to_counters
+from .models import Item, Serial, SerialStatus, WarrantyBucket, WarrantyGranularity
+
+
+@dataclass(frozen=True)
+class BucketDrift:
+    granularity: WarrantyGranularity
+    period_start: date
+    item_id: int
+    expected: int
+    actual: int
+
+
+def period_start(day: date, granularity: WarrantyGranularity) -> date:
+    if granularity == WarrantyGranularity.WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(day: date, granularity: WarrantyGranularity) -> date:
+    """Start of the period following the one of ``day``."""
+    if granularity == WarrantyGranularity.WEEK:
+        return period_start(day, granularity) + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _bucket_rows(ends: Dict[Tuple[int, date], int]) -> List[dict]:
+    counts: Dict[Tuple[WarrantyGranularity, date, int], int] = defaultdict(int)
+    for (item_id, warranty_end), count in ends.items():
+        if warranty_end is None:
+            continue
+        for granularity in WarrantyGranularity:
+            counts[(granularity, period_start(warranty_end, granularity), item_id)] += count
+    return [
+        {"granularity": granularity, "period_start": start, "item_id": item_id, "count": count}
+        for (granularity, start, item_id), count in counts.items()
+        if count
+    ]
+
+
+def record_warranties(session: Session, ends: Dict[Tuple[int, date], int]) -> None:
+    """Add ``count`` serials ending ``(item_id, warranty_end)`` to the calendar (negative to remove)."""
+    rows = _bucket_rows(ends)
+    if rows:
+        add_to_counters(session, WarrantyBucket, ("granularity", "period_start", "item_id"), rows)
+
+
+def _actual_ends(session: Session) -> Dict[Tuple[int, date], int]:
+    rows = session.exec(
+        select(Serial.item_id, Serial.warranty_end, func.count(Serial.id))
+        .where(Serial.warranty_end.is_not(None), Serial.status != SerialStatus.RETIRED)
+        .group_by(Serial.item_id, Serial.warranty_end)
+    ).all()
+    return {(item_id, warranty_end): count for item_id, warranty_end, count in rows}
+
+
+def rebuild_warranty_calendar(session: Session) -> None:
+    """Recompute every bucket from the serial table (does not commit)."""
+    session.execute(delete(WarrantyBucket))
+    rows = _bucket_rows(_actual_ends(session))
+    if rows:
+        session.execute(insert(WarrantyBucket), rows)
+
+
+def verify_warranty_calendar(session: Session) -> List[BucketDrift]:
+    expected = {(row["granularity"], row["period_start"], row["item_id"]): row["count"] for row in _bucket_rows(_actual_ends(session))}
+    stored = {
+        (row.granularity, row.period_start, row.item_id): row.count
+        for row in session.exec(select(WarrantyBucket)).all()
+    }
+    drifts = []
+    for key in sorted(set(expected) | set(stored), key=lambda key: (key[0].value, key[1], key[2])):
+        if expected.get(key, 0) != stored.get(key, 0):
+            drifts.append(BucketDrift(*key, expected=expected.get(key, 0), actual=stored.get(key, 0)))
+    return drifts
+
+
+def ensure_warranty_calendar(session: Session) -> None:
+    """Build the calendar of a database created before it existed."""
+    if session.exec(select(WarrantyBucket.item_id).limit(1)).first() is not None:
+        return
+    if session.exec(select(Serial.id).where(Serial.warranty_end.is_not(None)).limit(1)).first() is None:
+        return
+    rebuild_warranty_calendar(session)
+    session.commit()
+
+
+CalendarRow = Tuple[date, Optional[str], Optional[str], int]
+
+
+def _grouping(group_by: Optional[str], item_column: Any) -> List[Any]:
+    if group_by == "item":
+        return [item_column, Item.name]
+    if group_by == "site":
+        return [Item.site]
+    return []
+
+
+def _calendar_rows(rows: List[Any], group_by: Optional[str]) -> List[CalendarRow]:
+    if group_by == "item":
+        return [(start_day, str(item), name, count) for start_day, item, name, count in rows]
+    if group_by == "site":
+        return [(start_day, site_name, site_name, count) for start_day, site_name, count in rows]
+    return [(start_day, None, None, count) for start_day, count in rows]
+
+
+def _bucket_rows_between(
+    session: Session,
+    start: date,
+    end: date,
+    granularity: WarrantyGranularity,
+    group_by: Optional[str],
+    item_id: Optional[int],
+    site: Optional[str],
+) -> List[CalendarRow]:
+    """Rows of the whole periods of ``[start, end)``, both period boundaries."""
+    if start >= end:
+        return []
+    conditions = [
+        WarrantyBucket.granularity == granularity,
+        WarrantyBucket.period_start >= start,
+        WarrantyBucket.period_start < end,
+        WarrantyBucket.count > 0,
+    ]
+    if item_id:
+        conditions.append(WarrantyBucket.item_id == item_id)
+    if site:
+        conditions.append(Item.site == site)
+    group = [WarrantyBucket.period_start, *_grouping(group_by, WarrantyBucket.item_id)]
+    query = select(*group, func.sum(WarrantyBucket.count))
+    if group_by or site:
+        query = query.join(Item, Item.id == WarrantyBucket.item_id)
+    return _calendar_rows(session.exec(query.where(*conditions).group_by(*group).order_by(*group)).all(), group_by)
+
+
+def _serial_rows_between(
+    session: Session,
+    start: date,
+    end: date,
+    period: date,
+    group_by: Optional[str],
+    item_id: Optional[int],
+    site: Optional[str],
+) -> List[CalendarRow]:
+    """Rows of the part ``[start, end)`` of ``period``, counted on the serials."""
+    if start >= end:
+        return []
+    conditions = [Serial.warranty_end >= start, Serial.warranty_end < end, Serial.status != SerialStatus.RETIRED]
+    if item_id:
+        conditions.append(Serial.item_id == item_id)
+    if site:
+        conditions.append(Item.site == site)
+    group = _grouping(group_by, Serial.item_id)
+    query = select(literal(period), *group, func.count(Serial.id))
+    if group_by or site:
+        query = query.join(Item, Item.id == Serial.item_id)
+    query = query.where(*conditions)
+    if group:
+        query = query.group_by(*group).order_by(*group)
+    rows = [row for row in session.exec(query).all() if row[-1]]
+    return _calendar_rows(rows, group_by)
+
+
+def bucket_counts(
+    session: Session,
+    start: date,
+    end: date,
+    granularity: WarrantyGranularity,
+    group_by: Optional[str] = None,
+    item_id: Optional[int] = None,
+    site: Optional[str] = None,
+) -> List[CalendarRow]:
+    """``(period_start, key, label, count)`` of the warranties ending in ``[start, end)``.
+
+    The whole periods of the window are read from the buckets; a period cut
+    by ``start`` or ``end`` is counted on the serials of its part inside the
+    window, so no warranty outside ``[start, end)`` is counted. ``group_by``
+    is ``None`` (one row per period), ``"item"`` or ``"site"``.
+    """
+    first = period_start(start, granularity)
+    head_end = start if start == first else min(end, next_period(start, granularity))
+    tail_start = end if period_start(end, granularity) == end else max(head_end, period_start(end, granularity))
+    return [
+        *_serial_rows_between(session, start, head_end, first, group_by, item_id, site),
+        *_bucket_rows_between(session, head_end, tail_start, granularity, group_by, item_id, site),
+        *_serial_rows_between(
+            session, tail_start, end, period_start(tail_start, granularity), group_by, item_id, site
+        ),
+    ]
+
+
+def samples(
+    session: Session, start: date, end: date, limit: int, item_id: Optional[int] = None, site: Optional[str] = None
+) -> List[Tuple[int, str, int, str, Optional[str], date]]:
+    """The ``limit`` serials whose warranty ends first in ``[start, end)``."""
+    if limit <= 0:
+        return []
+    query = (
+        select(Serial.id, Serial.serial_number, Serial.item_id, Item.name, Item.site, Serial.warranty_end)
+        .join(Item, Item.id == Serial.item_id)
+        .where(Serial.warranty_end >= start, Serial.warranty_end < end, Serial.status != SerialStatus.RETIRED)
+    )
+    if item_id:
+        query = query.where(Serial.item_id == item_id)
+    if site:
+        query = query.where(Item.site == site)
+    return session.exec(query.order_by(Serial.warranty_end, Serial.id).limit(limit)).all()
+
+
+def main(argv: List[str]) -> int:
+    from .database import init_db, session_scope
+
+    if len(argv) != 1 or argv[0] not in {"rebuild", "verify"}:
+        print("usage: python -m app.warranties rebuild|verify", file=sys.stderr)
+        return 2
+    init_db()
+    with session_scope() as session:
+        if argv[0] == "rebuild":
+            rebuild_warranty_calendar(session)
+            session.commit()
+            print("Calendrier des garanties reconstruit")
+            return 0
+        drifts = verify_warranty_calendar(session)
+        for drift in drifts:
+            print(
+                f"{drift.granularity.value} {drift.period_start} item {drift.item_id}: attendu {drift.expected}, stocké {drift.actual}"
+            )
+        return 1 if drifts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,7 @@
+"""Endpoint micro-benchmarks.
+
+Not collected by pytest: run them with ``python -m benchmarks.run`` (see
+the README). Every route of :mod:`app.main` is driven in-process against a
+dataset built by :mod:`app.datagen`, and the results are compared with the
+JSON baselines of ``benchmarks/baselines``.
+"""
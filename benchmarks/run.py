@@ -0,0 +1,244 @@
+"""Run the endpoint benchmarks and compare them with a stored baseline.
+
+::
+
+    python -m benchmarks.run                        # small dataset, compare with baselines/small.json
+    python -m benchmarks.run --dataset medium --update-baseline
+    python -m benchmarks.run --only /serials --iterations 100
+
+The dataset is generated once per preset under ``--data-dir`` and copied
+before every run, so write routes never alter it. Exit codes: 0 when every
+route is within the thresholds, 1 on a regression, 2 when a route of the
+application has no scenario or a measured route (or the whole dataset) has
+no baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BASELINES_DIR = BENCHMARKS_DIR / "baselines"
+
+# Differences below these are noise whatever the ratio.
+LATENCY_SLACK_MS = 2.0
+MEMORY_SLACK_KB = 64.0
+# Conditional writes depend on the rows a scenario happens to touch: a
+# low-stock alert opened and another resolved add up to two statements.
+QUERY_SLACK = 2
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _prepare_dataset(dataset: str, data_dir: Path, seed: int) -> Path:
+    """Generate the dataset of ``dataset`` once and return its directory."""
+    target = data_dir / f"{dataset}-seed{seed}"
+    if (target / "stocky.db").exists():
+        return target
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir(parents=True)
+    print(f"Génération du jeu de données {dataset}…")
+    subprocess.run(
+        [sys.executable, "-m", "app.datagen", "--database-url", f"sqlite:///{target / 'stocky.db'}", "--preset", dataset, "--seed", str(seed)],
+        check=True,
+        env={**os.environ, "STORAGE_DIR": str(target / "storage")},
+    )
+    return target
+
+
+def measure(iterations: int, warmup: int, memory_runs: int, only: Optional[str]) -> Dict[str, dict]:
+    """Drive every scenario and return the statistics of each route."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app import activity, database, main
+
+    from .scenarios import SCENARIOS, Context, uncovered_routes
+
+    missing = uncovered_routes(main.app)
+    if missing:
+        raise LookupError(f"Routes sans scénario : {', '.join(missing)}")
+
+    statements = [0]
+
+    def _count(conn, cursor, statement, *args) -> None:
+        # BEGIN is emitted by the SQLite profile, not by the route, and the
+        # activity log is written off the request path by its own thread.
+        if not statement.startswith("BEGIN") and threading.current_thread().name != activity.WRITER_THREAD:
+            statements[0] += 1
+
+    engines = {database.engine, database.read_engine, database.async_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _count)
+    results: Dict[str, dict] = {}
+    headers = {"X-User-Role": "admin"}
+    with TestClient(main.app) as client:
+        ctx = Context(client, headers)
+
+        def send(scenario) -> None:
+            kwargs = {"headers": headers, **scenario.build(ctx)}
+            statements[0] = 0
+            response = client.request(scenario.method, **kwargs)
+            if response.status_code != scenario.expected_status:
+                raise RuntimeError(f"{scenario.name} : {response.status_code} {response.text[:200]}")
+
+        for scenario in SCENARIOS:
+            if only and only not in scenario.name:
+                continue
+            for _ in range(warmup):
+                send(scenario)
+            latencies: List[float] = []
+            queries: List[int] = []
+            for _ in range(iterations):
+                kwargs = {"headers": headers, **scenario.build(ctx)}
+                statements[0] = 0
+                started = time.perf_counter()
+                response = client.request(scenario.method, **kwargs)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != scenario.expected_status:
+                    raise RuntimeError(f"{scenario.name} : {response.status_code} {response.text[:200]}")
+                queries.append(statements[0])
+
+            # tracemalloc slows everything down: memory has its own runs.
+            peak = 0
+            tracemalloc.start()
+            for _ in range(memory_runs):
+                kwargs = {"headers": headers, **scenario.build(ctx)}
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                client.request(scenario.method, **kwargs)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+            tracemalloc.stop()
+
+            results[scenario.name] = {
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(_percentile(latencies, 95), 3),
+                "max_ms": round(max(latencies), 3),
+                "queries": max(queries),
+                "peak_kb": round(peak / 1024, 1),
+            }
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", _count)
+    return results
+
+
+def compare(
+    results: Dict[str, dict],
+    baseline: Dict[str, dict],
+    latency_threshold: float,
+    tail_threshold: float,
+    memory_threshold: float,
+) -> List[str]:
+    """Return one message per metric that regressed beyond its threshold.
+
+    Routes missing from ``baseline`` are left to :func:`missing_references`.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric, threshold in (("p50_ms", latency_threshold), ("p95_ms", tail_threshold)):
+            if current[metric] > reference[metric] * threshold and current[metric] - reference[metric] > LATENCY_SLACK_MS:
+                regressions.append(f"{name} : {metric[:3]} {current[metric]} ms (référence {reference[metric]} ms)")
+        if current["queries"] > reference["queries"] + QUERY_SLACK:
+            regressions.append(f"{name} : {current['queries']} requêtes SQL (référence {reference['queries']})")
+        if current["peak_kb"] > reference["peak_kb"] * memory_threshold and current["peak_kb"] - reference["peak_kb"] > MEMORY_SLACK_KB:
+            regressions.append(f"{name} : pic mémoire {current['peak_kb']} Kio (référence {reference['peak_kb']} Kio)")
+    return regressions
+
+
+def missing_references(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """Measured routes that have no entry in ``baseline``."""
+    return [name for name in results if name not in baseline]
+
+
+def _print_table(results: Dict[str, dict]) -> None:
+    width = max(len(name) for name in results)
+    print(f"{'route':<{width}}  {'p50 ms':>8}  {'p95 ms':>8}  {'max ms':>8}  {'SQL':>4}  {'pic Kio':>9}")
+    for name, row in results.items():
+        print(f"{name:<{width}}  {row['p50_ms']:>8.2f}  {row['p95_ms']:>8.2f}  {row['max_ms']:>8.2f}  {row['queries']:>4}  {row['peak_kb']:>9.1f}")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Micro-benchmarks des routes de l'API")
+    parser.add_argument("--dataset", choices=["small", "medium", "large"], default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--memory-runs", type=int, default=3)
+    parser.add_argument("--only", default=None, help="Ne mesurer que les routes contenant ce texte")
+    parser.add_argument("--data-dir", type=Path, default=BENCHMARKS_DIR / ".data")
+    parser.add_argument("--baseline", type=Path, default=None, help="Référence JSON (baselines/<dataset>.json par défaut)")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistrer les mesures comme nouvelle référence")
+    parser.add_argument("--latency-threshold", type=float, default=1.5, help="Ratio p50 toléré par rapport à la référence")
+    parser.add_argument("--tail-threshold", type=float, default=2.0, help="Ratio p95 toléré par rapport à la référence")
+    parser.add_argument("--memory-threshold", type=float, default=1.5, help="Ratio de pic mémoire toléré")
+    parser.add_argument("--output", type=Path, default=None, help="Écrire les mesures dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    if "app.database" in sys.modules:
+        print("app.database est déjà importé : DATABASE_URL ne peut plus être changé", file=sys.stderr)
+        return 2
+    source = _prepare_dataset(args.dataset, args.data_dir, args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix="stocky-bench-"))
+    shutil.copy(source / "stocky.db", workdir / "stocky.db")
+    if (source / "storage").exists():
+        shutil.copytree(source / "storage", workdir / "storage")
+    # Must be set before the application is imported.
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'stocky.db'}"
+    os.environ["STORAGE_DIR"] = str(workdir / "storage")
+
+    try:
+        results = measure(args.iterations, args.warmup, args.memory_runs, args.only)
+    except LookupError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    _print_table(results)
+
+    report = {"dataset": args.dataset, "seed": args.seed, "iterations": args.iterations, "routes": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    baseline_path = args.baseline or BASELINES_DIR / f"{args.dataset}.json"
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        if baseline_path.exists() and args.only:
+            report["routes"] = {**json.loads(baseline_path.read_text())["routes"], **results}
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Référence enregistrée dans {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"Pas de référence {baseline_path} : relancez avec --update-baseline", file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text())["routes"]
+    regressions = compare(results, baseline, args.latency_threshold, args.tail_threshold, args.memory_threshold)
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}", file=sys.stderr)
+    missing = missing_references(results, baseline)
+    if missing:
+        print(f"Routes sans référence dans {baseline_path} : {', '.join(missing)}", file=sys.stderr)
+        print("Relancez avec --update-baseline", file=sys.stderr)
+        return 2
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
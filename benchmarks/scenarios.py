@@ -0,0 +1,253 @@
+"""Requests sent to each route during a benchmark run.
+
+A scenario builds the keyword arguments of one ``TestClient.request`` call.
+Building them is not measured, so scenarios that need fresh state (a file
+to delete, an in-stock serial to assign) create it there.
+"""
+
+from __future__ import annotations
+
+import itertools
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from app.database import session_scope
+from app.models import Alert, Assignment, Serial, SerialStatus
+
+BATCH_SIZE = 20
+POOL_SIZE = 20_000
+
+
+@dataclass
+class Context:
+    client: TestClient
+    headers: Dict[str, str]
+    counter: itertools.count = field(default_factory=lambda: itertools.count(1))
+    _in_stock: List[int] = field(default_factory=list)
+    _active: List[int] = field(default_factory=list)
+
+    def unique(self) -> int:
+        return next(self.counter)
+
+    def in_stock_serials(self, count: int) -> List[int]:
+        if len(self._in_stock) < count:
+            with session_scope() as session:
+                taken = set(self._in_stock)
+                ids = session.exec(
+                    select(Serial.id).where(Serial.status == SerialStatus.IN_STOCK).order_by(Serial.id.desc()).limit(POOL_SIZE)
+                ).all()
+            self._in_stock = [serial_id for serial_id in ids if serial_id not in taken] + self._in_stock
+        taken, self._in_stock = self._in_stock[-count:], self._in_stock[:-count]
+        return taken
+
+    def active_assignments(self, count: int) -> List[int]:
+        if len(self._active) < count:
+            with session_scope() as session:
+                self._active = session.exec(
+                    select(Assignment.id).where(Assignment.end_date.is_(None)).order_by(Assignment.id.desc()).limit(POOL_SIZE)
+                ).all()
+        taken, self._active = self._active[-count:], self._active[:-count]
+        return taken
+
+    def post(self, url: str, **kwargs) -> dict:
+        response = self.client.post(url, headers=self.headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+
+@dataclass
+class Scenario:
+    method: str
+    path: str
+    build: Callable[[Context], dict]
+    label: str = ""
+    expected_status: int = 200
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path}{self.label}"
+
+
+def _get(path: str, label: str = "", **params) -> Scenario:
+    return Scenario("GET", path, lambda ctx: {"url": path, "params": params}, label=label)
+
+
+def _uncached(request: dict) -> dict:
+    # Without a write between iterations every call would be a cache hit.
+    from app.main import dashboard_cache
+
+    dashboard_cache.clear()
+    return request
+
+
+def _revalidated(path: str) -> Scenario:
+    # Polling client whose copy is current: answered by the ETag alone.
+    def build(ctx: Context) -> dict:
+        etag = ctx.client.get(path, headers=ctx.headers).headers["ETag"]
+        return {"url": path, "headers": {**ctx.headers, "If-None-Match": etag}}
+
+    return Scenario("GET", path, build, label=" 304", expected_status=304)
+
+
+def _acknowledge(ctx: Context) -> dict:
+    # Acknowledging is idempotent: the same alert can be used every time.
+    with session_scope() as session:
+        alert_id = session.exec(select(Alert.id).order_by(Alert.id)).first()
+    return {"url": f"/alerts/{alert_id}/ack"}
+
+
+def _upload(ctx: Context) -> dict:
+    number = ctx.unique()
+    return {
+        "url": "/files",
+        "data": {"entity_type": "order", "entity_id": "1"},
+        "files": {"attachment": (f"bench-{number}.txt", f"benchmark {number}\n".encode() * 256, "text/plain")},
+    }
+
+
+def _file_id(ctx: Context) -> int:
+    return ctx.post(**_upload(ctx))["id"]
+
+
+def _order(ctx: Context) -> dict:
+    return {"supplier_id": 1, "internal_ref": f"BENCH-{ctx.unique()}", "lines": [{"item_id": 1, "qty": 2, "unit_price": 10.0}]}
+
+
+def _import(ctx: Context) -> dict:
+    number = ctx.unique()
+    rows = "".join(f"BENCH-IMP-{number}-{index}\n" for index in range(200))
+    return {
+        "url": "/orders/1/deliveries/import",
+        "data": {"item_id": "1"},
+        "files": {"serials": ("serials.csv", f"serial_number\n{rows}".encode(), "text/csv")},
+    }
+
+
+TODAY = date.today()
+
+
+SCENARIOS: List[Scenario] = [
+    _get("/users"),
+    _get("/suppliers"),
+    Scenario("POST", "/files", _upload, expected_status=201),
+    _get("/files", entity_type="order", entity_id=1),
+    Scenario("GET", "/files/{file_id}/download", lambda ctx: {"url": f"/files/{_file_id(ctx)}/download"}),
+    Scenario("DELETE", "/files/{file_id}", lambda ctx: {"url": f"/files/{_file_id(ctx)}"}, expected_status=204),
+    Scenario(
+        "POST",
+        "/items",
+        lambda ctx: {"url": "/items", "json": {"name": f"Bench {ctx.unique()}", "category": "Benchmark", "site": "Paris"}},
+        expected_status=201,
+    ),
+    _get("/items"),
+    _revalidated("/items"),
+    _get("/items", " search", search="dell"),
+    _get("/serials"),
+    _get("/serials", " in_stock", status="in_stock"),
+    _get("/serials/export"),
+    _get("/serials/export", " xlsx", format="xlsx"),
+    Scenario(
+        "POST",
+        "/serials/{serial_id}/retire",
+        lambda ctx: {"url": f"/serials/{ctx.in_stock_serials(1)[0]}/retire"},
+    ),
+    Scenario("POST", "/orders", lambda ctx: {"url": "/orders", "json": _order(ctx)}, expected_status=201),
+    _get("/orders"),
+    _get("/orders", " search", search="cmd-00"),
+    _revalidated("/orders"),
+    _get("/orders/export"),
+    _get("/search", q="dell"),
+    Scenario("GET", "/orders/{order_id}", lambda ctx: {"url": "/orders/1"}),
+    Scenario(
+        "PATCH",
+        "/orders/{order_id}/status",
+        lambda ctx: {"url": f"/orders/{ctx.post('/orders', json=_order(ctx))['id']}/status", "json": {"status": "internal"}},
+    ),
+    Scenario(
+        "POST",
+        "/orders/{order_id}/deliveries",
+        lambda ctx: {"url": "/orders/1/deliveries", "json": {"item_id": 1, "serial_numbers": [f"BENCH-DLV-{ctx.unique()}-{index}" for index in range(10)]}},
+    ),
+    Scenario("POST", "/orders/{order_id}/deliveries/import", _import, expected_status=201),
+    Scenario(
+        "POST",
+        "/assignments",
+        lambda ctx: {"url": "/assignments", "json": {"serial_id": ctx.in_stock_serials(1)[0], "assignee_user_id": 1}},
+        expected_status=201,
+    ),
+    Scenario(
+        "POST",
+        "/assignments/batch",
+        lambda ctx: {
+            "url": "/assignments/batch",
+            "json": {"assignments": [{"serial_id": serial_id, "assignee_user_id": 1} for serial_id in ctx.in_stock_serials(BATCH_SIZE)]},
+        },
+    ),
+    Scenario(
+        "POST",
+        "/assignments/batch/return",
+        lambda ctx: {"url": "/assignments/batch/return", "json": {"assignment_ids": ctx.active_assignments(BATCH_SIZE)}},
+    ),
+    Scenario(
+        "POST",
+        "/assignments/{assignment_id}/return",
+        lambda ctx: {"url": f"/assignments/{ctx.active_assignments(1)[0]}/return"},
+    ),
+    _get("/assignments"),
+    _get("/assignments", " active", active_only="true"),
+    _get("/assignments/export", " active", active_only="true"),
+    _get("/dashboard/widgets"),
+    _revalidated("/dashboard/widgets"),
+    Scenario("GET", "/dashboard/widgets", lambda ctx: _uncached({"url": "/dashboard/widgets"}), label=" uncached"),
+    Scenario("GET", "/dashboard/widgets/{key}", lambda ctx: {"url": "/dashboard/widgets/alerts"}),
+    Scenario(
+        "GET",
+        "/dashboard/widgets/{key}",
+        lambda ctx: _uncached({"url": "/dashboard/widgets/warranties"}),
+        label=" warranties uncached",
+    ),
+    _get("/alerts"),
+    _get("/alerts", " warranty", kind="warranty_expired"),
+    Scenario("POST", "/alerts/{alert_id}/ack", _acknowledge),
+    _get("/warranties/calendar", **{"from": TODAY.isoformat(), "to": (TODAY + timedelta(days=90)).isoformat()}),
+    _get(
+        "/warranties/calendar",
+        " by site",
+        **{"from": TODAY.isoformat(), "to": (TODAY + timedelta(days=365)).isoformat(), "granularity": "month", "group_by": "site"},
+    ),
+    _get("/activity"),
+    _get("/activity", " action", action="assign"),
+    _get("/activity", " range", **{"from": f"{TODAY - timedelta(days=30)}T00:00:00", "to": f"{TODAY}T00:00:00"}),
+    Scenario("GET", "/{entity}/{entity_id}/history", lambda ctx: {"url": "/serials/1/history"}, label=" serial"),
+    Scenario("GET", "/{entity}/{entity_id}/history", lambda ctx: {"url": "/orders/1/history"}, label=" order"),
+    _get("/reports/stock-by-site"),
+    _revalidated("/reports/stock-by-site"),
+    _get("/reports/stock-by-site", " as_of", as_of=TODAY.isoformat()),
+    _get("/reports/stock-history", **{"from": (TODAY - timedelta(days=90)).isoformat(), "to": TODAY.isoformat()}),
+    _get(
+        "/reports/stock-history",
+        " by site",
+        **{"from": (TODAY - timedelta(days=90)).isoformat(), "to": TODAY.isoformat(), "group_by": "site"},
+    ),
+    _get("/reports/orders-by-status"),
+    _get("/reports/assignments-by-department"),
+    _get("/reports/assignments-by-department", " xlsx", format="xlsx"),
+]
+
+
+def uncovered_routes(app: FastAPI) -> List[str]:
+    """Routes of ``app`` that no scenario drives, as ``"METHOD /path"``."""
+    covered = {(scenario.method, scenario.path) for scenario in SCENARIOS}
+    return sorted(
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+        if (method, route.path) not in covered
+    )
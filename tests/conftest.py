@@ -1,26 +1,38 @@
 from __future__ import annotations
 
 import os
+import shutil
 from collections.abc import Iterator
 
 import pytest
 from fastapi.testclient import TestClient
 
+from app.blobstore import STORAGE_DIR
 from app.database import get_session, init_db, session_scope
 from app.main import app
 from app.seed import create_demo_data
 
 
+DATABASE_FILES = ("stocky.db", "stocky.db-wal", "stocky.db-shm")
+
+
+def _remove_database() -> None:
+    # A leftover WAL file would be replayed into the next database.
+    for path in DATABASE_FILES:
+        if os.path.exists(path):
+            os.remove(path)
+
+
 @pytest.fixture(scope="session", autouse=True)
 def _cleanup_database() -> Iterator[None]:
-    if os.path.exists("stocky.db"):
-        os.remove("stocky.db")
+    _remove_database()
+    shutil.rmtree(STORAGE_DIR, ignore_errors=True)
     init_db()
     with session_scope() as session:
         create_demo_data(session)
     yield
-    if os.path.exists("stocky.db"):
-        os.remove("stocky.db")
+    _remove_database()
+    shutil.rmtree(STORAGE_DIR, ignore_errors=True)
 
 
 @pytest.fixture()
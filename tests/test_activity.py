@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import select
+
+from app import activity
+from app.activity import ActivityWriter, write_batch
+from app.database import session_scope
+from app.models import ActivityEntity, ActivityLog, ActivityPending, Item
+
+HEADERS = {"X-User-Role": "admin"}
+
+
+def _logged(action: str) -> list[ActivityLog]:
+    with session_scope() as session:
+        return session.exec(select(ActivityLog).where(ActivityLog.action == action)).all()
+
+
+def _entry(action: str, entity_id: int = 1) -> dict:
+    with session_scope() as session:
+        activity.record(session, ActivityEntity.ITEM, entity_id, action, json.dumps({"n": entity_id}))
+        return session.info.pop(activity.SESSION_KEY)[0]
+
+
+def _spooled(directory: Path) -> list[Path]:
+    return [path for path in directory.iterdir() if path.name != activity.RECOVERY_LOCK]
+
+
+def test_write_routes_log_after_the_flush(client: TestClient) -> None:
+    order = client.post(
+        "/orders",
+        json={"supplier_id": 1, "internal_ref": "ACT-1", "lines": [{"item_id": 1, "qty": 1, "unit_price": 5.0}]},
+        headers=HEADERS,
+    ).json()
+    response = client.post(
+        f"/orders/{order['id']}/deliveries",
+        json={"item_id": 1, "serial_numbers": ["ACT-SN-1"], "delivered_at": "2024-05-02"},
+        headers=HEADERS,
+    )
+    assert response.status_code == 200
+
+    activity.writer.flush()
+    with session_scope() as session:
+        logged = session.exec(
+            select(ActivityLog).where(ActivityLog.entity_type == ActivityEntity.ORDER, ActivityLog.entity_id == order["id"])
+        ).all()
+    assert [entry.action for entry in logged] == ["create", "delivery"]
+    assert json.loads(logged[1].payload_json)["delivered_at"] == "2024-05-02"
+
+
+def test_rolled_back_entries_are_dropped(client: TestClient) -> None:
+    with session_scope() as session:
+        session.exec(select(ActivityLog.id)).first()
+        activity.record(session, ActivityEntity.ITEM, 1, "rolled-back")
+        session.rollback()
+        session.commit()
+    activity.writer.flush()
+    assert _logged("rolled-back") == []
+
+
+def test_recover_replays_the_spool_of_a_dead_writer(tmp_path: Path) -> None:
+    crashed = ActivityWriter(directory=tmp_path, fsync=False)
+    crashed.enqueue([_entry("crashed", 1), _entry("crashed", 2)])
+    crashed.flush()
+    crashed.enqueue([_entry("crashed", 3)])
+    # Process gone: its handle and lock are released without a flush.
+    crashed._file.write(b'{"entity_type": "item", "entity_')
+    crashed._file.close()
+
+    survivor = ActivityWriter(directory=tmp_path, fsync=False)
+    assert survivor.recover() == 1
+    assert sorted(entry.entity_id for entry in _logged("crashed")) == [1, 2, 3]
+    assert _spooled(tmp_path) == []
+
+
+def test_recover_skips_the_files_of_a_running_writer(tmp_path: Path) -> None:
+    running = ActivityWriter(directory=tmp_path, fsync=False)
+    running.enqueue([_entry("running")])
+    assert ActivityWriter(directory=tmp_path, fsync=False).recover() == 0
+    running.stop()
+    assert [entry.entity_id for entry in _logged("running")] == [1]
+    assert _spooled(tmp_path) == []
+
+
+def test_a_batch_is_written_once(tmp_path: Path) -> None:
+    entries = [_entry("once")]
+    with session_scope() as session:
+        assert write_batch(session, "stream-once", 1, entries)
+        assert not write_batch(session, "stream-once", 1, entries)
+    # Crash after the commit, before the batch file was removed.
+    (tmp_path / "stream-once.1.batch").write_text(json.dumps(entries[0]) + "\n")
+    assert ActivityWriter(directory=tmp_path, fsync=False).recover() == 0
+    assert len(_logged("once")) == 1
+    assert _spooled(tmp_path) == []
+
+
+def test_only_committed_transactions_are_replayed(tmp_path: Path) -> None:
+    with session_scope() as session:
+        session.execute(insert(ActivityPending).values(token="committed"))
+        session.commit()
+    crashed = ActivityWriter(directory=tmp_path, fsync=False)
+    # Spooled before a commit that never happened, then the process died.
+    crashed.enqueue([{**_entry("token", 1), "token": "committed"}, {**_entry("token", 2), "token": "uncommitted"}])
+    crashed._file.close()
+
+    assert ActivityWriter(directory=tmp_path, fsync=False).recover() == 1
+    assert [entry.entity_id for entry in _logged("token")] == [1]
+    with session_scope() as session:
+        assert session.get(ActivityPending, "committed") is None
+
+
+def test_a_spool_failure_fails_the_commit(client: TestClient, monkeypatch) -> None:
+    def full_disk(entries: list[dict]) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(activity.writer, "enqueue", full_disk)
+    with session_scope() as session:
+        item = Item(name="Sans journal", category="Dock")
+        session.add(item)
+        session.flush()
+        activity.record(session, ActivityEntity.ITEM, item.id, "unlogged")
+        with pytest.raises(OSError):
+            session.commit()
+    with session_scope() as session:
+        assert session.exec(select(Item).where(Item.name == "Sans journal")).first() is None
+
+
+def test_recovery_waits_for_another_process(tmp_path: Path) -> None:
+    crashed = ActivityWriter(directory=tmp_path, fsync=False)
+    crashed.enqueue([_entry("queued")])
+    crashed._file.close()
+    recovered = []
+    with activity._exclusive(tmp_path / activity.RECOVERY_LOCK):
+        thread = threading.Thread(target=lambda: recovered.append(ActivityWriter(directory=tmp_path, fsync=False).recover()))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+    assert recovered == [1]
+    assert _spooled(tmp_path) == []
+
+
+def test_activity_feed_filters_and_pages(client: TestClient) -> None:
+    with session_scope() as session:
+        for entity_id in range(1, 6):
+            activity.record(session, ActivityEntity.ITEM, entity_id, "feed")
+        session.commit()
+    activity.writer.flush()
+
+    first = client.get("/activity", params={"action": "feed", "limit": 3}, headers=HEADERS).json()
+    second = client.get(
+        "/activity", params={"action": "feed", "limit": 3, "cursor": first["next_cursor"]}, headers=HEADERS
+    ).json()
+    entries = first["items"] + second["items"]
+    assert second["next_cursor"] is None
+    assert [entry["entity_id"] for entry in entries] == [5, 4, 3, 2, 1]
+    assert [(entry["at"], entry["id"]) for entry in entries] == sorted(
+        ((entry["at"], entry["id"]) for entry in entries), reverse=True
+    )
+
+    since = entries[2]["at"]
+    recent = client.get("/activity", params={"action": "feed", "from": since}, headers=HEADERS).json()["items"]
+    assert [entry["entity_id"] for entry in recent] == [5, 4, 3]
+    older = client.get("/activity", params={"action": "feed", "to": since}, headers=HEADERS).json()["items"]
+    assert [entry["entity_id"] for entry in older] == [2, 1]
+    items = client.get("/activity", params={"entity_type": "item", "limit": 1000}, headers=HEADERS).json()["items"]
+    assert {entry["entity_type"] for entry in items} == {"item"}
+
+
+def test_serial_history_includes_its_assignments(client: TestClient) -> None:
+    serial_id = client.get("/serials", params={"status": "in_stock"}, headers=HEADERS).json()["items"][0]["id"]
+    user_id = client.get("/users", headers=HEADERS).json()["items"][0]["id"]
+    assignment = client.post("/assignments", json={"serial_id": serial_id, "assignee_user_id": user_id}, headers=HEADERS).json()
+    client.post(f"/assignments/{assignment['id']}/return", headers=HEADERS)
+    activity.writer.flush()
+
+    history = client.get(f"/serials/{serial_id}/history", headers=HEADERS).json()["items"]
+    assert [entry["action"] for entry in history][:2] == ["return", "assign"]
+    assert {entry["entity_id"] for entry in history} == {serial_id}
+    returns = client.get(f"/serials/{serial_id}/history", params={"action": "return"}, headers=HEADERS).json()["items"]
+    assert [entry["action"] for entry in returns] == ["return"] * len(returns)
+    assert client.get(f"/users/{user_id}/history", headers=HEADERS).status_code in (404, 422)
+
+
+def test_item_history_starts_with_its_creation(client: TestClient) -> None:
+    item = client.post("/items", json={"name": "Historique", "category": "Dock"}, headers=HEADERS).json()
+    activity.writer.flush()
+    history = client.get(f"/items/{item['id']}/history", headers=HEADERS).json()["items"]
+    assert [entry["action"] for entry in history] == ["create"]
+    assert json.loads(history[0]["payload_json"])["name"] == "Historique"
+    assert client.get(f"/quotes/{item['id']}/history", headers=HEADERS).status_code in (404, 422)
+
+
+def test_activity_etag_changes_when_a_batch_is_written(client: TestClient) -> None:
+    etag = client.get("/activity", headers=HEADERS).headers["ETag"]
+    assert client.get("/activity", headers={**HEADERS, "If-None-Match": etag}).status_code == 304
+    with session_scope() as session:
+        activity.record(session, ActivityEntity.ITEM, 1, "etag")
+        session.commit()
+    activity.writer.flush()
+    assert client.get("/activity", headers={**HEADERS, "If-None-Match": etag}).status_code == 200
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from app import alerts, jobs
+from app.database import session_scope
+from app.models import Alert, AlertKind, JobRun, Serial, SerialStatus
+from app.stock import move_stock
+
+HEADERS = {"X-User-Role": "storekeeper"}
+
+
+def _open_alerts(client: TestClient, **params) -> list[dict]:
+    response = client.get("/alerts", params={"limit": 1000, **params}, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    return response.json()["items"]
+
+
+def test_low_stock_alerts_follow_the_stock(client: TestClient) -> None:
+    item = client.post(
+        "/items", json={"name": "Alerte stock", "category": "Dock", "low_stock_threshold": 1}, headers=HEADERS
+    ).json()
+    opened = [alert for alert in _open_alerts(client, kind="low_stock") if alert["item_id"] == item["id"]]
+    assert len(opened) == 1 and opened[0]["stock"] == 0
+
+    order_id = client.get("/orders", headers=HEADERS).json()["items"][0]["id"]
+    client.post(
+        f"/orders/{order_id}/deliveries",
+        json={"item_id": item["id"], "serial_numbers": ["ALERT-1", "ALERT-2"]},
+        headers=HEADERS,
+    )
+    assert not [alert for alert in _open_alerts(client) if alert["item_id"] == item["id"]]
+    resolved = [alert for alert in _open_alerts(client, include_resolved="true") if alert["item_id"] == item["id"]]
+    assert resolved[0]["resolved_at"] is not None
+
+    serial_id = client.get("/serials", params={"item_id": item["id"]}, headers=HEADERS).json()["items"][0]["id"]
+    user_id = client.get("/users", headers=HEADERS).json()["items"][0]["id"]
+    client.post("/assignments", json={"serial_id": serial_id, "assignee_user_id": user_id}, headers=HEADERS)
+    reopened = [alert for alert in _open_alerts(client) if alert["item_id"] == item["id"]]
+    assert len(reopened) == 1 and reopened[0]["stock"] == 1
+
+
+def test_warranty_sweep_opens_each_alert_once(client: TestClient) -> None:
+    today = date.today()
+    with session_scope() as session:
+        item_id = session.exec(select(Serial.item_id)).first()
+        expired = Serial(item_id=item_id, serial_number="EXPIRED-1", warranty_end=today - timedelta(days=3))
+        session.add(expired)
+        move_stock(session, item_id, None, SerialStatus.IN_STOCK)
+        session.commit()
+        assert alerts.sweep_warranties(session, today, today - timedelta(days=1)) == 0
+        assert alerts.sweep_warranties(session, today) >= 1
+        assert alerts.sweep_warranties(session, today) == 0
+        session.commit()
+        expired_id = expired.id
+
+    warranty = [alert for alert in _open_alerts(client, kind="warranty_expired") if alert["serial_id"] == expired_id]
+    assert warranty[0]["serial_number"] == "EXPIRED-1"
+
+    with session_scope() as session:
+        serial = session.get(Serial, expired_id)
+        move_stock(session, serial.item_id, serial.status, SerialStatus.RETIRED)
+        serial.status = SerialStatus.RETIRED
+        session.commit()
+        alerts.sweep_warranties(session, today, today)
+        session.commit()
+        assert session.exec(select(Alert.resolved_at).where(Alert.serial_id == expired_id)).one() is not None
+
+
+def test_backdated_delivery_opens_its_warranty_alerts(client: TestClient) -> None:
+    item = client.post("/items", json={"name": "Garantie échue", "category": "Dock"}, headers=HEADERS).json()
+    order_id = client.get("/orders", headers=HEADERS).json()["items"][0]["id"]
+    response = client.post(
+        f"/orders/{order_id}/deliveries",
+        json={"item_id": item["id"], "serial_numbers": ["OLD-1", "OLD-2"], "delivered_at": "2020-01-01"},
+        headers=HEADERS,
+    )
+    assert response.status_code == 200, response.text
+    client.post(
+        f"/orders/{order_id}/deliveries/import",
+        data={"item_id": str(item["id"]), "delivered_at": "2020-01-01"},
+        files={"serials": ("serials.csv", b"serial_number\nOLD-3\n", "text/csv")},
+        headers=HEADERS,
+    )
+    client.post(f"/orders/{order_id}/deliveries", json={"item_id": item["id"], "serial_numbers": ["NEW-1"]}, headers=HEADERS)
+
+    warranty = [alert for alert in _open_alerts(client, kind="warranty_expired") if alert["item_id"] == item["id"]]
+    assert sorted(alert["serial_number"] for alert in warranty) == ["OLD-1", "OLD-2", "OLD-3"]
+
+
+def test_acknowledged_alerts_leave_the_dashboard(client: TestClient) -> None:
+    client.post("/items", json={"name": "Alerte ack", "category": "Dock", "low_stock_threshold": 2}, headers=HEADERS)
+    widget = client.get("/dashboard/widgets/alerts", headers=HEADERS).json()["data"]
+    assert widget["count"] >= 1 and len(widget["alerts"]) <= 10
+    alert_id = widget["alerts"][0]["id"]
+
+    response = client.post(f"/alerts/{alert_id}/ack", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json()["acknowledged_at"] is not None
+    widget = client.get("/dashboard/widgets/alerts", headers=HEADERS).json()["data"]
+    assert alert_id not in [alert["id"] for alert in widget["alerts"]]
+    assert alert_id in [alert["id"] for alert in _open_alerts(client, acknowledged="true")]
+
+    assert client.post("/alerts/999999/ack", headers=HEADERS).status_code == 404
+    assert client.post(f"/alerts/{alert_id}/ack", headers={"X-User-Role": "viewer"}).status_code == 403
+
+
+def test_daily_jobs_run_once_per_day(client: TestClient) -> None:
+    tomorrow = date.today() + timedelta(days=1)
+    with session_scope() as session:
+        assert jobs.run_due_jobs(session, tomorrow) == ["alerts", "snapshots", "rollups"]
+        assert jobs.run_due_jobs(session, tomorrow) == []
+        assert session.get(JobRun, "alerts").last_run_on == tomorrow
+        assert session.exec(select(Alert).where(Alert.kind == AlertKind.LOW_STOCK)).first() is not None
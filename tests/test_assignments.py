@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import engine
 
 
 def test_assignment_lifecycle(client: TestClient) -> None:
-    users = client.get("/users", headers={"X-User-Role": "admin"}).json()
+    users = client.get("/users", headers={"X-User-Role": "admin"}).json()["items"]
     user_id = users[0]["id"]
-    items = client.get("/items", headers={"X-User-Role": "storekeeper"}).json()
+    items = client.get("/items", headers={"X-User-Role": "storekeeper"}).json()["items"]
     item_id = items[0]["id"]
 
     order_resp = client.post(
@@ -33,7 +36,7 @@ def test_assignment_lifecycle(client: TestClient) -> None:
     )
     assert delivery_resp.status_code == 200, delivery_resp.text
 
-    serials = client.get("/serials", params={"status": "in_stock"}, headers={"X-User-Role": "storekeeper"}).json()
+    serials = client.get("/serials", params={"status": "in_stock"}, headers={"X-User-Role": "storekeeper"}).json()["items"]
     serial_id = next(serial["id"] for serial in serials if serial["serial_number"] == "SERIAL-XYZ")
 
     assign_resp = client.post(
@@ -52,3 +55,81 @@ def test_assignment_lifecycle(client: TestClient) -> None:
     return_resp = client.post(f"/assignments/{assignment['id']}/return", headers={"X-User-Role": "storekeeper"})
     assert return_resp.status_code == 200
     assert return_resp.json()["end_date"] is not None
+
+
+def test_batch_assign_and_return(client: TestClient) -> None:
+    headers = {"X-User-Role": "storekeeper"}
+    user_ids = [user["id"] for user in client.get("/users", headers=headers).json()["items"]]
+    order_id = client.get("/orders", headers=headers).json()["items"][0]["id"]
+    item_id = client.get("/items", headers=headers).json()["items"][0]["id"]
+    numbers = [f"BATCH-{index}" for index in range(6)]
+    client.post(
+        f"/orders/{order_id}/deliveries",
+        json={"item_id": item_id, "serial_numbers": numbers},
+        headers=headers,
+    )
+    serials = client.get("/serials", params={"item_id": item_id, "limit": 1000}, headers=headers).json()["items"]
+    serial_ids = [serial["id"] for serial in serials if serial["serial_number"] in numbers]
+    stock_before = next(item["stock"] for item in client.get("/items", headers=headers).json()["items"] if item["id"] == item_id)
+
+    rows = [
+        {"serial_id": serial_id, "assignee_user_id": user_ids[index % len(user_ids)]}
+        for index, serial_id in enumerate(serial_ids)
+    ]
+    rows.append({"serial_id": serial_ids[0], "assignee_user_id": user_ids[0]})
+    rows.append({"serial_id": 999999, "assignee_user_id": user_ids[0]})
+    response = client.post("/assignments/batch", json={"assignments": rows}, headers=headers)
+    assert response.status_code == 200, response.text
+    batch = response.json()
+    assert batch["succeeded"] == len(serial_ids)
+    assert batch["failed"] == 2
+    assert [result["ok"] for result in batch["results"]] == [True] * len(serial_ids) + [False, False]
+
+    assigned = client.get("/serials", params={"status": "assigned", "limit": 1000}, headers=headers).json()["items"]
+    assert set(serial_ids) <= {serial["id"] for serial in assigned}
+    stock_after = next(item["stock"] for item in client.get("/items", headers=headers).json()["items"] if item["id"] == item_id)
+    assert stock_after == stock_before - len(serial_ids)
+
+    assignment_ids = [result["assignment_id"] for result in batch["results"] if result["ok"]]
+    response = client.post("/assignments/batch/return", json={"assignment_ids": assignment_ids + [999999]}, headers=headers)
+    assert response.status_code == 200, response.text
+    returned = response.json()
+    assert returned["succeeded"] == len(assignment_ids)
+    assert all(result["assignment"]["end_date"] for result in returned["results"] if result["ok"])
+    in_stock = client.get("/serials", params={"status": "in_stock", "limit": 1000}, headers=headers).json()["items"]
+    assert set(serial_ids) <= {serial["id"] for serial in in_stock}
+
+
+def test_batch_statement_count_does_not_grow_with_rows(client: TestClient) -> None:
+    headers = {"X-User-Role": "storekeeper"}
+    user_ids = [user["id"] for user in client.get("/users", headers=headers).json()["items"]]
+    order_id = client.get("/orders", headers=headers).json()["items"][0]["id"]
+    item_ids = [item["id"] for item in client.get("/items", headers=headers).json()["items"][:3]]
+    numbers = []
+    for item_id in item_ids:
+        batch_numbers = [f"SETBASED-{item_id}-{index}" for index in range(8)]
+        client.post(f"/orders/{order_id}/deliveries", json={"item_id": item_id, "serial_numbers": batch_numbers}, headers=headers)
+        numbers += batch_numbers
+    serials = client.get("/serials", params={"status": "in_stock", "limit": 1000}, headers=headers).json()["items"]
+    serial_ids = [serial["id"] for serial in serials if serial["serial_number"] in numbers]
+    assert len(serial_ids) == 24
+
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append(statement)
+
+    rows = [{"serial_id": serial_id, "assignee_user_id": user_ids[index % len(user_ids)]} for index, serial_id in enumerate(serial_ids)]
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        batch = client.post("/assignments/batch", json={"assignments": rows}, headers=headers).json()
+        assign_statements = len(statements)
+        statements.clear()
+        assignment_ids = [result["assignment_id"] for result in batch["results"]]
+        returned = client.post("/assignments/batch/return", json={"assignment_ids": assignment_ids}, headers=headers).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    assert batch["succeeded"] == returned["succeeded"] == 24
+    # Fixed per batch: the counters, rollups, alerts and activity token are written set-based.
+    assert assign_statements <= 13
+    assert len(statements) <= 13
@@ -0,0 +1,24 @@
+from app.main import app
+from benchmarks.run import QUERY_SLACK, compare, missing_references
+from benchmarks.scenarios import uncovered_routes
+
+
+def test_every_route_has_a_benchmark_scenario():
+    assert uncovered_routes(app) == []
+
+
+def test_compare_flags_regressions_beyond_thresholds():
+    baseline = {"GET /items": {"p50_ms": 10.0, "p95_ms": 20.0, "queries": 2, "peak_kb": 500.0}}
+    within = {"GET /items": {"p50_ms": 14.0, "p95_ms": 35.0, "queries": 2 + QUERY_SLACK, "peak_kb": 700.0}}
+    assert compare(within, baseline, 1.5, 2.0, 1.5) == []
+
+    slower = {"GET /items": {"p50_ms": 16.0, "p95_ms": 41.0, "queries": 3 + QUERY_SLACK, "peak_kb": 800.0}}
+    regressions = compare(slower, baseline, 1.5, 2.0, 1.5)
+    assert len(regressions) == 4
+
+
+def test_routes_without_a_reference_are_reported():
+    baseline = {"GET /items": {"p50_ms": 10.0, "p95_ms": 20.0, "queries": 2, "peak_kb": 500.0}}
+    results = {**baseline, "GET /new": baseline["GET /items"]}
+    assert missing_references(results, baseline) == ["GET /new"]
+    assert missing_references(baseline, baseline) == []
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine, engine, read_engine
+
+HEADERS = {"X-User-Role": "admin"}
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/items",
+        "/orders",
+        "/reports/stock-by-site",
+        "/reports/orders-by-status",
+        "/reports/assignments-by-department",
+        "/dashboard/widgets",
+        "/dashboard/widgets/alerts",
+    ],
+)
+def test_unchanged_data_answers_304_without_running_the_query(client: TestClient, path: str) -> None:
+    first = client.get(path, headers=HEADERS)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        if not statement.startswith("BEGIN"):
+            statements.append(statement)
+
+    engines = {engine, read_engine, async_engine.sync_engine}
+    for bound in engines:
+        event.listen(bound, "before_cursor_execute", _record)
+    try:
+        second = client.get(path, headers={**HEADERS, "If-None-Match": etag})
+    finally:
+        for bound in engines:
+            event.remove(bound, "before_cursor_execute", _record)
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+    assert len(statements) == 1 and "change_version" in statements[0]
+
+
+def test_etag_changes_with_the_data_and_the_query(client: TestClient) -> None:
+    etag = client.get("/items", headers=HEADERS).headers["ETag"]
+    assert client.get("/items", params={"limit": 5}, headers=HEADERS).headers["ETag"] != etag
+    assert client.get("/orders", headers=HEADERS).headers["ETag"] != etag
+
+    client.post("/items", json={"name": "Version", "category": "Dock"}, headers={"X-User-Role": "storekeeper"})
+    response = client.get("/items", headers={**HEADERS, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_conditional_get_still_requires_a_role(client: TestClient) -> None:
+    etag = client.get("/items", headers=HEADERS).headers["ETag"]
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 401
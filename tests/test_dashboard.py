@@ -1,6 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+
+import httpx
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine, connect_async_engine
+from app.main import app
+
+
+def _widgets(client: TestClient) -> dict:
+    response = client.get("/dashboard/widgets", headers={"X-User-Role": "admin"})
+    assert response.status_code == 200
+    return {widget["key"]: widget for widget in response.json()["widgets"]}
 
 
 def test_dashboard_widgets(client: TestClient) -> None:
@@ -9,3 +22,58 @@ def test_dashboard_widgets(client: TestClient) -> None:
     payload = response.json()
     keys = {widget["key"] for widget in payload["widgets"]}
     assert {"stock_by_category", "pending_deliveries", "warranties", "assignments", "stock_value", "alerts"} <= keys
+
+
+def test_dashboard_is_cached_until_next_write(client: TestClient) -> None:
+    before = _widgets(client)
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        assert _widgets(client) == before
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", _record)
+    assert len(statements) == 1
+
+    items = client.get("/items", headers={"X-User-Role": "admin"}).json()["items"]
+    supplier_id = client.get("/suppliers", headers={"X-User-Role": "admin"}).json()[0]["id"]
+    order = client.post(
+        "/orders",
+        json={"supplier_id": supplier_id, "lines": [{"item_id": items[0]["id"], "qty": 1, "unit_price": 250}]},
+        headers={"X-User-Role": "buyer"},
+    ).json()
+    client.post(
+        f"/orders/{order['id']}/deliveries",
+        json={"item_id": items[0]["id"], "serial_numbers": ["CACHE-1"], "purchase_price": 250},
+        headers={"X-User-Role": "storekeeper"},
+    )
+    after = _widgets(client)
+    assert after["stock_value"]["data"]["amount"] == before["stock_value"]["data"]["amount"] + 250
+
+
+def test_dashboard_selected_widgets(client: TestClient) -> None:
+    response = client.get("/dashboard/widgets", params={"keys": "alerts,stock_value"}, headers={"X-User-Role": "admin"})
+    assert response.status_code == 200
+    assert [widget["key"] for widget in response.json()["widgets"]] == ["alerts", "stock_value"]
+
+    single = client.get("/dashboard/widgets/warranties", headers={"X-User-Role": "admin"})
+    assert single.status_code == 200
+    assert single.json()["key"] == "warranties"
+
+    assert client.get("/dashboard/widgets", params={"keys": "nope"}, headers={"X-User-Role": "admin"}).status_code == 400
+    assert client.get("/dashboard/widgets/nope", headers={"X-User-Role": "admin"}).status_code == 404
+
+
+def test_concurrent_reads_share_one_event_loop() -> None:
+    async def _run() -> list[int]:
+        await connect_async_engine()
+        async with httpx.AsyncClient(app=app, base_url="http://test", headers={"X-User-Role": "admin"}) as async_client:
+            paths = ["/dashboard/widgets", "/items", "/serials", "/orders", "/assignments"] * 10
+            responses = await asyncio.gather(*(async_client.get(path) for path in paths))
+        await async_engine.dispose()
+        return [response.status_code for response in responses]
+
+    assert set(asyncio.run(_run())) == {200}
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import activity, database
+
+
+def test_production_profile_splits_reads_and_writes(client: TestClient) -> None:
+    assert database.read_engine is not database.engine
+    with database.engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+    with database.read_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA query_only")).scalar() == 1
+        with pytest.raises(OperationalError, match="readonly"):
+            connection.execute(text("UPDATE item SET name = name"))
+
+
+def test_concurrent_writes_and_reads_do_not_lock(client: TestClient) -> None:
+    def create(number: int) -> int:
+        return client.post(
+            "/items",
+            json={"name": f"Concurrent {number}", "category": "Dock"},
+            headers={"X-User-Role": "storekeeper"},
+        ).status_code
+
+    def read(number: int) -> int:
+        return client.get("/reports/stock-by-site", headers={"X-User-Role": "admin"}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        writes = executor.map(create, range(24))
+        reads = executor.map(read, range(24))
+        assert set(writes) == {201}
+        assert set(reads) == {200}
+
+
+def test_write_routes_take_the_write_lock_once(client: TestClient) -> None:
+    headers = {"X-User-Role": "admin"}
+    begins: list[str] = []
+
+    def _record(conn, cursor, statement, *args) -> None:
+        if statement.startswith("BEGIN") and threading.current_thread().name != activity.WRITER_THREAD:
+            begins.append(statement)
+
+    def send(method: str, url: str, **kwargs) -> dict:
+        begins.clear()
+        response = client.request(method, url, headers=headers, **kwargs)
+        assert response.status_code in (200, 201), response.text
+        # A read after the commit would begin a second write transaction.
+        assert len(begins) == 1, url
+        return response.json()
+
+    event.listen(database.engine, "before_cursor_execute", _record)
+    try:
+        item = send("POST", "/items", json={"name": "Verrou unique", "category": "Dock", "low_stock_threshold": 1})
+        order = send("POST", "/orders", json={"supplier_id": 1, "lines": [{"item_id": item["id"], "qty": 2, "unit_price": 1}]})
+        send("PATCH", f"/orders/{order['id']}/status", json={"status": "internal"})
+        send("POST", f"/orders/{order['id']}/deliveries", json={"item_id": item["id"], "serial_numbers": ["LOCK-1"]})
+        send(
+            "POST",
+            f"/orders/{order['id']}/deliveries/import",
+            data={"item_id": str(item["id"])},
+            files={"serials": ("serials.csv", b"serial_number\nLOCK-2\n", "text/csv")},
+        )
+        serial_ids = [serial["id"] for serial in client.get("/serials", params={"item_id": item["id"]}, headers=headers).json()["items"]]
+        user_id = client.get("/users", headers=headers).json()["items"][0]["id"]
+        assignment = send("POST", "/assignments", json={"serial_id": serial_ids[0], "assignee_user_id": user_id})
+        send("POST", f"/assignments/{assignment['id']}/return")
+        send("POST", f"/serials/{serial_ids[1]}/retire")
+        alert = client.get("/alerts", params={"kind": "low_stock", "limit": 1000}, headers=headers).json()["items"][0]
+        send("POST", f"/alerts/{alert['id']}/ack")
+    finally:
+        event.remove(database.engine, "before_cursor_execute", _record)
@@ -0,0 +1,34 @@
+from datetime import date
+
+from sqlmodel import Session, create_engine, func, select
+
+from app import datagen
+from app.models import Assignment, Serial, SerialStatus, StoredFile
+from app.rollups import verify_rollups
+from app.stock import verify_stock_counters
+
+SIZE = datagen.DatasetSize(users=20, suppliers=3, items=30, orders=40, serials=500, assignments=150, activity=300, attachments=2, attachment_size=1000)
+
+
+def _generate(path) -> Session:
+    engine = create_engine(f"sqlite:///{path}")
+    datagen.generate(engine, SIZE, seed=3, today=date(2025, 6, 1), batch_size=64)
+    return Session(engine)
+
+
+def test_generate_dataset(tmp_path):
+    with _generate(tmp_path / "a.db") as session:
+        assert session.exec(select(func.count()).select_from(Serial)).one() == 500
+        assert session.exec(select(func.count()).select_from(Assignment)).one() == 150
+        active = session.exec(select(func.count()).select_from(Assignment).where(Assignment.end_date.is_(None))).one()
+        assigned = session.exec(select(func.count()).select_from(Serial).where(Serial.status == SerialStatus.ASSIGNED)).one()
+        assert active == assigned == 50
+        assert [stored.size for stored in session.exec(select(StoredFile)).all()] == [1000, 1000]
+        assert verify_stock_counters(session) == []
+        assert verify_rollups(session) == []
+
+
+def test_generate_is_reproducible(tmp_path):
+    with _generate(tmp_path / "a.db") as first, _generate(tmp_path / "b.db") as second:
+        query = select(Serial.item_id, Serial.status, Serial.warranty_end).order_by(Serial.id)
+        assert first.exec(query).all() == second.exec(query).all()
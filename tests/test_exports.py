@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import csv
+import io
+import re
+import zipfile
+
+from fastapi.testclient import TestClient
+from sqlmodel import func, select
+
+from app import exports
+from app.database import session_scope
+from app.exports import csv_chunks, xlsx_chunks
+from app.models import Assignment, OrderLine, Serial, SerialStatus
+
+HEADERS = {"X-User-Role": "viewer"}
+
+
+def _csv(client: TestClient, path: str, **params) -> list[list[str]]:
+    response = client.get(path, params=params, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.content.startswith("﻿".encode())
+    return list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+
+
+def _sheet(content: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        assert archive.testzip() is None
+        assert "xl/workbook.xml" in archive.namelist()
+        return archive.read("xl/worksheets/sheet1.xml").decode()
+
+
+def test_serial_export_streams_every_matching_serial(client: TestClient) -> None:
+    rows = _csv(client, "/serials/export")
+    with session_scope() as session:
+        total = session.exec(select(func.count(Serial.id))).one()
+        in_stock = session.exec(select(func.count(Serial.id)).where(Serial.status == SerialStatus.IN_STOCK)).one()
+    assert rows[0][:2] == ["id", "numero_serie"]
+    assert len(rows) - 1 == total
+    ids = [int(row[0]) for row in rows[1:]]
+    assert ids == sorted(ids)
+
+    filtered = _csv(client, "/serials/export", status="in_stock")
+    assert len(filtered) - 1 == in_stock
+    status_column = filtered[0].index("etat")
+    assert {row[status_column] for row in filtered[1:]} == {"in_stock"}
+
+
+def test_assignment_and_order_exports_apply_the_list_filters(client: TestClient) -> None:
+    with session_scope() as session:
+        active = session.exec(select(func.count(Assignment.id)).where(Assignment.end_date.is_(None))).one()
+        lines = session.exec(select(func.count(OrderLine.id))).one()
+    assert len(_csv(client, "/assignments/export", active_only="true")) - 1 == active
+    orders = _csv(client, "/orders/export")
+    assert len(orders) - 1 == lines
+    assert orders[0][:3] == ["commande_id", "reference_interne", "etat"]
+
+
+def test_xlsx_export_is_a_workbook_with_one_row_per_record(client: TestClient) -> None:
+    response = client.get("/assignments/export", params={"format": "xlsx"}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="assignments.xlsx"'
+    sheet = _sheet(response.content)
+    with session_scope() as session:
+        total = session.exec(select(func.count(Assignment.id))).one()
+    assert sheet.count("<row>") == total + 1
+    assert '<c t="inlineStr"><is><t xml:space="preserve">numero_serie</t></is></c>' in sheet
+
+
+def test_reports_download_their_rows(client: TestClient) -> None:
+    report = client.get("/reports/orders-by-status", headers=HEADERS).json()
+    rows = _csv(client, "/reports/orders-by-status", format="csv")
+    assert rows[0] == ["cle", "valeur"]
+    assert {row[0]: float(row[1]) for row in rows[1:]} == {row["key"]: row["value"] for row in report["rows"]}
+
+    response = client.get("/reports/assignments-by-department", params={"format": "xlsx"}, headers=HEADERS)
+    assert response.headers["content-disposition"] == 'attachment; filename="assignments-by-department.xlsx"'
+    assert _sheet(response.content).count("<row>") == len(client.get("/reports/assignments-by-department", headers=HEADERS).json()["rows"]) + 1
+
+
+def test_exports_revalidate_with_their_own_etag(client: TestClient) -> None:
+    csv_etag = client.get("/serials/export", headers=HEADERS).headers["ETag"]
+    xlsx_etag = client.get("/serials/export", params={"format": "xlsx"}, headers=HEADERS).headers["ETag"]
+    assert csv_etag != xlsx_etag
+    assert client.get("/serials/export", headers={**HEADERS, "If-None-Match": csv_etag}).status_code == 304
+
+
+def test_encoders_yield_bounded_chunks(monkeypatch) -> None:
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_ROWS", 10)
+    rows = ((index, f"S<{index}>&", None) for index in range(95))
+    chunks = list(csv_chunks(["id", "nom", "vide"], rows))
+    assert len(chunks) == 10
+    assert b"".join(chunks).decode("utf-8-sig").splitlines()[1] == "0,S<0>&,"
+
+    rows = ((index, f"S<{index}>&", None) for index in range(95))
+    content = b"".join(xlsx_chunks(["id", "nom", "vide"], rows))
+    sheet = _sheet(content)
+    assert re.search(r'<row><c t="n"><v>94</v></c><c t="inlineStr"><is><t xml:space="preserve">S&lt;94&gt;&amp;</t>', sheet)
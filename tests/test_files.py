@@ -1,10 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+
+import pytest
+from fastapi import Request
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import blobstore, files
+from app.database import session_scope
+from app.files import CHUNK_SIZE, read_content
+from app.migrations import run_migrations
+from app.models import Blob, FileChunk, StoredFile
 
 
 def test_upload_and_download_file(client: TestClient) -> None:
-    orders = client.get("/orders", headers={"X-User-Role": "buyer"}).json()
+    orders = client.get("/orders", headers={"X-User-Role": "buyer"}).json()["items"]
     assert orders, "Expected at least one order from seed data"
     order_id = orders[0]["id"]
 
@@ -31,8 +43,182 @@ def test_upload_and_download_file(client: TestClient) -> None:
         "/files",
         params={"entity_type": "order", "entity_id": order_id},
         headers={"X-User-Role": "buyer"},
-    ).json()
+    ).json()["items"]
     assert any(file_row["id"] == file_info["id"] for file_row in files_list)
 
     order_details = client.get(f"/orders/{order_id}", headers={"X-User-Role": "buyer"}).json()
     assert any(file_row["id"] == file_info["id"] for file_row in order_details["files"])
+
+
+def test_legacy_file_content_is_moved_out_of_files(tmp_path, monkeypatch) -> None:
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    content = bytes(range(256)) * (CHUNK_SIZE // 256 * 2 + 3)
+    with legacy.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE files (id INTEGER PRIMARY KEY, entity_type VARCHAR NOT NULL, entity_id INTEGER NOT NULL,"
+                " filename VARCHAR NOT NULL, mime VARCHAR NOT NULL, size INTEGER NOT NULL,"
+                " created_at DATETIME NOT NULL, content BLOB)"
+            )
+        )
+        connection.execute(
+            text("INSERT INTO files VALUES (1, 'order', 1, 'scan.pdf', 'application/pdf', :size, '2024-01-01', :content)"),
+            {"size": len(content), "content": content},
+        )
+
+    SQLModel.metadata.create_all(legacy)
+    run_migrations(legacy)
+    run_migrations(legacy)
+
+    with Session(legacy) as session:
+        stored = session.exec(select(StoredFile)).one()
+        assert stored.filename == "scan.pdf"
+        assert stored.storage == files.STORAGE_DATABASE
+        assert read_content(session, stored) == content
+    with legacy.connect() as connection:
+        assert connection.execute(text("SELECT content FROM files")).scalar_one() is None
+
+    monkeypatch.setattr(blobstore, "STORAGE_DIR", tmp_path / "storage")
+    with Session(legacy) as session:
+        assert files.migrate_to_disk(session) == 1
+        assert files.migrate_to_disk(session) == 0
+        stored = session.exec(select(StoredFile)).one()
+        assert stored.storage == files.STORAGE_DISK
+        assert read_content(session, stored) == content
+        assert session.exec(select(FileChunk)).all() == []
+        assert blobstore.blob_path(stored.sha256).read_bytes() == content
+
+
+def _upload(client: TestClient, content: bytes) -> dict:
+    order_id = client.get("/orders", headers={"X-User-Role": "buyer"}).json()["items"][0]["id"]
+    response = client.post(
+        "/files",
+        data={"entity_type": "order", "entity_id": str(order_id)},
+        files={"attachment": ("scan.bin", content, "application/octet-stream")},
+        headers={"X-User-Role": "buyer"},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_download_supports_ranges_and_etags(client: TestClient) -> None:
+    content = bytes(range(256)) * (CHUNK_SIZE // 256 * 2 + 1)
+    file_info = _upload(client, content)
+    url = file_info["download_url"]
+
+    full = client.get(url, headers={"X-User-Role": "buyer"})
+    assert full.status_code == 200
+    assert full.content == content
+    etag = full.headers["etag"]
+
+    start, end = CHUNK_SIZE - 10, 2 * CHUNK_SIZE + 5
+    partial = client.get(url, headers={"X-User-Role": "buyer", "Range": f"bytes={start}-{end}"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes {start}-{end}/{len(content)}"
+    assert partial.content == content[start : end + 1]
+
+    suffix = client.get(url, headers={"X-User-Role": "buyer", "Range": "bytes=-7"})
+    assert suffix.content == content[-7:]
+
+    outside = client.get(url, headers={"X-User-Role": "buyer", "Range": f"bytes={len(content)}-"})
+    assert outside.status_code == 416
+
+    cached = client.get(url, headers={"X-User-Role": "buyer", "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+def test_range_on_empty_file_is_not_satisfiable(client: TestClient) -> None:
+    url = _upload(client, b"")["download_url"]
+    assert client.get(url, headers={"X-User-Role": "buyer"}).content == b""
+    for header in ("bytes=-5", "bytes=0-"):
+        response = client.get(url, headers={"X-User-Role": "buyer", "Range": header})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */0"
+
+
+def test_upload_size_limit(client: TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(files, "MAX_UPLOAD_SIZE", 10)
+    order_id = client.get("/orders", headers={"X-User-Role": "buyer"}).json()["items"][0]["id"]
+    response = client.post(
+        "/files",
+        data={"entity_type": "order", "entity_id": str(order_id)},
+        files={"attachment": ("big.bin", b"x" * 11, "application/octet-stream")},
+        headers={"X-User-Role": "buyer"},
+    )
+    assert response.status_code == 413
+
+
+def test_oversized_upload_is_rejected_while_streaming(client: TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(files, "MAX_UPLOAD_SIZE", 1024)
+    monkeypatch.setattr(files, "MULTIPART_OVERHEAD", 1024)
+    content_type = (b"content-type", b"multipart/form-data; boundary=limite")
+    received = []
+
+    async def receive() -> dict:
+        if not received:
+            body = b'--limite\r\nContent-Disposition: form-data; name="attachment"; filename="big.bin"\r\n\r\n'
+        else:
+            body = b"x" * 1024
+        received.append(body)
+        return {"type": "http.request", "body": body, "more_body": len(received) < 100}
+
+    request = Request({"type": "http", "method": "POST", "headers": [content_type]}, receive)
+    with pytest.raises(files.FileTooLarge):
+        asyncio.run(files.read_upload_form(request))
+    assert len(received) < 5
+
+    announced = client.post(
+        "/files",
+        content=b"",
+        headers={"X-User-Role": "buyer", "Content-Type": content_type[1].decode(), "Content-Length": str(10 * 1024 * 1024)},
+    )
+    assert announced.status_code == 413
+
+
+def test_identical_uploads_share_one_blob(client: TestClient) -> None:
+    content = b"%PDF-1.4 facture fournisseur"
+    first = _upload(client, content)
+    second = _upload(client, content)
+    with session_scope() as session:
+        sha256 = session.get(StoredFile, first["id"]).sha256
+        assert session.get(StoredFile, second["id"]).sha256 == sha256
+        assert session.get(Blob, sha256).refcount == 2
+    path = blobstore.blob_path(sha256)
+    assert path.read_bytes() == content
+
+    headers = {"X-User-Role": "buyer"}
+    assert client.delete(f"/files/{first['id']}", headers=headers).status_code == 204
+    assert path.exists()
+    assert client.get(second["download_url"], headers=headers).content == content
+
+    assert client.delete(f"/files/{second['id']}", headers=headers).status_code == 204
+    assert not path.exists()
+    with session_scope() as session:
+        assert session.get(Blob, sha256) is None
+
+
+def test_collect_keeps_a_blob_revived_by_a_concurrent_upload(client: TestClient) -> None:
+    content = b"contrat de maintenance"
+    first = _upload(client, content)
+    with session_scope() as session:
+        stored = session.get(StoredFile, first["id"])
+        sha256 = stored.sha256
+        assert blobstore.release_blob(session, sha256)
+        session.delete(stored)
+        session.commit()
+    # Same content uploaded between the delete commit and the collection.
+    second = _upload(client, content)
+    with session_scope() as session:
+        blobstore.collect_blob(session, sha256)
+        assert session.get(Blob, sha256).refcount == 1
+    assert client.get(second["download_url"], headers={"X-User-Role": "buyer"}).content == content
+
+    assert client.delete(f"/files/{second['id']}", headers={"X-User-Role": "buyer"}).status_code == 204
+    assert not blobstore.blob_path(sha256).exists()
+
+    with session_scope() as session:
+        session.add(Blob(sha256="0" * 64, size=0, refcount=0))
+        session.commit()
+        assert blobstore.collect_orphans(session) == 1
+        assert session.get(Blob, "0" * 64) is None
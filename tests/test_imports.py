@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+
+from fastapi.testclient import TestClient
+
+from app import imports
+
+
+def _order_and_items(client: TestClient) -> tuple[int, list[int]]:
+    order_id = client.get("/orders", headers={"X-User-Role": "admin"}).json()["items"][0]["id"]
+    items = client.get("/items", headers={"X-User-Role": "admin"}).json()["items"]
+    return order_id, [item["id"] for item in items[:2]]
+
+
+def _stock(client: TestClient) -> dict[int, int]:
+    items = client.get("/items", params={"limit": 1000}, headers={"X-User-Role": "admin"}).json()["items"]
+    return {item["id"]: item["stock"] for item in items}
+
+
+def test_csv_import_in_batches(client: TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(imports, "IMPORT_BATCH_SIZE", 7)
+    order_id, (first, second) = _order_and_items(client)
+    before = _stock(client)
+    lines = ["serial_number,item_id,purchase_price"]
+    lines += [f"BULK-CSV-{index},{first if index % 3 else second},99.5" for index in range(50)]
+    response = client.post(
+        f"/orders/{order_id}/deliveries/import",
+        data={"delivery_note_ref": "BL-BULK", "warranty_duration_days": "730"},
+        files={"serials": ("serials.csv", "\n".join(lines).encode(), "text/csv")},
+        headers={"X-User-Role": "storekeeper"},
+    )
+    assert response.status_code == 201, response.text
+    result = response.json()
+    assert result["created"] == 50
+    counts = {line["item_id"]: line["count"] for line in result["items"]}
+    assert counts == {first: 33, second: 17}
+
+    after = _stock(client)
+    assert after[first] == before[first] + 33
+    assert after[second] == before[second] + 17
+
+
+def test_ndjson_import_uses_defaults(client: TestClient) -> None:
+    order_id, (first, _) = _order_and_items(client)
+    body = "\n".join(json.dumps({"serial_number": f"BULK-ND-{index}"}) for index in range(5))
+    response = client.post(
+        f"/orders/{order_id}/deliveries/import",
+        data={"item_id": str(first)},
+        files={"serials": ("serials.ndjson", body.encode(), "application/x-ndjson")},
+        headers={"X-User-Role": "storekeeper"},
+    )
+    assert response.status_code == 201, response.text
+    assert response.json()["items"] == [{"item_id": first, "count": 5}]
+
+
+def test_import_rejects_invalid_rows(client: TestClient) -> None:
+    order_id, (first, _) = _order_and_items(client)
+    headers = {"X-User-Role": "storekeeper"}
+
+    def _post(body: str | bytes) -> int:
+        return client.post(
+            f"/orders/{order_id}/deliveries/import",
+            data={"item_id": str(first)},
+            files={"serials": ("serials.csv", body if isinstance(body, bytes) else body.encode(), "text/csv")},
+            headers=headers,
+        ).status_code
+
+    assert _post("serial_number\nDUP-1\nDUP-1\n") == 400
+    assert _post("serial_number,item_id\nUNKNOWN-ITEM,999999\n") == 400
+    assert _post("serial_number\nLATIN-1-\xe9\n".encode("latin-1")) == 400
+    assert _post("serial_number\nEXISTING-1\n") == 201
+    assert _post("serial_number\nEXISTING-1\n") == 409
+    serials = client.get("/serials", params={"limit": 1000}, headers=headers).json()["items"]
+    assert not any(serial["serial_number"] == "DUP-1" for serial in serials)
+
+
+def test_duplicates_across_batches_are_reported_with_their_line(client: TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(imports, "IMPORT_BATCH_SIZE", 2)
+    order_id, (first, _) = _order_and_items(client)
+    response = client.post(
+        f"/orders/{order_id}/deliveries/import",
+        data={"item_id": str(first)},
+        files={"serials": ("serials.csv", b"serial_number\nSPLIT-1\nSPLIT-2\nSPLIT-3\nSPLIT-1\n", "text/csv")},
+        headers={"X-User-Role": "storekeeper"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ligne 5 : numéro de série SPLIT-1 en double"
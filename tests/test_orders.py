@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine
 
 
 def _create_order(client: TestClient) -> int:
     suppliers = client.get("/suppliers", headers={"X-User-Role": "buyer"}).json()
     supplier_id = suppliers[0]["id"]
-    items = client.get("/items", headers={"X-User-Role": "buyer"}).json()
+    items = client.get("/items", headers={"X-User-Role": "buyer"}).json()["items"]
     item_id = items[0]["id"]
     response = client.post(
         "/orders",
@@ -37,3 +40,24 @@ def test_order_status_flow(client: TestClient) -> None:
 
     order = client.get(f"/orders/{order_id}", headers={"X-User-Role": "buyer"}).json()
     assert order["status"] == "delivered"
+
+
+def test_list_orders_query_count_is_constant(client: TestClient) -> None:
+    _create_order(client)
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        # The ETag check reads change_version once, whatever the page size.
+        if "change_version" not in statement:
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        response = client.get("/orders", headers={"X-User-Role": "buyer"})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", _record)
+    assert response.status_code == 200, response.text
+    orders = response.json()["items"]
+    assert len(orders) > 1
+    assert all(order["supplier"]["id"] and order["lines"] for order in orders)
+    assert len(statements) <= 4
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from app import responses
+from app.database import session_scope
+from app.pagination import keyset_filter
+from app.models import ActivityLog, Assignment, Item, Serial, SerialStatus
+from app.schemas import AssignmentRead, SerialRead
+from app.stock import move_stock
+
+
+def _walk(client: TestClient, path: str, limit: int) -> list[dict]:
+    rows: list[dict] = []
+    cursor = None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(path, params=params, headers={"X-User-Role": "admin"})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page["items"]) <= limit
+        rows.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+def test_serial_pages_cover_every_row_once(client: TestClient) -> None:
+    with session_scope() as session:
+        item = session.exec(select(Item)).first()
+        session.add(Serial(item_id=item.id, serial_number="NO-DELIVERY-DATE", delivery_date=None))
+        move_stock(session, item.id, None, SerialStatus.IN_STOCK)
+        session.commit()
+
+    everything = client.get("/serials", params={"limit": 1000}, headers={"X-User-Role": "admin"}).json()
+    assert everything["next_cursor"] is None
+
+    paged = _walk(client, "/serials", limit=7)
+    assert [row["id"] for row in paged] == [row["id"] for row in everything["items"]]
+    assert paged[-1]["delivery_date"] is None
+
+
+def test_every_list_endpoint_paginates(client: TestClient) -> None:
+    for path in ("/items", "/orders", "/assignments", "/files", "/users", "/activity"):
+        full = client.get(path, params={"limit": 1000}, headers={"X-User-Role": "admin"}).json()["items"]
+        assert [row["id"] for row in _walk(client, path, limit=2)] == [row["id"] for row in full]
+
+
+def test_keyset_filter_skips_nulls_of_non_nullable_columns() -> None:
+    values = [date(2024, 1, 1), 5]
+    assert "IS NULL" in str(keyset_filter(Serial.delivery_date, Serial.id, True, values))
+    assert "IS NULL" not in str(keyset_filter(ActivityLog.at, ActivityLog.id, True, [datetime(2024, 1, 1), 5]))
+
+
+def test_invalid_cursor_is_rejected(client: TestClient) -> None:
+    response = client.get("/serials", params={"cursor": "not-a-cursor"}, headers={"X-User-Role": "admin"})
+    assert response.status_code == 400
+
+
+def test_fast_lists_match_the_read_schemas(client: TestClient) -> None:
+    for path, model, schema in (("/serials", Serial, SerialRead), ("/assignments", Assignment, AssignmentRead)):
+        rows = client.get(path, params={"limit": 1000}, headers={"X-User-Role": "admin"}).json()["items"]
+        assert rows
+        with session_scope() as session:
+            expected = [jsonable_encoder(schema.from_orm(session.get(model, row["id"]))) for row in rows]
+        assert rows == expected
+
+
+def test_fast_json_fallback_matches_orjson() -> None:
+    with session_scope() as session:
+        rows = session.exec(select(*responses.schema_columns(SerialRead, Serial)).limit(20)).all()
+    payload = {"items": [row._asdict() for row in rows], "next_cursor": None}
+    fallback = json.dumps(payload, default=responses._default, ensure_ascii=False, separators=(",", ":")).encode()
+    assert json.loads(responses.dumps(payload)) == json.loads(fallback)
@@ -0,0 +1,231 @@
+"""Query-plan regression suite.
+
+Drives the read endpoints against a dataset large enough for the SQLite
+planner to prefer indexes, records every statement they execute and fails
+if ``EXPLAIN QUERY PLAN`` reports a full scan of a hot table.
+"""
+
+from __future__ import annotations
+
+import random
+import re
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert, text
+from sqlmodel import Session
+
+from app import database, main
+from app.models import (
+    ActivityEntity,
+    ActivityLog,
+    Assignment,
+    Item,
+    Order,
+    OrderLine,
+    OrderStatus,
+    Role,
+    Serial,
+    SerialStatus,
+    StoredFile,
+    Supplier,
+    User,
+)
+from app.search import rebuild_search_index
+from app.snapshots import take_snapshot
+from app.rollups import rebuild_rollups
+from app.stock import rebuild_stock_counters
+from app.warranties import rebuild_warranty_calendar
+
+HOT_TABLES = {"serial", "assignment", "orderline", "activitylog", "files", "item", "order", "alert", "warranty_bucket", "stock_snapshot"}
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+ITEMS = 500
+SERIALS = 20_000
+ORDERS = 2_000
+ASSIGNMENTS = 5_000
+ACTIVITY = 20_000
+SNAPSHOT_DAYS = 60
+
+
+def _load(session: Session) -> None:
+    rng = random.Random(12)
+    today = date.today()
+    session.execute(insert(User), [{"display_name": f"User {i}", "email": f"u{i}@example.com", "department": f"D{i % 12}", "role": Role.VIEWER} for i in range(200)])
+    session.execute(insert(Supplier), [{"name": f"Supplier {i}"} for i in range(20)])
+    session.execute(
+        insert(Item),
+        [
+            {"name": f"Item {i:05d}", "category": f"Cat {i % 8}", "internal_ref": f"REF-{i:05d}", "site": f"Site {i % 5}", "low_stock_threshold": 2}
+            for i in range(ITEMS)
+        ],
+    )
+    session.execute(
+        insert(Order),
+        [
+            {"supplier_id": 1 + i % 20, "internal_ref": f"CMD-{i:05d}", "status": rng.choice(list(OrderStatus)), "ordered_at": datetime(2024, 1, 1) + timedelta(hours=i)}
+            for i in range(ORDERS)
+        ],
+    )
+    session.execute(
+        insert(OrderLine),
+        [{"order_id": 1 + i // 3, "item_id": 1 + i % ITEMS, "qty": 2, "unit_price": 100.0} for i in range(ORDERS * 3)],
+    )
+    session.execute(
+        insert(Serial),
+        [
+            {
+                "item_id": 1 + i % ITEMS,
+                "serial_number": f"SN-{i:07d}",
+                "delivery_date": today - timedelta(days=i % 900),
+                "warranty_start": today - timedelta(days=i % 900),
+                "warranty_end": today + timedelta(days=365 - i % 900),
+                "purchase_price": 100.0,
+                "status": SerialStatus.ASSIGNED if i < ASSIGNMENTS else SerialStatus.IN_STOCK,
+                "current_assignee_user_id": 1 + i % 200 if i < ASSIGNMENTS else None,
+            }
+            for i in range(SERIALS)
+        ],
+    )
+    session.execute(
+        insert(Assignment),
+        [
+            {"serial_id": 1 + i, "assignee_user_id": 1 + i % 200, "start_date": today - timedelta(days=i % 400), "end_date": None if i % 4 else today}
+            for i in range(ASSIGNMENTS)
+        ],
+    )
+    session.execute(
+        insert(ActivityLog),
+        [
+            {"entity_type": ActivityEntity.SERIAL, "entity_id": 1 + i % SERIALS, "action": "seed", "actor_user_id": 1, "at": datetime(2024, 1, 1) + timedelta(minutes=i)}
+            for i in range(ACTIVITY)
+        ],
+    )
+    session.execute(
+        insert(StoredFile),
+        [
+            {"entity_type": "order", "entity_id": 1 + i % ORDERS, "filename": f"f{i}.pdf", "mime": "application/pdf", "size": 0, "created_at": datetime(2024, 1, 1) + timedelta(minutes=i)}
+            for i in range(3_000)
+        ],
+    )
+    rebuild_stock_counters(session)
+    rebuild_rollups(session)
+    rebuild_search_index(session)
+    rebuild_warranty_calendar(session)
+    for days in range(1, SNAPSHOT_DAYS + 1):
+        take_snapshot(session, today - timedelta(days=days))
+    session.commit()
+    session.execute(text("ANALYZE"))
+
+
+@pytest.fixture(scope="module")
+def large_client(tmp_path_factory: pytest.TempPathFactory) -> Iterator[tuple[TestClient, list[tuple[str, tuple]]]]:
+    path = tmp_path_factory.mktemp("plans") / "large.db"
+    large_engine, large_read_engine = database.create_engines(f"sqlite:///{path}")
+    large_async_engine = database.create_async_read_engine(f"sqlite+aiosqlite:///{path}")
+    patch = pytest.MonkeyPatch()
+    patch.setattr(database, "engine", large_engine)
+    patch.setattr(database, "read_engine", large_read_engine)
+    patch.setattr(database, "async_engine", large_async_engine)
+    database.init_db()
+    with Session(large_engine) as session:
+        _load(session)
+    main.dashboard_cache.clear()
+
+    statements: list[tuple[str, tuple]] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    for engine in (large_engine, large_read_engine, large_async_engine.sync_engine):
+        event.listen(engine, "before_cursor_execute", _record)
+    with TestClient(main.app) as client:
+        yield client, statements
+    for engine in (large_engine, large_read_engine, large_async_engine.sync_engine):
+        event.remove(engine, "before_cursor_execute", _record)
+    main.dashboard_cache.clear()
+    patch.undo()
+    large_engine.dispose()
+    large_read_engine.dispose()
+
+
+def _full_scans(statements: list[tuple[str, tuple]]) -> list[str]:
+    failures = []
+    with database.engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            for row in plan:
+                match = FULL_SCAN.match(row[-1])
+                if match and match.group(1) in HOT_TABLES:
+                    failures.append(f"{row[-1]}: {statement}")
+    return failures
+
+
+TODAY = date.today()
+
+READ_REQUESTS = [
+    ("/items", {}),
+    ("/items", {"category": "Cat 3"}),
+    ("/items", {"search": "item 0001"}),
+    ("/serials", {}),
+    ("/serials", {"status": "in_stock"}),
+    ("/serials", {"item_id": 7}),
+    ("/serials", {"assigned": "true"}),
+    ("/serials/export", {"status": "in_stock"}),
+    ("/serials/export", {"item_id": 7}),
+    ("/orders", {}),
+    ("/orders", {"status": "ordered"}),
+    ("/orders", {"supplier_id": 3}),
+    ("/orders", {"search": "cmd-0012"}),
+    ("/orders/export", {"supplier_id": 3}),
+    ("/orders/42", {}),
+    ("/assignments", {}),
+    ("/assignments", {"user_id": 5}),
+    ("/assignments", {"active_only": "true"}),
+    ("/assignments/export", {"user_id": 5}),
+    ("/files", {"entity_type": "order", "entity_id": 12}),
+    ("/files/7/download", {}),
+    ("/users", {}),
+    ("/suppliers", {}),
+    ("/search", {"q": "item 00"}),
+    ("/dashboard/widgets", {}),
+    ("/dashboard/widgets/alerts", {}),
+    ("/alerts", {}),
+    ("/alerts", {"kind": "warranty_expired"}),
+    ("/alerts", {"include_resolved": "true"}),
+    ("/dashboard/widgets/warranties", {}),
+    ("/warranties/calendar", {"from": TODAY.isoformat(), "to": (TODAY + timedelta(days=90)).isoformat()}),
+    ("/warranties/calendar", {"from": TODAY.isoformat(), "to": (TODAY + timedelta(days=365)).isoformat(), "granularity": "month", "group_by": "site"}),
+    ("/warranties/calendar", {"from": TODAY.isoformat(), "to": (TODAY + timedelta(days=90)).isoformat(), "group_by": "item", "item_id": 7}),
+    ("/activity", {}),
+    ("/activity", {"action": "seed"}),
+    ("/activity", {"entity_type": "serial"}),
+    ("/activity", {"from": "2024-01-02T00:00:00", "to": "2024-01-05T00:00:00"}),
+    ("/serials/42/history", {}),
+    ("/serials/42/history", {"from": "2024-01-01T00:00:00", "action": "seed"}),
+    ("/orders/7/history", {}),
+    ("/reports/stock-by-site", {}),
+    ("/reports/stock-by-site", {"as_of": (TODAY - timedelta(days=30)).isoformat()}),
+    ("/reports/stock-history", {"from": (TODAY - timedelta(days=90)).isoformat(), "to": TODAY.isoformat()}),
+    ("/reports/stock-history", {"from": (TODAY - timedelta(days=90)).isoformat(), "to": TODAY.isoformat(), "group_by": "site"}),
+    ("/reports/stock-history", {"from": (TODAY - timedelta(days=90)).isoformat(), "to": TODAY.isoformat(), "item_id": 7}),
+    ("/reports/orders-by-status", {}),
+    ("/reports/assignments-by-department", {}),
+]
+
+
+@pytest.mark.parametrize(("path", "params"), READ_REQUESTS)
+def test_read_endpoints_use_indexes(large_client, path: str, params: dict) -> None:
+    client, statements = large_client
+    statements.clear()
+    response = client.get(path, params=params, headers={"X-User-Role": "admin"})
+    assert response.status_code == 200, response.text
+    body = response.json() if response.headers["content-type"] == "application/json" else None
+    next_cursor = body.get("next_cursor") if isinstance(body, dict) else None
+    if next_cursor:
+        assert client.get(path, params={**params, "cursor": next_cursor}, headers={"X-User-Role": "admin"}).status_code == 200
+    assert statements
+    assert _full_scans(statements) == []
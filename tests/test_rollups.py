@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from datetime import date
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import select
+
+from app import rollups, versions
+from app.database import session_scope
+from app.models import DepartmentRollup, OrderRollup, SerialStatus, User
+from app.versions import current_versions
+
+HEADERS = {"X-User-Role": "admin"}
+
+
+def _report(client: TestClient, path: str) -> dict:
+    response = client.get(path, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    return {row["key"]: row["value"] for row in response.json()["rows"]}
+
+
+def test_reports_follow_the_writes(client: TestClient) -> None:
+    item = client.post("/items", json={"name": "Agrégat", "category": "Dock", "site": "Rollup-ville"}, headers=HEADERS).json()
+    orders = _report(client, "/reports/orders-by-status")
+    order = client.post(
+        "/orders", json={"supplier_id": 1, "lines": [{"item_id": item["id"], "qty": 2, "unit_price": 10}]}, headers=HEADERS
+    ).json()
+    assert _report(client, "/reports/orders-by-status")["demanded"] == orders.get("demanded", 0) + 1
+    client.patch(f"/orders/{order['id']}/status", json={"status": "internal"}, headers=HEADERS)
+    after = _report(client, "/reports/orders-by-status")
+    assert after["demanded"] == orders.get("demanded", 0)
+    assert after["internal"] == orders.get("internal", 0) + 1
+
+    client.post(
+        f"/orders/{order['id']}/deliveries", json={"item_id": item["id"], "serial_numbers": ["RLP-1", "RLP-2"]}, headers=HEADERS
+    )
+    assert _report(client, "/reports/stock-by-site")["Rollup-ville"] == 2
+
+    serial_ids = [serial["id"] for serial in client.get("/serials", params={"item_id": item["id"]}, headers=HEADERS).json()["items"]]
+    with session_scope() as session:
+        user = session.exec(select(User)).first()
+    department = user.department or "Non défini"
+    departments = _report(client, "/reports/assignments-by-department")
+    batch = client.post(
+        "/assignments/batch",
+        json={"assignments": [{"serial_id": serial_id, "assignee_user_id": user.id} for serial_id in serial_ids]},
+        headers=HEADERS,
+    ).json()
+    assert _report(client, "/reports/assignments-by-department")[department] == departments.get(department, 0) + 2
+    assert "Rollup-ville" not in _report(client, "/reports/stock-by-site")
+
+    client.post(f"/assignments/{batch['results'][0]['assignment_id']}/return", headers=HEADERS)
+    client.post("/assignments/batch/return", json={"assignment_ids": [batch["results"][1]["assignment_id"]]}, headers=HEADERS)
+    assert _report(client, "/reports/assignments-by-department").get(department, 0) == departments.get(department, 0)
+    assert _report(client, "/reports/stock-by-site")["Rollup-ville"] == 2
+
+    with session_scope() as session:
+        assert rollups.verify_rollups(session) == []
+
+
+def test_reconcile_rebuilds_a_drifted_rollup(client: TestClient) -> None:
+    with session_scope() as session:
+        session.execute(update(OrderRollup).values(count=OrderRollup.count + 5))
+        session.execute(update(DepartmentRollup).values(count=0))
+        session.commit()
+        drifted = {drift.table for drift in rollups.verify_rollups(session)}
+        before = current_versions(session, [versions.ORDERS, versions.SERIALS])
+
+        rollups.reconcile(session, date.today(), None)
+        session.commit()
+
+        assert drifted == {"order_rollup", "department_rollup"}
+        assert rollups.verify_rollups(session) == []
+        after = current_versions(session, [versions.ORDERS, versions.SERIALS])
+    assert after[versions.ORDERS] > before[versions.ORDERS]
+    assert after[versions.SERIALS] == before[versions.SERIALS]
+
+
+def test_verify_command_reports_drift(client: TestClient, capsys) -> None:
+    with session_scope() as session:
+        session.execute(update(OrderRollup).values(count=OrderRollup.count + 1))
+        session.commit()
+    assert rollups.main(["verify"]) == 1
+    assert "order_rollup" in capsys.readouterr().out
+    assert rollups.main(["rebuild"]) == 0
+    assert rollups.main(["verify"]) == 0
+
+
+def test_delivery_of_an_unknown_item_is_rejected(client: TestClient) -> None:
+    response = client.post("/orders/1/deliveries", json={"item_id": 99999, "serial_numbers": ["GHOST-1"]}, headers=HEADERS)
+    assert response.status_code == 404
+    assert client.get("/serials", params={"item_id": 99999}, headers=HEADERS).json()["items"] == []
+    with session_scope() as session:
+        rollups.record_stock(session, {(99999, SerialStatus.IN_STOCK): 1})
+        session.commit()
+        assert rollups.verify_rollups(session) == []
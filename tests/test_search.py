@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import search
+from app.models import Item, Order, Supplier
+
+
+def test_items_and_orders_search(client: TestClient) -> None:
+    headers = {"X-User-Role": "admin"}
+    created = client.post(
+        "/items",
+        json={"name": "Écran Ultralarge", "category": "Écran", "internal_ref": "SRCH-042"},
+        headers={"X-User-Role": "storekeeper"},
+    ).json()
+
+    for term in ("ultra", "ecran ultra", "srch-04", "SRCH"):
+        items = client.get("/items", params={"search": term}, headers=headers).json()["items"]
+        assert [item["id"] for item in items] == [created["id"]], term
+    assert client.get("/items", params={"search": "larg"}, headers=headers).json()["items"] == []
+
+    supplier = client.get("/suppliers", headers=headers).json()[0]
+    order = client.post(
+        "/orders",
+        json={"supplier_id": supplier["id"], "internal_ref": "SRCH-ORDER-7", "lines": [{"item_id": created["id"], "qty": 1, "unit_price": 1}]},
+        headers={"X-User-Role": "buyer"},
+    ).json()
+    orders = client.get("/orders", params={"search": "srch order"}, headers=headers).json()["items"]
+    assert [row["id"] for row in orders] == [order["id"]]
+    by_supplier = client.get("/orders", params={"search": supplier["name"][:3]}, headers=headers).json()["items"]
+    assert order["id"] in {row["id"] for row in by_supplier}
+
+    hits = client.get("/search", params={"q": "srch"}, headers=headers).json()["hits"]
+    assert {(hit["entity_type"], hit["entity_id"]) for hit in hits} == {("item", created["id"]), ("order", order["id"])}
+
+
+def test_trigram_fallback(tmp_path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'trigram.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        supplier = Supplier(name="Contoso")
+        session.add(supplier)
+        session.add_all(
+            [
+                Item(name="Dock USB-C", category="Dock", internal_ref="ITM-001"),
+                Item(name="Écran 27 pouces", category="Écran", internal_ref="ITM-002"),
+            ]
+        )
+        session.flush()
+        session.add(Order(supplier_id=supplier.id, internal_ref="CMD-001"))
+        session.flush()
+        search.rebuild_search_index(session)
+
+        def _ids(entity_type: str, term: str) -> list[int]:
+            return [row.entity_id for row in session.execute(search.search_query(session, entity_type, term))]
+
+        items = {item.name: item.id for item in session.exec(select(Item)).all()}
+        assert _ids(search.ITEM, "ecr") == [items["Écran 27 pouces"]]
+        assert _ids(search.ITEM, "itm-00") == sorted(items.values())
+        assert _ids(search.ITEM, "dock usb") == [items["Dock USB-C"]]
+        assert _ids(search.ITEM, "ock") == []
+        assert len(_ids(search.ORDER, "conto")) == 1
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from app import snapshots
+from app.database import session_scope
+from app.models import SerialStatus, StockSnapshot
+
+HEADERS = {"X-User-Role": "viewer"}
+PAST = date(2001, 3, 31)
+
+
+def _report(client: TestClient, **params) -> dict:
+    response = client.get("/reports/stock-by-site", params=params, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_as_of_reads_the_latest_snapshot_on_or_before_the_day(client: TestClient) -> None:
+    assert client.get("/reports/stock-by-site", params={"as_of": "2001-03-30"}, headers=HEADERS).status_code == 404
+    with session_scope() as session:
+        snapshots.take_snapshot(session, PAST)
+        session.commit()
+
+    current = _report(client)
+    report = _report(client, as_of=PAST.isoformat())
+    assert report["as_of"] == PAST.isoformat()
+    assert report["rows"] == current["rows"]
+    assert _report(client, as_of="2001-04-15")["as_of"] == PAST.isoformat()
+    assert current["as_of"] is None
+
+
+def test_snapshots_are_replaced_not_duplicated(client: TestClient) -> None:
+    day = PAST - timedelta(days=1)
+    with session_scope() as session:
+        first = snapshots.take_snapshot(session, day)
+        second = snapshots.take_snapshot(session, day)
+        session.commit()
+        assert first == second > 0
+        stored = session.exec(select(StockSnapshot).where(StockSnapshot.day == day)).all()
+    assert len(stored) == first
+    assert {row.status for row in stored} >= {SerialStatus.IN_STOCK}
+
+
+def test_stock_history_returns_one_point_per_snapshot_day(client: TestClient) -> None:
+    start = date(2001, 5, 1)
+    with session_scope() as session:
+        for offset in (0, 1, 3):
+            snapshots.take_snapshot(session, start + timedelta(days=offset))
+        session.commit()
+
+    response = client.get(
+        "/reports/stock-history", params={"from": start.isoformat(), "to": "2001-05-31"}, headers=HEADERS
+    )
+    assert response.status_code == 200, response.text
+    points = response.json()["points"]
+    assert [point["day"] for point in points] == ["2001-05-01", "2001-05-02", "2001-05-04"]
+    assert points[0]["count"] == sum(row["value"] for row in _report(client)["rows"])
+
+    by_site = client.get(
+        "/reports/stock-history",
+        params={"from": start.isoformat(), "to": start.isoformat(), "group_by": "site"},
+        headers=HEADERS,
+    ).json()["points"]
+    assert sum(point["count"] for point in by_site) == points[0]["count"]
+    assert all(point["day"] == start.isoformat() for point in by_site)
+
+
+def test_stock_history_bounds_the_window(client: TestClient) -> None:
+    params = {"from": "2001-01-01", "to": "2003-01-01"}
+    assert client.get("/reports/stock-history", params=params, headers=HEADERS).status_code == 400
+    params = {"from": "2001-02-01", "to": "2001-01-01"}
+    assert client.get("/reports/stock-history", params=params, headers=HEADERS).status_code == 400
+
+
+def test_daily_job_snapshots_yesterday(client: TestClient) -> None:
+    today = date(2001, 7, 2)
+    with session_scope() as session:
+        snapshots.daily_snapshot(session, today, None)
+        session.commit()
+        assert snapshots.snapshot_day(session, today) == today - timedelta(days=1)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app.database import session_scope
+from app.stock import verify_stock_counters
+
+
+def _stock(client: TestClient, item_id: int) -> int:
+    items = client.get("/items", params={"limit": 1000}, headers={"X-User-Role": "admin"}).json()["items"]
+    return next(item["stock"] for item in items if item["id"] == item_id)
+
+
+def test_stock_counters_follow_writes(client: TestClient) -> None:
+    item = client.post(
+        "/items",
+        json={"name": "Compteur", "category": "Dock"},
+        headers={"X-User-Role": "storekeeper"},
+    ).json()
+    assert item["stock"] == 0
+    supplier_id = client.get("/suppliers", headers={"X-User-Role": "buyer"}).json()[0]["id"]
+    order = client.post(
+        "/orders",
+        json={"supplier_id": supplier_id, "lines": [{"item_id": item["id"], "qty": 2, "unit_price": 10}]},
+        headers={"X-User-Role": "buyer"},
+    ).json()
+    client.post(
+        f"/orders/{order['id']}/deliveries",
+        json={"item_id": item["id"], "serial_numbers": ["CNT-1", "CNT-2"]},
+        headers={"X-User-Role": "storekeeper"},
+    )
+    assert _stock(client, item["id"]) == 2
+
+    serials = client.get("/serials", params={"item_id": item["id"]}, headers={"X-User-Role": "admin"}).json()["items"]
+    user_id = client.get("/users", headers={"X-User-Role": "admin"}).json()["items"][0]["id"]
+    assignment = client.post(
+        "/assignments",
+        json={"serial_id": serials[0]["id"], "assignee_user_id": user_id},
+        headers={"X-User-Role": "storekeeper"},
+    ).json()
+    assert _stock(client, item["id"]) == 1
+
+    client.post(f"/assignments/{assignment['id']}/return", headers={"X-User-Role": "storekeeper"})
+    assert _stock(client, item["id"]) == 2
+
+    with session_scope() as session:
+        assert verify_stock_counters(session) == []
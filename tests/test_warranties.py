@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import select
+
+from app import alerts, warranties
+from app.database import session_scope
+from app.models import Alert, Item, Serial, SerialStatus, WarrantyGranularity
+
+HEADERS = {"X-User-Role": "storekeeper"}
+
+
+def _calendar(client: TestClient, start: date, end: date, **params) -> dict:
+    response = client.get(
+        "/warranties/calendar", params={"from": start.isoformat(), "to": end.isoformat(), **params}, headers=HEADERS
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _delivered_item(client: TestClient, name: str, count: int, delivered_at: date, days: int) -> tuple[int, date]:
+    item = client.post("/items", json={"name": name, "category": "Dock", "site": "Garantie"}, headers=HEADERS).json()
+    order_id = client.get("/orders", headers=HEADERS).json()["items"][0]["id"]
+    response = client.post(
+        f"/orders/{order_id}/deliveries",
+        json={
+            "item_id": item["id"],
+            "serial_numbers": [f"{name}-{index}" for index in range(count)],
+            "delivered_at": delivered_at.isoformat(),
+            "warranty_duration_days": days,
+        },
+        headers=HEADERS,
+    )
+    assert response.status_code == 200, response.text
+    return item["id"], delivered_at + timedelta(days=days)
+
+
+def test_deliveries_and_retirements_maintain_the_calendar(client: TestClient) -> None:
+    item_id, warranty_end = _delivered_item(client, "CAL", 3, date.today(), 40)
+    start, end = warranty_end - timedelta(days=7), warranty_end + timedelta(days=7)
+
+    calendar = _calendar(client, start, end, group_by="item", item_id=item_id)
+    assert calendar["total"] == 3
+    assert calendar["buckets"] == [
+        {
+            "period_start": warranties.period_start(warranty_end, WarrantyGranularity.WEEK).isoformat(),
+            "key": str(item_id),
+            "label": "CAL",
+            "count": 3,
+        }
+    ]
+    assert [sample["warranty_end"] for sample in calendar["samples"]] == [warranty_end.isoformat()] * 3
+    by_month = _calendar(client, start, end, granularity="month", group_by="site", samples=1)
+    assert {"key": "Garantie", "count": 3} in [{"key": row["key"], "count": row["count"]} for row in by_month["buckets"]]
+    assert len(by_month["samples"]) == 1
+
+    serial_id = calendar["samples"][0]["serial_id"]
+    response = client.post(f"/serials/{serial_id}/retire", headers=HEADERS)
+    assert response.status_code == 200 and response.json()["status"] == "retired"
+    assert client.post(f"/serials/{serial_id}/retire", headers=HEADERS).status_code == 409
+    assert _calendar(client, start, end, item_id=item_id)["total"] == 2
+    assert serial_id not in [sample["serial_id"] for sample in _calendar(client, start, end, item_id=item_id)["samples"]]
+
+    with session_scope() as session:
+        assert warranties.verify_warranty_calendar(session) == []
+
+
+def test_retire_checks_the_serial(client: TestClient) -> None:
+    assert client.post("/serials/999999/retire", headers=HEADERS).status_code == 404
+    serial_id = client.get("/serials", params={"status": "in_stock"}, headers=HEADERS).json()["items"][0]["id"]
+    assert client.post(f"/serials/{serial_id}/retire", headers={"X-User-Role": "viewer"}).status_code == 403
+    user_id = client.get("/users", headers=HEADERS).json()["items"][0]["id"]
+    client.post("/assignments", json={"serial_id": serial_id, "assignee_user_id": user_id}, headers=HEADERS)
+    assert client.post(f"/serials/{serial_id}/retire", headers=HEADERS).status_code == 409
+
+
+def test_retiring_resolves_the_warranty_alert(client: TestClient) -> None:
+    today = date.today()
+    item_id, _ = _delivered_item(client, "CAL-EXPIRED", 1, today - timedelta(days=20), 10)
+    with session_scope() as session:
+        alerts.sweep_warranties(session, today)
+        session.commit()
+        serial_id = session.exec(select(Serial.id).where(Serial.item_id == item_id)).one()
+
+    assert client.post(f"/serials/{serial_id}/retire", headers=HEADERS).status_code == 200
+    with session_scope() as session:
+        assert session.exec(select(Alert.resolved_at).where(Alert.serial_id == serial_id)).one() is not None
+
+
+def test_calendar_counts_only_the_window(client: TestClient) -> None:
+    item_id = client.post("/items", json={"name": "Bords", "category": "Dock"}, headers=HEADERS).json()["id"]
+    monday = warranties.period_start(date.today() + timedelta(days=60), WarrantyGranularity.WEEK)
+    ends = [monday + timedelta(days=offset) for offset in (0, 2, 4, 7, 9, 11)]
+    with session_scope() as session:
+        session.execute(
+            insert(Serial),
+            [
+                {"item_id": item_id, "serial_number": f"EDGE-{index}", "warranty_end": end, "status": SerialStatus.IN_STOCK}
+                for index, end in enumerate(ends)
+            ],
+        )
+        warranties.record_warranties(session, {(item_id, end): 1 for end in ends})
+        session.commit()
+
+    # Cut in the first week and in the second one: only the 2nd to 5th warranties are in the window.
+    start, end = monday + timedelta(days=1), monday + timedelta(days=10)
+    calendar = _calendar(client, start, end, item_id=item_id, group_by="item")
+    assert calendar["total"] == 4
+    assert [(row["period_start"], row["count"]) for row in calendar["buckets"]] == [
+        (monday.isoformat(), 2),
+        ((monday + timedelta(days=7)).isoformat(), 2),
+    ]
+    assert _calendar(client, monday, monday + timedelta(days=14), item_id=item_id)["total"] == 6
+    assert _calendar(client, start, monday + timedelta(days=3), item_id=item_id)["total"] == 1
+    month = _calendar(client, start, end, item_id=item_id, granularity="month")
+    assert month["total"] == 4
+    assert sum(row["count"] for row in month["buckets"]) == 4
+
+
+def test_warranty_widget_is_bounded(client: TestClient) -> None:
+    today = date.today()
+    with session_scope() as session:
+        item_id = session.exec(select(Item.id)).first()
+        rows = [
+            {"item_id": item_id, "serial_number": f"WIDGET-{index}", "warranty_end": today + timedelta(days=index % 200 - 100)}
+            for index in range(400)
+        ]
+        session.execute(insert(Serial), [{**row, "status": SerialStatus.IN_STOCK} for row in rows])
+        warranties.rebuild_warranty_calendar(session)
+        session.commit()
+
+    data = client.get("/dashboard/widgets/warranties", headers=HEADERS).json()["data"]
+    assert len(data["serials"]) == 10
+    assert all(date.fromisoformat(serial["warranty_end"]) >= today for serial in data["serials"])
+    assert len(data["weeks"]) <= 15
+    assert data["count"] == sum(week["count"] for week in data["weeks"])
+    assert data["count"] >= 180
+
+
+def test_calendar_rejects_an_empty_window(client: TestClient) -> None:
+    today = date.today()
+    response = client.get(
+        "/warranties/calendar", params={"from": today.isoformat(), "to": today.isoformat()}, headers=HEADERS
+    )
+    assert response.status_code == 400
+    response = client.get(
+        "/warranties/calendar",
+        params={"from": today.isoformat(), "to": (today + timedelta(days=1)).isoformat(), "samples": 1000},
+        headers=HEADERS,
+    )
+    assert response.status_code == 422
+
+
+def test_rebuild_fixes_drift(client: TestClient) -> None:
+    with session_scope() as session:
+        warranties.record_warranties(session, {(1, date.today() + timedelta(days=3)): 5})
+        session.commit()
+        assert warranties.verify_warranty_calendar(session)
+        warranties.rebuild_warranty_calendar(session)
+        session.commit()
+        assert warranties.verify_warranty_calendar(session) == []